@@ -0,0 +1,105 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List
+
+
+class MicroBatcher:
+    """
+    动态批处理：把短时间窗口内到达的请求合并为一次批量推理。
+    第一个请求到达后最多等待 max_wait_ms，或凑满 max_batch_size 个就立即执行；
+    推理在独立的工作线程中运行，期间新到达的请求继续排队，负载越高批次越大。
+    """
+
+    def __init__(self, infer_batch: Callable[[list], List], max_batch_size: int = 8,
+                 max_wait_ms: float = 10.0):
+        self.infer_batch = infer_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        # 单线程执行器：同一时间只有一个前向传播
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+        self._queue = None
+        self._task = None
+
+    def start(self):
+        """在当前事件循环中启动后台批处理任务"""
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._executor.shutdown(wait=True)
+
+    async def submit(self, item):
+        """提交一个输入并等待其对应的推理结果"""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _collect_batch(self) -> list:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            # 先取走已经在排队的请求，不必等待
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect_batch()
+            # 调用方可能已经取消（如客户端断开），跳过这些请求
+            batch = [(item, future) for item, future in batch if not future.done()]
+            if not batch:
+                continue
+
+            try:
+                results = await loop.run_in_executor(
+                    self._executor, self.infer_batch, [item for item, _ in batch]
+                )
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+
+class AdmissionGate:
+    """
+    背压控制：限制同时处理（含排队）的请求数，超过上限时调用方应立即返回 503，
+    避免请求无限堆积导致尾延迟失控。只在事件循环线程中使用，无需加锁。
+    """
+
+    def __init__(self, max_pending: int):
+        self.max_pending = max(1, max_pending)
+        self.pending = 0
+        self.rejected = 0
+
+    def try_acquire(self) -> bool:
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            return False
+        self.pending += 1
+        return True
+
+    def release(self):
+        self.pending -= 1
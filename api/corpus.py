@@ -0,0 +1,182 @@
+import bisect
+import hashlib
+import json
+import math
+import sys
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from corpus_reader import CorpusReader, scan_dataset, split_full_id
+from search_index import BM25_B, BM25_K1, iter_dataset_parts, tokenize
+
+
+def _dumps(obj) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _etag(data: bytes) -> str:
+    return '"' + hashlib.sha256(data).hexdigest()[:32] + '"'
+
+
+class CorpusStore:
+    """
+    启动后在后台一次性加载的只读语料，供 /papers、/questions、/search 使用；ready 之前不能查询。
+    每道题目的JSON在加载时就序列化好并计算ETag，请求时只需拼接字节；
+    全文检索使用内存中的BM25倒排表（numpy数组），分词和打分与 search_index.SearchIndex 一致。
+    """
+
+    def __init__(self, pattern: str):
+        self.pattern = pattern
+        self.version = None  # 整个语料内容的哈希，列表和检索类响应的ETag基于它
+        self.papers = []  # 试卷摘要，按 paper_id 排序
+        self._paper_index = {}  # paper_id -> 摘要
+        self._paper_questions = {}  # paper_id -> [题目JSON字节]
+        self._questions = {}  # 完整题目ID（含子题ID）-> (题目JSON字节, ETag)
+        # 检索用：文档按 paper_id 排序编号，同一试卷的文档编号连续
+        self._docs = []
+        self._doc_papers = []
+        self._postings = {}
+        self._norms = None
+        self.load_seconds = 0.0
+        self.ready = False
+        self.loading = False
+        self.error = None
+
+    def load(self) -> dict:
+        """加载并建立索引（在线程池中执行）；完成后才设置 ready，失败时记录错误"""
+        self.loading = True
+        try:
+            return self._load()
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            self.loading = False
+
+    def _load(self) -> dict:
+        start = time.perf_counter()
+        digest = hashlib.sha256()
+        postings = defaultdict(lambda: ([], []))
+        lengths = []
+        for paper_id, path in sorted(CorpusReader(self.pattern).paths.items()):
+            header, bodies, parts = {}, [], 0
+            for event in scan_dataset(path):
+                if event[0] == 'field':
+                    header[event[1]] = event[2]
+                elif event[0] == 'question':
+                    question = event[1]
+                    body = _dumps(question)
+                    digest.update(body)
+                    cached = (body, _etag(body))
+                    bodies.append(body)
+                    for full_id, question_id, part_type, text in iter_dataset_parts(paper_id, [question]):
+                        self._questions[full_id] = cached
+                        doc_id = len(self._docs)
+                        self._docs.append((full_id, paper_id, question_id, part_type, text))
+                        self._doc_papers.append(paper_id)
+                        terms = Counter(tokenize(text))
+                        for term, tf in terms.items():
+                            postings[term][0].append(doc_id)
+                            postings[term][1].append(tf)
+                        lengths.append(sum(terms.values()))
+                        parts += 1
+
+            summary = {
+                'paper_id': paper_id,
+                'session': paper_id.split('_')[1] if paper_id.count('_') >= 2 else None,
+                'total_pages': header.get('total_pages'),
+                'total_questions': len(bodies),
+                'total_sub_parts': parts - len(bodies),
+            }
+            digest.update(_dumps(header))
+            self.papers.append(summary)
+            self._paper_index[paper_id] = summary
+            self._paper_questions[paper_id] = bodies
+
+        # 每篇文档的长度归一化项 k1 * (1 - b + b * len / avgdl) 预先算好
+        lengths = np.asarray(lengths, dtype=np.float64)
+        avgdl = max(lengths.mean(), 1.0) if len(lengths) else 1.0
+        self._norms = BM25_K1 * (1 - BM25_B + BM25_B * lengths / avgdl)
+        self._postings = {
+            term: (np.asarray(ids, dtype=np.int32), np.asarray(tfs, dtype=np.float64))
+            for term, (ids, tfs) in postings.items()
+        }
+        self.version = digest.hexdigest()
+        self.load_seconds = time.perf_counter() - start
+        self.ready = True
+        return self.stats()
+
+    def stats(self) -> dict:
+        return {
+            'ready': self.ready,
+            'loading': self.loading,
+            'error': self.error,
+            'papers': len(self.papers),
+            'parts': len(self._docs),
+            'terms': len(self._postings),
+            'load_seconds': round(self.load_seconds, 3),
+        }
+
+    def etag_for(self, key: str) -> str:
+        """列表、分页和检索类响应的ETag：由语料版本和请求参数决定，命中时无需生成响应"""
+        return _etag(f"{self.version}:{key}".encode('utf-8'))
+
+    def paper(self, paper_id: str):
+        return self._paper_index.get(paper_id)
+
+    def question(self, full_id: str):
+        """按完整ID取题目的 (JSON字节, ETag)；子题ID返回其所属的整道题"""
+        cached = self._questions.get(full_id)
+        if cached is None:
+            # 数据集中没有 full_id 字段时，按 "<paper_id>_Q<题号>" 再试一次
+            paper_id, question_id = split_full_id(full_id)
+            cached = self._questions.get(f"{paper_id}_Q{question_id}")
+        return cached
+
+    def paper_page(self, paper_id: str, offset: int, limit: int) -> bytes:
+        """某份试卷的一页题目，直接拼接预先序列化的题目JSON"""
+        bodies = self._paper_questions[paper_id][offset:offset + limit]
+        summary = self._paper_index[paper_id]
+        head = _dumps({'paper_id': paper_id, 'total': summary['total_questions'],
+                       'offset': offset, 'limit': limit})
+        return head[:-1] + b',"questions":[' + b','.join(bodies) + b']}'
+
+    def search(self, query: str, limit: int = 10, offset: int = 0, paper_prefix: str = None) -> list:
+        """BM25 全文检索，结果格式与 SearchIndex.search 相同"""
+        query_terms = Counter(tokenize(query))
+        doc_count = len(self._docs)
+        if not query_terms or not doc_count:
+            return []
+
+        scores = np.zeros(doc_count)
+        for term, count in query_terms.items():
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            ids, tfs = posting
+            idf = math.log(1 + (doc_count - len(ids) + 0.5) / (len(ids) + 0.5))
+            scores[ids] += idf * count * tfs * (BM25_K1 + 1) / (tfs + self._norms[ids])
+
+        lo, hi = 0, doc_count
+        if paper_prefix:
+            # 文档按 paper_id 排序，前缀对应一段连续的文档编号
+            lo = bisect.bisect_left(self._doc_papers, paper_prefix)
+            hi = bisect.bisect_left(self._doc_papers, paper_prefix[:-1] + chr(ord(paper_prefix[-1]) + 1))
+        candidates = lo + np.flatnonzero(scores[lo:hi])
+        wanted = offset + limit
+        if len(candidates) > wanted:
+            top = np.argpartition(-scores[candidates], wanted - 1)[:wanted]
+            candidates = candidates[top]
+        # 分数降序，同分按文档编号升序
+        ranked = candidates[np.lexsort((candidates, -scores[candidates]))][offset:wanted]
+
+        results = []
+        for doc_id in ranked:
+            full_id, paper_id, question_id, part_type, text = self._docs[doc_id]
+            results.append({'full_id': full_id, 'paper_id': paper_id, 'question_id': question_id,
+                            'type': part_type, 'text': text, 'score': round(float(scores[doc_id]), 4)})
+        return results
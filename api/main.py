@@ -1,52 +1,390 @@
-from fastapi import FastAPI, File, UploadFile
+import time
+
+# 进程启动计时起点（在导入较重的依赖之前）
+PROCESS_STARTED = time.perf_counter()
+
+import asyncio
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from enum import Enum
+from fastapi import FastAPI, File, HTTPException, Query, Request, UploadFile
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from ultralytics import YOLO
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 import cv2
 import numpy as np
 import io
 import base64
+import json
 import os
+import sys
+from pathlib import Path
+
+# 共享模块（metrics、detection 等）在项目根目录
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from batching import AdmissionGate, MicroBatcher
+from corpus import CorpusStore
+from model_loader import LazyModel
+from metrics import BOXES_PER_PAGE, HTTP_REQUEST_SECONDS, REGISTRY, STARTUP_SECONDS, timed
+from ocr_client import IMAGE_ENCODINGS, encode_image
+
+# 您训练好的模型：第一次使用时才导入推理库（ultralytics/torch 或 onnxruntime）并加载
+MODEL_PATH = os.getenv("MODEL_PATH", "../models/pastpaper_detector_demo/weights/best.pt")
+MODEL_DEVICE = os.getenv("MODEL_DEVICE", "")  # 如 "cpu"、"cuda:0"；留空由 ultralytics 自动选择
+# 检测后端：ultralytics / onnx / onnx-int8；留空时取 DETECTOR_BACKEND，默认按文件后缀自动选择
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "")
+# 启动后在后台预加载（为 0 时在第一个 /detect/ 请求时加载），以及加载后是否先在合成页面上预热一次
+MODEL_PRELOAD = os.getenv("MODEL_PRELOAD", "1") == "1"
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "1") == "1"
+model = LazyModel(MODEL_PATH, device=MODEL_DEVICE, warmup=MODEL_WARMUP, backend=MODEL_BACKEND,
+                  started=PROCESS_STARTED)
+
+# 动态批处理配置：一个批次最多的图片数，以及第一个请求到达后最多等待的毫秒数
+DETECT_MAX_BATCH_SIZE = int(os.getenv("DETECT_MAX_BATCH_SIZE", "8"))
+DETECT_MAX_WAIT_MS = float(os.getenv("DETECT_MAX_WAIT_MS", "10"))
+# 解码/裁剪/编码所用的线程数，以及同时处理（含排队）的请求上限，超过上限返回 503
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", str(os.cpu_count() or 4)))
+MAX_PENDING_REQUESTS = int(os.getenv("MAX_PENDING_REQUESTS", "32"))
+# 启动时加载到内存、供 /papers、/questions、/search 使用的数据集
+CORPUS_DATASETS = os.getenv("CORPUS_DATASETS", "../*_dataset.json")
+
+
+class ResponseFormat(str, Enum):
+    json = "json"            # 默认：JSON中的Base64图片列表
+    multipart = "multipart"  # multipart/mixed 流式返回原始图片字节
+    boxes = "boxes"          # 只返回坐标和置信度，由客户端自行裁剪
+
+
+class ImageFormat(str, Enum):
+    """裁剪图片的编码格式，与 ocr_client.IMAGE_ENCODINGS 的键一致"""
+    png = "png"
+    jpeg = "jpeg"
+    webp = "webp"
+
+
+def preload_model():
+    """后台预加载；失败时只记录错误，第一个 /detect/ 请求会重试"""
+    try:
+        model.get()
+        print(f"✅ Model ready after {startup_metrics()['model_ready_seconds']}s")
+    except Exception:
+        print(f"❌ Model failed to load: {model.error}")
+
+
+def preload_corpus():
+    """后台加载语料；加载完成前语料相关的接口返回 503"""
+    try:
+        stats = corpus.load()
+        print(f"📚 Corpus loaded: {stats['papers']} papers, {stats['parts']} parts in {stats['load_seconds']}s")
+    except Exception:
+        print(f"❌ Corpus failed to load: {corpus.error}")
+
+
+def require_corpus():
+    if not corpus.ready:
+        detail = f"Corpus failed to load: {corpus.error}" if corpus.error else "Corpus is loading, please retry"
+        raise HTTPException(status_code=503, detail=detail, headers={"Retry-After": "1"})
+
+
+def detect_batch(images):
+    """一次前向传播检测多张图片，返回每张图片的 (xyxy 框数组, 置信度数组)"""
+    return [(d.xyxy.astype(int), d.conf) for d in model.predict(images)]
+
+
+def decode_image(contents: bytes):
+    nparr = np.frombuffer(contents, np.uint8)
+    with timed('decode'):
+        return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+
+
+def encode_crop(img, xyxy, image_format=ImageFormat.png, quality=90) -> memoryview:
+    """裁剪单个检测框并编码；quality 只对 JPEG/WebP 生效。裁剪是原图的视图，结果直接引用编码缓冲区"""
+    cropped_img = img[xyxy[1]:xyxy[3], xyxy[0]:xyxy[2]]
+    with timed('encode'):
+        data, _ = encode_image(cropped_img, image_format.value, quality=quality)
+    return data
+
+
+def crop_and_encode(img, boxes, image_format=ImageFormat.png, quality=90) -> list:
+    """裁剪所有检测框并编码为Base64字符串"""
+    return [
+        base64.b64encode(encode_crop(img, xyxy, image_format, quality)).decode('utf-8')
+        for xyxy in boxes
+    ]
+
+
+async def stream_crops(img, boxes, confidences, image_format, quality, boundary):
+    """逐个编码裁剪图片并以 multipart/mixed 分段输出，不在内存中拼出完整响应"""
+    loop = asyncio.get_running_loop()
+    ext, content_type, _ = IMAGE_ENCODINGS[image_format.value]
+    for i, (xyxy, conf) in enumerate(zip(boxes, confidences)):
+        data = await loop.run_in_executor(cpu_pool, encode_crop, img, xyxy, image_format, quality)
+        headers = (
+            f"--{boundary}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Disposition: attachment; filename=\"question_{i + 1}{ext}\"\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"X-Box: {','.join(str(int(v)) for v in xyxy)}\r\n"
+            f"X-Confidence: {float(conf):.4f}\r\n\r\n"
+        )
+        yield headers.encode('ascii') + data + b"\r\n"
+    yield f"--{boundary}--\r\n".encode('ascii')
+
+
+class ClosingStreamingResponse(StreamingResponse):
+    """
+    响应结束时调用一次 on_close：正常发送完毕、发送失败、客户端断开（任务被取消），
+    以及流还没开始迭代就中止时都会调用，不依赖生成器的 finally。
+    """
+
+    def __init__(self, content, on_close, **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.on_close()
+
+
+batcher = MicroBatcher(detect_batch, max_batch_size=DETECT_MAX_BATCH_SIZE,
+                       max_wait_ms=DETECT_MAX_WAIT_MS)
+cpu_pool = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="cpu")
+gate = AdmissionGate(MAX_PENDING_REQUESTS)
+corpus = CorpusStore(CORPUS_DATASETS)
+# 进程启动到可以响应请求的时间（秒）
+app_start_seconds = None
 
-app = FastAPI(title="Past Paper Question Detector API")
+
+def startup_metrics() -> dict:
+    """启动耗时（秒）：进程启动到可以响应请求，以及到模型就绪"""
+    return {
+        "app_start_seconds": app_start_seconds,
+        "model_ready_seconds": round(model.ready_at - PROCESS_STARTED, 3) if model.ready_at else None,
+    }
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    return header.strip() == "*" or etag in (t.strip().removeprefix("W/") for t in header.split(","))
+
+
+def conditional_json(request: Request, etag: str, body) -> Response:
+    """If-None-Match 命中时返回 304；body 为字节或生成字节的函数（命中时不调用）"""
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    if callable(body):
+        body = body()
+    return Response(body, media_type="application/json", headers=headers)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 语料和模型都在后台加载，不阻塞 /health
+    asyncio.get_running_loop().run_in_executor(cpu_pool, preload_corpus)
+    batcher.start()
+    if MODEL_PRELOAD:
+        asyncio.get_running_loop().run_in_executor(cpu_pool, preload_model)
+    global app_start_seconds
+    app_start_seconds = round(time.perf_counter() - PROCESS_STARTED, 3)
+    STARTUP_SECONDS.set(app_start_seconds, phase='app_start')
+    print(f"🚀 Serving after {app_start_seconds}s (corpus loading in background, "
+          f"model {'loading in background' if MODEL_PRELOAD else 'loads on first request'})")
+    yield
+    await batcher.stop()
+    cpu_pool.shutdown(wait=True)
+
+
+app = FastAPI(title="Past Paper Question Detector API", lifespan=lifespan)
+# 题目JSON压缩效果好；裁剪图片本身已压缩，multipart 流不再 gzip
+app.add_middleware(GZipMiddleware, minimum_size=1000,
+                   exclude_content_types=("image/*", "multipart/mixed"))
+
+
+class RecordLatencyMiddleware:
+    """
+    按路由模板（而不是实际路径）记录请求延迟，避免 /questions/{full_id} 之类的路径产生大量序列。
+    ASGI 中间件在响应体发送完毕后才记录，流式响应（multipart）计入整个流的耗时。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, method=scope["method"],
+                                         route=getattr(route, "path", "unmatched"), status=status)
+
+
+app.add_middleware(RecordLatencyMiddleware)
 
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
-# 加载您训练好的模型
-MODEL_PATH = "../models/pastpaper_detector_demo/weights/best.pt"
-model = YOLO(MODEL_PATH)
-
 @app.post("/detect/")
-async def detect_and_crop(file: UploadFile = File(...)):
+async def detect_and_crop(
+    file: UploadFile = File(...),
+    response_format: ResponseFormat = Query(ResponseFormat.json),
+    image_format: ImageFormat = Query(ImageFormat.png),
+    quality: int = Query(90, ge=1, le=100, description="JPEG/WebP quality"),
+):
     """
     接收一张图片，检测其中的题目，并返回裁剪后的题目图片列表 (Base64编码)
+    response_format=multipart 时流式返回原始图片字节；=boxes 时只返回坐标和置信度
     """
-    contents = await file.read()
-    nparr = np.frombuffer(contents, np.uint8)
-    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-
-    # 模型推理
-    results = model(img)
-
-    cropped_images_base64 = []
-    for r in results:
-        for box in r.boxes:
-            # 获取坐标并裁剪
-            xyxy = box.xyxy[0].cpu().numpy().astype(int)
-            cropped_img = img[xyxy[1]:xyxy[3], xyxy[0]:xyxy[2]]
-            
-            # 将图片编码为Base64字符串
-            _, buffer = cv2.imencode('.png', cropped_img)
-            base64_str = base64.b64encode(buffer).decode('utf-8')
-            cropped_images_base64.append(base64_str)
+    # 队列已满时立即拒绝，保证已接收请求的延迟有界
+    if not gate.try_acquire():
+        raise HTTPException(status_code=503, detail="Server busy, please retry",
+                            headers={"Retry-After": "1"})
+    streaming = False
+    try:
+        contents = await file.read()
+        loop = asyncio.get_running_loop()
+
+        # 解码、裁剪和编码都在线程池中执行，不阻塞事件循环
+        img = await loop.run_in_executor(cpu_pool, decode_image, contents)
+        if img is None:
+            raise HTTPException(status_code=400, detail="Could not decode image")
+
+        # 模型推理（与同一时间窗口内的其他请求合并为一个批次）
+        boxes, confidences = await batcher.submit(img)
+        BOXES_PER_PAGE.observe(len(boxes))
+
+        if response_format == ResponseFormat.boxes:
+            return {
+                "image": {"width": img.shape[1], "height": img.shape[0]},
+                "boxes": [
+                    {"xyxy": [int(v) for v in xyxy], "confidence": round(float(conf), 4)}
+                    for xyxy, conf in zip(boxes, confidences)
+                ]
+            }
+
+        if response_format == ResponseFormat.multipart:
+            # 请求在流输出结束（或中止）时才算处理完毕，由响应负责释放名额
+            boundary = uuid.uuid4().hex
+            response = ClosingStreamingResponse(
+                stream_crops(img, boxes, confidences, image_format, quality, boundary),
+                on_close=gate.release,
+                media_type=f"multipart/mixed; boundary={boundary}"
+            )
+            streaming = True
+            return response
+
+        cropped_images_base64 = await loop.run_in_executor(
+            cpu_pool, crop_and_encode, img, boxes, image_format, quality
+        )
+    finally:
+        if not streaming:
+            gate.release()
 
     return {"detected_questions": cropped_images_base64}
 
+@app.get("/papers")
+async def list_papers(request: Request):
+    """所有试卷的摘要（不含题目内容）"""
+    require_corpus()
+    return conditional_json(request, corpus.etag_for("papers"),
+                            lambda: json.dumps({"papers": corpus.papers}).encode("utf-8"))
+
+@app.get("/papers/{paper_id}/questions")
+async def paper_questions(
+    request: Request,
+    paper_id: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=200),
+):
+    """分页返回某份试卷的题目，查看器按页加载而不必下载整份数据集"""
+    require_corpus()
+    if corpus.paper(paper_id) is None:
+        raise HTTPException(status_code=404, detail=f"Unknown paper {paper_id}")
+    etag = corpus.etag_for(f"{paper_id}:{offset}:{limit}")
+    return conditional_json(request, etag, lambda: corpus.paper_page(paper_id, offset, limit))
+
+@app.get("/questions/{full_id}")
+async def get_question(request: Request, full_id: str):
+    """按完整ID取题目，如 9709_s20_qp_11_Q4；子题ID（..._Q4(b)）返回整道题"""
+    require_corpus()
+    cached = corpus.question(full_id)
+    if cached is None:
+        raise HTTPException(status_code=404, detail=f"Unknown question {full_id}")
+    body, etag = cached
+    return conditional_json(request, etag, body)
+
+@app.get("/search")
+async def search(
+    request: Request,
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    paper: str = Query(None, description="试卷ID前缀，如 9709_s20"),
+):
+    """BM25 全文检索，每个题目部分为一条结果"""
+    require_corpus()
+    etag = corpus.etag_for(json.dumps([q, limit, offset, paper]))
+    if etag_matches(request, etag):
+        return conditional_json(request, etag, b"")
+    results = await asyncio.get_running_loop().run_in_executor(
+        cpu_pool, corpus.search, q, limit, offset, paper
+    )
+    body = json.dumps({"query": q, "offset": offset, "results": results}, ensure_ascii=False)
+    return conditional_json(request, etag, body.encode("utf-8"))
+
 @app.get("/")
 async def root():
     return FileResponse('static/index.html')
 
+@app.get("/viewer")
+async def academic_viewer():
+    return FileResponse('../academic_viewer.html')
+
+@app.get("/viewer/questions")
+async def questions_viewer():
+    return FileResponse('../questions_viewer.html')
+
 @app.get("/health")
 def health_check():
-    return {"message": "Welcome to the Question Detector API!", "status": "healthy"}
\ No newline at end of file
+    """存活检查：进程能响应即可，不等待模型加载"""
+    return {
+        "message": "Welcome to the Question Detector API!",
+        "status": "healthy",
+        "pending_requests": gate.pending,
+        "rejected_requests": gate.rejected,
+        "corpus": corpus.stats(),
+        "startup": startup_metrics()
+    }
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Prometheus 抓取端点：解码、推理、编码的延迟分布，每页检测框数、各路由的请求延迟和启动耗时"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/ready")
+def readiness_check():
+    """就绪检查：模型加载（和预热）和语料加载都完成后返回 200，否则 503"""
+    ready = model.ready and corpus.ready
+    body = {
+        "status": "ready" if ready else ("error" if model.error or corpus.error else "loading"),
+        "model": model.status(),
+        "corpus": corpus.stats(),
+        "startup": startup_metrics()
+    }
+    return JSONResponse(body, status_code=200 if ready else 503)
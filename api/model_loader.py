@@ -0,0 +1,103 @@
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from metrics import STARTUP_SECONDS
+
+
+def synthetic_page(width: int = 794, height: int = 1123) -> np.ndarray:
+    """预热用的合成页面：白底上若干深色横条，形状接近一页试卷（A4 比例）"""
+    page = np.full((height, width, 3), 255, dtype=np.uint8)
+    for y in range(80, height - 80, 36):
+        page[y:y + 12, 60:width - 60 - (y * 7) % 200] = 40
+    return page
+
+
+class LazyModel:
+    """
+    线程安全的延迟加载检测模型：第一次调用（或后台预加载）时才导入推理库（ultralytics/torch 或
+    onnxruntime）并加载权重，应用启动和 /health 不必等待。
+    并发调用者在锁上等待同一次加载；加载失败时记录错误，下次调用重试。
+    加载完成后把各阶段耗时记入 STARTUP_SECONDS；started 为计时起点（time.perf_counter），
+    model_ready 从该时刻算起，None 时从创建 LazyModel 算起。
+    """
+
+    def __init__(self, path: str, device: Optional[str] = None, warmup: bool = True,
+                 backend: Optional[str] = None, started: Optional[float] = None):
+        self.path = path
+        self.device = device or None  # None 使用 ultralytics 的默认设备
+        self.backend = backend or None  # None 使用 detection.DEFAULT_BACKEND
+        self.warmup = warmup
+        self._model = None
+        self._lock = threading.Lock()
+        self.loading = False
+        self.error = None
+        # 各阶段耗时（秒），加载包括导入推理库
+        self.load_seconds = None
+        self.warmup_seconds = None
+        self.ready_at = None  # 就绪时刻（time.perf_counter）
+        self.started = started if started is not None else time.perf_counter()
+
+    @property
+    def ready(self) -> bool:
+        return self._model is not None
+
+    def get(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self._load()
+        return self._model
+
+    def _load(self):
+        self.loading = True
+        try:
+            start = time.perf_counter()
+            from detection import load_detector
+            detector = load_detector(self.path, backend=self.backend, device=self.device)
+            loaded = time.perf_counter()
+            self.load_seconds = loaded - start
+            if self.warmup:
+                # 第一次前向传播会初始化算子和内存池，放在接收请求之前完成
+                detector.predict([synthetic_page()])
+                self.warmup_seconds = time.perf_counter() - loaded
+            self.error = None
+            self.ready_at = time.perf_counter()
+            self._record_startup()
+            return detector
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            self.loading = False
+
+    def _record_startup(self):
+        STARTUP_SECONDS.set(self.load_seconds, phase='model_load')
+        if self.warmup_seconds is not None:
+            STARTUP_SECONDS.set(self.warmup_seconds, phase='warmup')
+        STARTUP_SECONDS.set(self.ready_at - self.started, phase='model_ready')
+
+    def predict(self, images) -> list:
+        """检测一批图片，返回每张图片的 detection.Detections"""
+        return self.get().predict(images)
+
+    def status(self) -> dict:
+        return {
+            "path": self.path,
+            "backend": self._model.name if self._model is not None else (self.backend or "auto"),
+            "device": self.device or "auto",
+            "ready": self.ready,
+            "loading": self.loading,
+            "error": self.error,
+            "load_seconds": _round(self.load_seconds),
+            "warmup_seconds": _round(self.warmup_seconds),
+        }
+
+
+def _round(value):
+    return round(value, 3) if value is not None else None
@@ -0,0 +1,104 @@
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import cv2
+
+from common import DEFAULT_DATASETS, DEFAULT_WEIGHTS, PROJECT_ROOT, SkipSuite, percentile
+from detection import resolve_model
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_api(model, backend: str = None, port: int = None, timeout: float = 300.0):
+    """在子进程中启动 API（与生产相同的 uvicorn 单进程），等待 /ready 返回 200；返回 (进程, 基础URL)"""
+    import httpx
+    port = port or free_port()
+    env = {**os.environ, 'MODEL_PATH': str(model), 'MODEL_PRELOAD': '1', 'CORPUS_DATASETS': DEFAULT_DATASETS}
+    if backend:
+        env['MODEL_BACKEND'] = backend
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'main:app', '--host', '127.0.0.1', '--port', str(port),
+         '--log-level', 'warning'],
+        cwd=PROJECT_ROOT / 'api', env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"API exited: {process.stderr.read().decode(errors='replace')[-2000:]}")
+        try:
+            if httpx.get(f"{base_url}/ready", timeout=2).status_code == 200:
+                return process, base_url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise TimeoutError(f"API not ready after {timeout}s")
+
+
+async def _load(base_url: str, uploads: list, requests: int, concurrency: int, params: dict) -> tuple:
+    import httpx
+    latencies, statuses = [], {}
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        async def one(i):
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post('/detect/', params=params,
+                                             files={'file': ('page.png', uploads[i % len(uploads)], 'image/png')})
+                await response.aread()
+                latencies.append(time.perf_counter() - start)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        return time.perf_counter() - start, latencies, statuses
+
+
+def run(images, model=DEFAULT_WEIGHTS, backend: str = None, concurrency=(1, 8, 32),
+        requests: int = 64, response_format: str = 'json') -> dict:
+    """
+    /detect/ 吞吐量（请求/秒）和延迟：子进程中的 API 加载同一模型，
+    按不同并发数上传 test/valid 页面（PNG），每个并发级别先预热一轮。
+    """
+    _, model_file = resolve_model(model, backend)
+    if not model_file.is_file():
+        raise SkipSuite(f"weights not found: {model_file}")
+    try:
+        import httpx  # noqa: F401
+    except ImportError:
+        raise SkipSuite("httpx not installed")
+    uploads = [cv2.imencode('.png', img)[1].tobytes() for img in images]
+    if not uploads:
+        raise SkipSuite("no annotated_dataset test/valid images")
+
+    process, base_url = start_api(model, backend)
+    metrics = {}
+    params = {'response_format': response_format}
+    try:
+        for level in concurrency:
+            asyncio.run(_load(base_url, uploads, level, level, params))  # 预热
+            elapsed, latencies, statuses = asyncio.run(_load(base_url, uploads, requests, level, params))
+            if set(statuses) != {200}:
+                raise RuntimeError(f"/detect/ returned {statuses} at concurrency {level}")
+            metrics[f'requests_per_sec_c{level}'] = round(requests / elapsed, 2)
+            metrics[f'p50_ms_c{level}'] = round(percentile(latencies, 50) * 1000, 1)
+            metrics[f'p95_ms_c{level}'] = round(percentile(latencies, 95) * 1000, 1)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+    return {
+        'params': {'requests': requests, 'concurrency': list(concurrency), 'uploads': len(uploads),
+                   'response_format': response_format, 'model': str(model_file)},
+        'metrics': metrics,
+    }
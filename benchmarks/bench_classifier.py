@@ -0,0 +1,58 @@
+import glob
+import json
+
+from common import DEFAULT_DATASETS, repeat_timed, throughput
+from question_classifier import QuestionClassifier
+
+
+def load_papers(pattern: str = DEFAULT_DATASETS) -> list:
+    """从已生成的数据集还原每份试卷的分类器输入：[(paper_id, analysis_results)]"""
+    papers = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path, 'r', encoding='utf-8') as f:
+            dataset = json.load(f)
+        regions = []
+        for question in dataset['questions']:
+            for part in [question['main_part'], *question['sub_parts']]:
+                region = {'text': part['text'], 'index': len(regions)}
+                for key in ('page', 'bbox', 'ocr_confidence'):
+                    if key in part:
+                        region[key] = part[key]
+                regions.append(region)
+        papers.append((dataset['paper_id'], regions))
+    return papers
+
+
+def run(datasets: str = DEFAULT_DATASETS, repeat: int = 50, rounds: int = 5) -> dict:
+    """
+    QuestionClassifier 吞吐量：自带的数据集复制 repeat 份模拟整个语料库，
+    分别测量 classify_regions（整份试卷）和 _analyze_question_part（单个区域的题号识别）。
+    """
+    papers = load_papers(datasets)
+    if not papers:
+        raise FileNotFoundError(f"No datasets match {datasets}")
+    corpus = papers * repeat
+    regions = sum(len(r) for _, r in corpus)
+    texts = [region['text'] for _, r in corpus for region in r]
+
+    def classify_all():
+        for paper_id, analysis_results in corpus:
+            QuestionClassifier(paper_id).classify_regions(analysis_results)
+
+    analyzer = QuestionClassifier("benchmark")
+
+    def analyze_all():
+        for text in texts:
+            analyzer._analyze_question_part(text)
+
+    classify_samples = repeat_timed(classify_all, rounds)
+    analyze_samples = repeat_timed(analyze_all, rounds)
+    return {
+        'params': {'datasets': len(papers), 'repeat': repeat, 'rounds': rounds,
+                   'papers': len(corpus), 'regions': regions},
+        'metrics': {
+            'classify_papers_per_sec': round(throughput(len(corpus), classify_samples), 1),
+            'classify_regions_per_sec': round(throughput(regions, classify_samples), 1),
+            'analyze_regions_per_sec': round(throughput(len(texts), analyze_samples), 1),
+        }
+    }
@@ -0,0 +1,118 @@
+import glob
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from common import DEFAULT_IMAGES, DEFAULT_WEIGHTS, SkipSuite, percentile, repeat_timed, throughput
+from detection import DEFAULT_TILE_OVERLAP, load_detector, resolve_model
+
+
+def load_images(patterns=DEFAULT_IMAGES, with_labels: bool = False):
+    """解码 test/valid 页面；with_labels=True 时返回 (images, labels)，labels 为每页标注框的像素 xyxy"""
+    paths = sorted(p for pattern in patterns for p in glob.glob(pattern))
+    images, labels = [], []
+    for path in paths:
+        img = cv2.imread(path)
+        if img is None:
+            continue
+        images.append(img)
+        if with_labels:
+            labels.append(read_labels(path, img.shape))
+    return (images, labels) if with_labels else images
+
+
+def read_labels(image_path, shape) -> np.ndarray:
+    """YOLO 标注（images/x.jpg 对应 labels/x.txt，归一化的 cls cx cy w h）转换为像素 xyxy"""
+    path = Path(image_path)
+    label_file = path.parent.parent / 'labels' / f'{path.stem}.txt'
+    if not label_file.is_file():
+        return np.zeros((0, 4), dtype=np.float32)
+    rows = np.loadtxt(label_file, ndmin=2, dtype=np.float32)
+    if not len(rows):
+        return np.zeros((0, 4), dtype=np.float32)
+    h, w = shape[:2]
+    cx, cy, bw, bh = rows[:, 1] * w, rows[:, 2] * h, rows[:, 3] * w, rows[:, 4] * h
+    return np.stack([cx - bw / 2, cy - bh / 2, cx + bw / 2, cy + bh / 2], axis=1)
+
+
+def recall(detections, labels, iou_threshold: float = 0.5) -> float:
+    """标注框中至少与一个检测框 IoU 不低于阈值的比例"""
+    found = total = 0
+    for boxes, truth in zip(detections, labels):
+        total += len(truth)
+        if not len(truth) or not len(boxes):
+            continue
+        lt = np.maximum(truth[:, None, :2], boxes[None, :, :2])
+        rb = np.minimum(truth[:, None, 2:], boxes[None, :, 2:])
+        inter = np.prod(np.clip(rb - lt, 0, None), axis=2)
+        area_t = np.prod(truth[:, 2:] - truth[:, :2], axis=1)
+        area_b = np.prod(boxes[:, 2:] - boxes[:, :2], axis=1)
+        iou = inter / (area_t[:, None] + area_b[None, :] - inter + 1e-9)
+        found += int((iou.max(axis=1) >= iou_threshold).sum())
+    return found / total if total else 0.0
+
+
+def run(model=DEFAULT_WEIGHTS, backend: str = None, batch_sizes=(1, 4), imgsz: int = 640,
+        rounds: int = 3, images=None, labels=None, tile_sizes=(), tile_overlap: float = DEFAULT_TILE_OVERLAP) -> dict:
+    """
+    检测吞吐量（页/秒）：annotated_dataset 的 test/valid 页面预先解码，只计模型推理（含前后处理），
+    不经过检测缓存。每个批次大小先预热一遍，再计时 rounds 遍。
+    tile_sizes 中的每个方块边长另测一遍滑窗检测（批次大小取 batch_sizes 中最大的）：页/秒、每个方块的耗时，
+    有标注时还对比整页与滑窗检测的召回率（IoU 0.5）。
+    """
+    backend_name, model_file = resolve_model(model, backend)
+    if not model_file.is_file():
+        raise SkipSuite(f"weights not found: {model_file}")
+    images = images if images is not None else load_images()
+    if not images:
+        raise SkipSuite("no annotated_dataset test/valid images")
+
+    start = time.perf_counter()
+    detector = load_detector(model, backend=backend, tile_size=0)
+    load_seconds = time.perf_counter() - start
+
+    metrics = {'model_load_seconds': round(load_seconds, 3)}
+    for batch_size in batch_sizes:
+        batches = [images[i:i + batch_size] for i in range(0, len(images), batch_size)]
+        latencies = []
+
+        def detect_all():
+            for batch in batches:
+                t = time.perf_counter()
+                detector.predict(batch, imgsz=imgsz)
+                latencies.append((time.perf_counter() - t) / len(batch))
+
+        samples = repeat_timed(detect_all, rounds)
+        latencies = latencies[len(batches):]  # 去掉预热那一遍
+        metrics[f'pages_per_sec_bs{batch_size}'] = round(throughput(len(images), samples), 2)
+        metrics[f'page_p50_ms_bs{batch_size}'] = round(percentile(latencies, 50) * 1000, 1)
+    batch_size = max(batch_sizes)
+    batches = [images[i:i + batch_size] for i in range(0, len(images), batch_size)]
+    if labels:
+        detections = [r.xyxy for batch in batches for r in detector.predict(batch, imgsz=imgsz)]
+        metrics['recall'] = round(recall(detections, labels), 4)
+    for tile_size in tile_sizes:
+        tiled = load_detector(model, backend=backend, tile_size=tile_size, tile_overlap=tile_overlap)
+
+        def detect_tiled():
+            for batch in batches:
+                tiled.predict(batch, imgsz=imgsz)
+
+        detect_tiled()  # 预热，方块计数和耗时只统计计时的几遍
+        tiled.tiles, tiled.tile_seconds = 0, 0.0
+        samples = repeat_timed(detect_tiled, rounds, warmup=0)
+        report = tiled.tile_report()
+        metrics[f'pages_per_sec_tile{tile_size}'] = round(throughput(len(images), samples), 2)
+        metrics[f'tile{tile_size}_ms'] = report['tile_ms']
+        metrics[f'tiles_per_page_tile{tile_size}'] = round(report['tiles'] / (len(images) * rounds), 1)
+        if labels:
+            detections = [r.xyxy for batch in batches for r in tiled.predict(batch, imgsz=imgsz)]
+            metrics[f'recall_tile{tile_size}'] = round(recall(detections, labels), 4)
+    return {
+        'params': {'backend': backend_name, 'model': str(model_file), 'pages': len(images),
+                   'imgsz': imgsz, 'batch_sizes': list(batch_sizes), 'rounds': rounds,
+                   'tile_sizes': list(tile_sizes), 'tile_overlap': tile_overlap},
+        'metrics': metrics,
+    }
@@ -0,0 +1,80 @@
+import sys
+import tracemalloc
+
+from common import PROJECT_ROOT, repeat_timed, throughput
+from ocr_client import IMAGE_ENCODINGS, MathpixClient, encode_image
+
+sys.path.insert(0, str(PROJECT_ROOT / "scripts"))
+from stub_ocr_server import start_stub_server
+
+
+def page_bands(images, bands: int = 6) -> list:
+    """把每页按高度等分为若干横条，近似一页上各题目的裁剪区域（确定性输入）"""
+    crops = []
+    for img in images:
+        step = img.shape[0] // bands
+        crops.extend(img[i * step:(i + 1) * step] for i in range(bands))
+    return crops
+
+
+def allocations(client, crops) -> float:
+    """串行识别时每个区域的内存峰值（KiB，tracemalloc 统计，含编码缓冲区和请求体）"""
+    peaks = []
+    tracemalloc.start()
+    try:
+        for crop in crops:
+            tracemalloc.reset_peak()
+            base, _ = tracemalloc.get_traced_memory()
+            client.ocr_image(crop)
+            peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    finally:
+        tracemalloc.stop()
+    return sum(peaks) / len(peaks) / 1024
+
+
+def encode_seconds(crops, image_format: str, rounds: int) -> float:
+    """各编码格式每个区域的编码耗时（中位数）"""
+    samples = repeat_timed(lambda: [encode_image(crop, image_format) for crop in crops], rounds)
+    return sorted(samples)[len(samples) // 2] / len(crops)
+
+
+def run(images, concurrency=(1, 8, 16), latency: float = 0.05, rounds: int = 3) -> dict:
+    """
+    OCR阶段吞吐量（区域/秒）：对本地桩服务器（固定延迟）并发识别裁剪区域，
+    包括PNG编码和HTTP往返，不经过OCR缓存。反映连接池和并发上限的效果，而不是 Mathpix 本身的速度。
+    另外记录两种上传方式（json / multipart）每个区域的内存峰值，以及各编码格式的编码耗时。
+    """
+    crops = page_bands(images)
+    server, url = start_stub_server(latency=latency)
+    metrics = {}
+    try:
+        for max_in_flight in concurrency:
+            client = MathpixClient("bench", "bench", url=url, max_in_flight=max_in_flight, cache=None)
+
+            def recognize_all():
+                results = client.ocr_many(crops)
+                failures = sum('text' not in r for r in results)
+                if failures:
+                    raise RuntimeError(f"{failures} stub OCR requests failed")
+
+            samples = repeat_timed(recognize_all, rounds)
+            client.close()
+            metrics[f'regions_per_sec_c{max_in_flight}'] = round(throughput(len(crops), samples), 1)
+        # 单个区域的开销（编码 + 往返 - 桩服务器的固定延迟），只用串行的结果计算
+        if 1 in concurrency:
+            per_region = 1 / metrics['regions_per_sec_c1']
+            metrics['region_overhead_ms'] = round((per_region - latency) * 1000, 2)
+        for upload in ('json', 'multipart'):
+            client = MathpixClient("bench", "bench", url=url, max_in_flight=1, cache=None, upload=upload)
+            client.ocr_image(crops[0])  # 预热连接
+            metrics[f'alloc_{upload}_kib'] = round(allocations(client, crops), 1)
+            client.close()
+    finally:
+        server.shutdown()
+    for image_format in IMAGE_ENCODINGS:
+        metrics[f'encode_{image_format}_ms'] = round(encode_seconds(crops, image_format, rounds) * 1000, 2)
+    return {
+        'params': {'regions': len(crops), 'latency_seconds': latency,
+                   'concurrency': list(concurrency), 'rounds': rounds},
+        'metrics': metrics,
+    }
@@ -0,0 +1,129 @@
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+# 每次运行追加一行JSON，便于按时间对比
+DEFAULT_RESULTS_PATH = Path(__file__).resolve().parent / "results" / "history.jsonl"
+DEFAULT_DATASETS = str(PROJECT_ROOT / "*_dataset.json")
+DEFAULT_IMAGES = [
+    str(PROJECT_ROOT / "data" / "annotated_dataset" / "test" / "images" / "*.jpg"),
+    str(PROJECT_ROOT / "data" / "annotated_dataset" / "valid" / "images" / "*.jpg"),
+]
+DEFAULT_WEIGHTS = PROJECT_ROOT / "models" / "pastpaper_detector_demo" / "weights" / "best.pt"
+
+sys.path.insert(0, str(PROJECT_ROOT))
+
+
+class SkipSuite(Exception):
+    """缺少模型权重等前提条件时跳过该项基准测试"""
+
+
+def repeat_timed(func, rounds: int, warmup: int = 1) -> list:
+    """先预热 warmup 次，再计时 rounds 次，返回每次的耗时（秒）"""
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def percentile(samples, q: float) -> float:
+    """线性插值的分位数，q 取 0~100"""
+    ordered = sorted(samples)
+    if not ordered:
+        return float('nan')
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def throughput(items: int, samples) -> float:
+    """按中位耗时计算每秒处理量（比最快一次更不受偶然因素影响）"""
+    return items / statistics.median(samples)
+
+
+def environment() -> dict:
+    """运行环境：git 提交、Python 和主要依赖的版本、CPU，用于判断两次结果是否可比"""
+    def git(*args):
+        try:
+            return subprocess.run(['git', *args], cwd=PROJECT_ROOT, capture_output=True, text=True,
+                                  timeout=10).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return None
+
+    versions = {}
+    for module in ('numpy', 'cv2', 'torch', 'ultralytics', 'onnxruntime', 'fastapi'):
+        if module in sys.modules:
+            versions[module] = getattr(sys.modules[module], '__version__', None)
+    return {
+        'commit': git('rev-parse', '--short', 'HEAD'),
+        'dirty': bool(git('status', '--porcelain', '--untracked-files=no')),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'processor': platform.processor() or None,
+        'cpu_count': os.cpu_count(),
+        'versions': versions,
+    }
+
+
+def host_key(env: dict) -> tuple:
+    # 只对比同一台机器（同一平台、CPU数、Python版本）上的结果
+    return env.get('platform'), env.get('machine'), env.get('cpu_count'), env.get('python')
+
+
+def save_run(run: dict, path=DEFAULT_RESULTS_PATH) -> Path:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(run, ensure_ascii=False) + "\n")
+    return path
+
+
+def load_history(path=DEFAULT_RESULTS_PATH) -> list:
+    path = Path(path)
+    if not path.exists():
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def find_baseline(history: list, env: dict, ref: str = None):
+    """同一主机上最近一次运行；ref 为提交哈希前缀时取该提交最近一次运行"""
+    for run in reversed(history):
+        if host_key(run.get('environment', {})) != host_key(env):
+            continue
+        if ref is None or (run['environment'].get('commit') or '').startswith(ref):
+            return run
+    return None
+
+
+def lower_is_better(metric: str) -> bool:
+    # 约定：*_ms / *_seconds / *_kib 越小越好，其余（*_per_sec 等）越大越好
+    return metric.endswith(('_ms', '_seconds', '_kib'))
+
+
+def compare_runs(current: dict, baseline: dict, threshold: float = 0.05) -> list:
+    """逐项对比两次运行，返回 (suite, metric, 旧值, 新值, 变化比例, 判定)；判定为 better / worse / same"""
+    rows = []
+    for suite, result in current['suites'].items():
+        old_metrics = baseline.get('suites', {}).get(suite, {}).get('metrics', {})
+        for metric, new in result.get('metrics', {}).items():
+            old = old_metrics.get(metric)
+            if not isinstance(old, (int, float)) or not isinstance(new, (int, float)) or not old:
+                continue
+            change = (new - old) / old
+            improved = -change if lower_is_better(metric) else change
+            verdict = 'better' if improved > threshold else 'worse' if improved < -threshold else 'same'
+            rows.append((suite, metric, old, new, change, verdict))
+    return rows
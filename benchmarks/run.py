@@ -0,0 +1,99 @@
+import argparse
+import time
+
+from common import (DEFAULT_RESULTS_PATH, DEFAULT_WEIGHTS, SkipSuite, compare_runs, environment,
+                    find_baseline, load_history, save_run)
+
+# 可复现的基准测试：分类器、检测、OCR阶段（桩服务器）和 /detect/ 接口的吞吐量。
+# 每次运行的结果追加到 benchmarks/results/history.jsonl，并与同一台机器上的上一次运行对比。
+# 用法: python benchmarks/run.py                  # 全部
+#       python benchmarks/run.py classifier ocr   # 指定项目
+#       python benchmarks/run.py --quick --no-save
+SUITES = ('classifier', 'detection', 'ocr', 'api')
+
+
+def run_suites(args) -> dict:
+    import bench_api
+    import bench_classifier
+    import bench_detection
+    import bench_ocr
+
+    images = labels = None
+    results = {}
+    for suite in args.suites:
+        print(f"⏱️  {suite} ...", flush=True)
+        start = time.perf_counter()
+        try:
+            if suite == 'classifier':
+                result = bench_classifier.run(repeat=args.repeat, rounds=args.rounds)
+            else:
+                if images is None:
+                    images, labels = bench_detection.load_images(with_labels=True)
+                if suite == 'detection':
+                    result = bench_detection.run(args.model, args.backend, batch_sizes=args.batch_sizes,
+                                                 rounds=args.rounds, images=images, labels=labels,
+                                                 tile_sizes=args.tile_sizes)
+                elif suite == 'ocr':
+                    result = bench_ocr.run(images, latency=args.ocr_latency, rounds=args.rounds)
+                else:
+                    result = bench_api.run(images, args.model, args.backend, requests=args.requests)
+        except SkipSuite as e:
+            print(f"   ⚠️  skipped: {e}")
+            results[suite] = {'skipped': str(e)}
+            continue
+        result['seconds'] = round(time.perf_counter() - start, 1)
+        results[suite] = result
+        for metric, value in result['metrics'].items():
+            print(f"   {metric}: {value}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the benchmark suite and compare with earlier runs")
+    parser.add_argument('suites', nargs='*', metavar='suite', help=f"默认全部：{', '.join(SUITES)}")
+    parser.add_argument('--model', default=str(DEFAULT_WEIGHTS))
+    parser.add_argument('--backend', default=None, help="检测后端，默认取环境变量 DETECTOR_BACKEND")
+    parser.add_argument('--rounds', type=int, default=5, help="每项计时的轮数（取中位数）")
+    parser.add_argument('--repeat', type=int, default=50, help="分类器语料复制的份数")
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--tile-sizes', type=int, nargs='*', default=[1280],
+                        help="另测滑窗检测的方块边长（页面像素），不带参数时跳过")
+    parser.add_argument('--requests', type=int, default=64, help="每个并发级别的 /detect/ 请求数")
+    parser.add_argument('--ocr-latency', type=float, default=0.05, help="桩OCR服务器的固定延迟（秒）")
+    parser.add_argument('--quick', action='store_true', help="少量轮次的快速检查（不适合对比）")
+    parser.add_argument('--results', default=str(DEFAULT_RESULTS_PATH), help="结果历史文件（JSONL）")
+    parser.add_argument('--baseline', help="对比的提交哈希前缀，默认同一主机上的上一次运行")
+    parser.add_argument('--no-save', action='store_true', help="不写入结果历史")
+    args = parser.parse_args()
+    unknown = set(args.suites) - set(SUITES)
+    if unknown:
+        parser.error(f"unknown suite {', '.join(sorted(unknown))}, expected {', '.join(SUITES)}")
+    args.suites = args.suites or list(SUITES)
+    if args.quick:
+        args.rounds, args.repeat, args.requests = 2, 5, 16
+
+    results = run_suites(args)
+    run = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': environment(),
+        'quick': args.quick,
+        'suites': results,
+    }
+
+    history = [r for r in load_history(args.results) if r.get('quick') == args.quick]
+    baseline = find_baseline(history, run['environment'], args.baseline)
+    if baseline is not None:
+        print(f"\n📊 Compared with {baseline['environment'].get('commit')} ({baseline['timestamp']}):")
+        for suite, metric, old, new, change, verdict in compare_runs(run, baseline):
+            mark = {'better': '🟢', 'worse': '🔴', 'same': '⚪'}[verdict]
+            print(f"   {mark} {suite}.{metric}: {old} -> {new} ({change:+.1%})")
+    elif args.baseline:
+        print(f"\n⚠️  No earlier run for {args.baseline} on this host")
+
+    if not args.no_save:
+        path = save_run(run, args.results)
+        print(f"\n💾 Saved to {path}")
+
+
+if __name__ == "__main__":
+    main()
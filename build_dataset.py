@@ -1,26 +1,90 @@
-import cv2
-import requests
-import base64
+import argparse
 import json
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import partial
 from pathlib import Path
+from typing import Callable
 from dotenv import load_dotenv
 import os
-from ultralytics import YOLO
-from question_classifier import QuestionClassifier, Question
+from question_classifier import Question
+from ocr_client import MathpixClient, MATHPIX_TEXT_URL
+from ocr_cache import OCRCache
+from ocr_preprocess import OCRPreprocessor
+from detection import BatchDetector, BACKENDS, DEFAULT_TILE_OVERLAP, DEFAULT_TILE_SIZE
+from detection_cache import CachedDetector
+from pipeline import Pipeline, analysis_results, read_image
+from metrics import OPERATION_SECONDS, REGISTRY
+from pdf_pages import page_skip_reason, render_page, DEFAULT_DPI
+from build_manifest import BuildManifest, DEFAULT_MANIFEST_DIR, sha256_file, sha256_json
+from search_index import SearchIndex, DEFAULT_INDEX_PATH
+from corpus_reader import write_ndjson, NDJSON_SUFFIX
+import fitz  # PyMuPDF
+import question_classifier
 import glob
 
 load_dotenv()
 
+@dataclass
+class PageSource:
+    """待处理的页面：文件名、内容哈希以及加载图像的函数"""
+    filename: str  # 如 "page_5.png"
+    input_hash: str
+    load: Callable
+
 class DatasetBuilder:
     """构建试卷数据集"""
     
-    def __init__(self, model_path):
-        self.model = YOLO(model_path)
+    def __init__(self, model_path, ocr_url=MATHPIX_TEXT_URL, ocr_concurrency=8,
+                 ocr_timeout=30.0, ocr_retries=3, ocr_cache='env', ocr_preprocess='env',
+                 detect_batch_size=4, imgsz=640, device=None, backend=None,
+                 detection_cache='env', manifest_dir=DEFAULT_MANIFEST_DIR,
+                 tile_size=DEFAULT_TILE_SIZE, tile_overlap=DEFAULT_TILE_OVERLAP):
+        # 检测后端：PyTorch（ultralytics）或 onnxruntime，见 detection.load_detector；tile_size 大于 0 时滑窗检测。
+        # 检测结果按页面内容缓存（DETECTION_CACHE_PATH 等），全部命中时不加载模型
+        self.backend = CachedDetector(model_path, backend=backend, device=device, cache=detection_cache,
+                                      tile_size=tile_size, tile_overlap=tile_overlap)
+        # 批量检测：每次前向传播处理多页，并预读后续页面
+        self.detector = BatchDetector(self.backend, batch_size=detect_batch_size, imgsz=imgsz)
         self.app_id = os.getenv('MATHPIX_APP_ID')
         self.app_key = os.getenv('MATHPIX_API_KEY')
+        # OCR结果缓存，默认按环境变量配置（OCR_CACHE_PATH / OCR_CACHE_OFFLINE 等）
+        self.ocr_cache = OCRCache.from_env() if ocr_cache == 'env' else ocr_cache
+        # 所有页面共用一个OCR客户端（keep-alive 连接池 + 有界并发）
+        self.ocr_client = MathpixClient(
+            self.app_id, self.app_key,
+            url=ocr_url,
+            max_in_flight=ocr_concurrency,
+            timeout=ocr_timeout,
+            max_retries=ocr_retries,
+            cache=self.ocr_cache,
+            # OCR前处理（缩放/灰度/二值化/字节上限），默认按环境变量 OCR_PREPROCESS 等配置
+            preprocess=OCRPreprocessor.from_env() if ocr_preprocess == 'env' else ocr_preprocess
+        )
+        # detect → crop → OCR → classify 各阶段由共享的处理流程执行（见 pipeline.py）
+        self.pipeline = Pipeline(self.detector, ocr=self.ocr_client)
+        # 增量构建清单：模型权重或检测/OCR设置变化时，所有页面都会重新处理
+        self.manifest_dir = manifest_dir
+        model_file = Path(self.backend.model_path)
+        ocr_settings = dict(self.ocr_client.options)
+        if self.ocr_client.image_format != 'png':
+            # 有损编码会改变OCR的输入；PNG压缩级别不影响像素，不计入
+            ocr_settings['encoding'] = [self.ocr_client.image_format, self.ocr_client.quality]
+        if self.ocr_client.preprocess is not None:
+            ocr_settings['preprocess'] = self.ocr_client.preprocess.settings
+        detect_settings = {'imgsz': imgsz, 'ocr': ocr_settings}
+        if tile_size:
+            detect_settings['tiles'] = [tile_size, tile_overlap]
+        self.fingerprint = {
+            'model': self.backend.fingerprint or (sha256_file(model_file) if model_file.is_file() else str(model_file)),
+            'settings': sha256_json(detect_settings),
+        }
+        self.classifier_hash = sha256_file(question_classifier.__file__)
     
-    def process_paper(self, paper_folder: str, paper_id: str) -> dict:
-        """处理整份试卷"""
+    def process_paper(self, paper_folder: str, paper_id: str, timings: dict = None) -> dict:
+        """处理整份试卷；timings 不为空时累加各阶段耗时（秒）"""
         paper_path = Path(paper_folder)
         if not paper_path.exists():
             return {'error': f'Paper folder not found: {paper_folder}'}
@@ -30,94 +94,148 @@ class DatasetBuilder:
         # 获取所有页面图片，按页码数字排序
         page_files = sorted(paper_path.glob("page_*.png"), key=lambda p: int(p.stem.split('_')[1]))
         
+        sources = [
+            PageSource(page_file.name, sha256_file(page_file), partial(read_image, page_file))
+            for page_file in page_files
+        ]
+        # read_image（cv2.imread）线程安全，可在后台线程预读
+        return self._build_paper(paper_id, sources, threaded_load=True, timings=timings)
+    
+    def process_pdf(self, pdf_path: str, paper_id: str = None, dpi: int = DEFAULT_DPI,
+                    save_pages_dir: str = None, timings: dict = None) -> dict:
+        """
+        流式处理PDF试卷：页面直接渲染为NumPy数组送入检测器，不经过PNG中间文件。
+        封面和无用页面在渲染之前过滤；save_pages_dir 不为空时同时保存 page_{n}.png。
+        """
+        pdf_path = Path(pdf_path)
+        if not pdf_path.exists():
+            return {'error': f'PDF not found: {pdf_path}'}
+        
+        paper_id = paper_id or pdf_path.stem
+        print(f"📄 Processing paper: {paper_id} (streaming from {pdf_path.name})")
+        
+        if save_pages_dir is not None:
+            save_pages_dir = Path(save_pages_dir)
+            save_pages_dir.mkdir(parents=True, exist_ok=True)
+        pdf_hash = sha256_file(pdf_path)
+        
+        with fitz.open(pdf_path) as doc:
+            sources = []
+            for i, page in enumerate(doc):
+                reason = page_skip_reason(i, page)
+                if reason:
+                    print(f"  - Skipping page {i + 1} ({reason})")
+                    continue
+                filename = f"page_{i + 1}.png"
+                save_path = save_pages_dir / filename if save_pages_dir is not None else None
+                sources.append(PageSource(
+                    filename,
+                    sha256_json({'pdf': pdf_hash, 'page': i, 'dpi': dpi}),
+                    partial(render_page, page, dpi, save_path)
+                ))
+            # PyMuPDF 不是线程安全的，在当前线程中按需渲染
+            return self._build_paper(paper_id, sources, threaded_load=False, timings=timings)
+    
+    def _build_paper(self, paper_id: str, sources: list, threaded_load: bool, timings: dict = None) -> dict:
+        """
+        按 detect → crop → OCR → classify 处理所有页面并汇总为试卷结果。
+        启用清单时，已完成的页面直接复用记录的结果，只重新处理发生变化或未完成的页面。
+        """
         paper_result = {
             'paper_id': paper_id,
-            'total_pages': len(page_files),
+            'total_pages': len(sources),
             'questions': [],
             'processing_log': []
         }
         
-        classifier = QuestionClassifier(paper_id)
+        manifest = None
+        if self.manifest_dir is not None:
+            manifest = BuildManifest.for_paper(self.manifest_dir, paper_id, self.fingerprint)
+            manifest.prune(src.filename for src in sources)
+        keys = {src.filename: manifest.page_key(src.input_hash) if manifest else None for src in sources}
+        
+        def cached(src, stage):
+            return manifest.get_stage(src.filename, keys[src.filename], stage) if manifest else None
+        
+        def record(src, stage, result):
+            if manifest:
+                manifest.set_stage(src.filename, keys[src.filename], stage, result)
+        
+        # 只有尚未完成检测的页面才需要加载并送入批量检测
+        to_detect = [src for src in sources if cached(src, 'ocr') is None and cached(src, 'detect') is None]
+        if threaded_load:
+            loaded = self.detector.read_ahead((src, src.load) for src in to_detect)
+        else:
+            loaded = ((src, src.load()) for src in to_detect)
+        detected = self.pipeline.detect_images(loaded, page_hash=lambda src: src.input_hash, timings=timings)
+        
         all_analysis_results = []
         
-        for page_file in page_files:
-            print(f"  📑 Processing {page_file.name}...")
+        for src in sources:
+            print(f"  📑 Processing {src.filename}...")
+            page_results = cached(src, 'ocr')
+            
+            if page_results is not None:
+                print(f"    ♻️  Reusing stored results ({len(page_results)} regions)")
+            else:
+                boxes = cached(src, 'detect')
+                if boxes is None:
+                    _, img, boxes = next(detected)
+                    if img is None:
+                        print(f"    ❌ Error processing {src.filename}: could not read image")
+                        continue
+                    record(src, 'detect', boxes.tolist())
+                else:
+                    # 检测已完成（上次在OCR阶段中断），只需重新加载图像用于裁剪
+                    with self.pipeline.timed('load', timings):
+                        img = src.load()
+                    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+                
+                page_results, complete = self._ocr_page(
+                    src.filename, Path(src.filename).stem, img, boxes, timings=timings
+                )
+                # 有OCR请求失败时不标记完成，下次重跑会重试该页
+                if complete:
+                    record(src, 'ocr', page_results)
             
-            page_results = self._process_page(page_file, page_file.stem)
             if page_results:
                 all_analysis_results.extend(page_results)
                 paper_result['processing_log'].append({
-                    'page': page_file.name,
+                    'page': src.filename,
                     'detected_regions': len(page_results)
                 })
         
         # 分类所有检测到的问题
         if all_analysis_results:
-            questions = classifier.classify_regions(all_analysis_results)
-            paper_result['questions'] = [self._question_to_dict(q) for q in questions]
+            classify_hash = sha256_json({'regions': all_analysis_results, 'classifier': self.classifier_hash})
+            questions = manifest.get_classify(classify_hash) if manifest else None
+            if questions is None:
+                questions = [
+                    self._question_to_dict(q)
+                    for q in self.pipeline.classify(paper_id, all_analysis_results, timings)
+                ]
+                if manifest:
+                    manifest.set_classify(classify_hash, questions)
+            paper_result['questions'] = questions
         
         return paper_result
     
-    def _process_page(self, image_path: Path, page_name: str) -> list:
-        """处理单个页面"""
+    def _ocr_page(self, image_path, page_name: str, img, boxes, timings=None) -> tuple:
+        """
+        裁剪并OCR一个页面的所有检测框。
+        返回 (analysis_results, complete)；complete 为 False 表示有区域OCR失败。
+        """
         try:
-            # YOLO检测
-            results = self.model(str(image_path))
-            img = cv2.imread(str(image_path))
-            
-            analysis_results = []
+            # 按从上到下的顺序裁剪
+            regions = self.pipeline.crop(img, boxes, timings)
             
-            for r in results:
-                if r.boxes is not None:
-                    boxes = r.boxes.xyxy.cpu().numpy()
-                    # 按y坐标排序（从上到下）
-                    boxes = sorted(boxes, key=lambda x: x[1])
-                    
-                    for i, box in enumerate(boxes):
-                        x1, y1, x2, y2 = map(int, box)
-                        cropped_img = img[y1:y2, x1:x2]
-                        
-                        # Mathpix OCR
-                        ocr_result = self._ocr_image(cropped_img)
-                        
-                        if ocr_result and 'text' in ocr_result:
-                            analysis_results.append({
-                                'text': ocr_result['text'],
-                                'index': len(analysis_results),
-                                'page': page_name,
-                                'bbox': [x1, y1, x2, y2],
-                                'ocr_confidence': ocr_result.get('confidence', 0)
-                            })
-            
-            return analysis_results
+            # Mathpix OCR（并发请求，结果顺序与裁剪顺序一致）
+            complete = self.pipeline.recognize(regions, timings)
+            return analysis_results(regions, page_name), complete
             
         except Exception as e:
             print(f"    ❌ Error processing {image_path}: {e}")
-            return []
-    
-    def _ocr_image(self, img_array):
-        """对图像进行OCR"""
-        try:
-            # 编码图像
-            _, buffer = cv2.imencode('.png', img_array)
-            image_base64 = base64.b64encode(buffer).decode('utf-8')
-            
-            headers = {
-                'app_id': self.app_id,
-                'app_key': self.app_key,
-                'Content-type': 'application/json'
-            }
-            
-            data = {
-                'src': f'data:image/png;base64,{image_base64}',
-                'formats': ['text'],
-            }
-            
-            response = requests.post('https://api.mathpix.com/v3/text', headers=headers, json=data)
-            return response.json()
-            
-        except Exception as e:
-            return {'error': str(e)}
+            return [], False
     
     def _question_to_dict(self, question: Question) -> dict:
         """将Question对象转换为字典"""
@@ -125,63 +243,194 @@ class DatasetBuilder:
             'main_question_id': question.main_question_id,
             'paper_info': question.paper_info,
             'full_id': question.get_full_id(),
-            'main_part': {
+            'main_part': self._with_region({
                 'text': question.main_part.text,
                 'question_id': question.main_part.question_id,
                 'type': question.main_part.part_type
-            },
+            }, question.main_part),
             'sub_parts': [
-                {
+                self._with_region({
                     'text': sub.text,
                     'question_id': sub.question_id,
                     'sub_letter': sub.sub_letter,
                     'full_id': question.get_full_id(sub.sub_letter),
                     'type': sub.part_type
-                }
+                }, sub)
                 for sub in question.sub_parts
             ],
             'total_parts': 1 + len(question.sub_parts)
         }
+    
+    @staticmethod
+    def _with_region(part_dict: dict, part) -> dict:
+        """页面、检测框和OCR置信度只在已知时写出"""
+        for key in ('page', 'bbox', 'ocr_confidence'):
+            value = getattr(part, key)
+            if value is not None:
+                part_dict[key] = value
+        return part_dict
+
+def find_papers(args) -> list:
+    """根据命令行参数列出要处理的试卷：(paper_id, 类型, 路径)"""
+    papers = []
+    if args.pdf:
+        for pdf_path in sorted(glob.glob(args.pdf)):
+            papers.append((Path(pdf_path).stem, 'pdf', Path(pdf_path)))
+    else:
+        for folder in sorted(glob.glob(args.papers)):
+            folder = Path(folder)
+            if folder.is_dir() and any(folder.glob("page_*.png")):
+                papers.append((folder.name, 'folder', folder))
+    return papers
+
+
+def build_one(builder: DatasetBuilder, paper_id: str, kind: str, path: Path, args) -> dict:
+    """构建一份试卷并写出 <paper_id>_dataset.json，返回该试卷的索引条目"""
+    timings = {}
+    start = time.perf_counter()
+    
+    if args.rebuild and builder.manifest_dir is not None:
+        BuildManifest.path_for(builder.manifest_dir, paper_id).unlink(missing_ok=True)
+    if kind == 'pdf':
+        save_dir = Path(args.save_pages_dir) / paper_id if args.save_pages_dir else None
+        result = builder.process_pdf(path, paper_id, dpi=args.dpi, save_pages_dir=save_dir, timings=timings)
+    else:
+        result = builder.process_paper(path, paper_id, timings=timings)
+    
+    output_file = Path(args.output_dir) / f"{paper_id}_dataset.json"
+    with builder.pipeline.timed('write', timings):
+        if args.format in ('json', 'both'):
+            with open(output_file, 'w', encoding='utf-8') as f:
+                json.dump(result, f, indent=2, ensure_ascii=False)
+        if args.format in ('ndjson', 'both'):
+            ndjson_file = output_file.with_suffix(NDJSON_SUFFIX)
+            write_ndjson(result, ndjson_file)
+            if args.format == 'ndjson':
+                output_file = ndjson_file
+    
+    questions = result.get('questions', [])
+    return {
+        'paper_id': paper_id,
+        'source': str(path),
+        'output_file': str(output_file),
+        'error': result.get('error'),
+        'total_pages': result.get('total_pages', 0),
+        'questions': len(questions),
+        'sub_parts': sum(len(q['sub_parts']) for q in questions),
+        'seconds': round(time.perf_counter() - start, 3),
+        'stages': {stage: round(seconds, 3) for stage, seconds in timings.items()}
+    }
+
 
 def main():
-    """主函数"""
-    print("🏗️  构建9709_s20_qp_41数据集")
+    """主函数：批量构建 data/raw_images 下的所有试卷（模型只加载一次）"""
+    parser = argparse.ArgumentParser(description="构建试卷数据集")
+    parser.add_argument('--papers', default="data/raw_images/*",
+                        help="试卷页面文件夹的glob，默认处理 data/raw_images 下的全部试卷")
+    parser.add_argument('--pdf', help="PDF文件的glob；指定时直接从PDF流式构建，不经过中间PNG文件")
+    parser.add_argument('--save-pages-dir', help="流式模式下同时把页面保存到 <目录>/<paper_id>/（可选）")
+    parser.add_argument('--dpi', type=int, default=DEFAULT_DPI, help="PDF渲染分辨率")
+    parser.add_argument('--output-dir', default=".", help="数据集JSON和索引的输出目录")
+    parser.add_argument('--workers', type=int, default=2, help="同时处理的试卷数（--pdf 模式下固定为 1）")
+    parser.add_argument('--model', default="models/pastpaper_detector_demo/weights/best.pt")
+    parser.add_argument('--backend', choices=BACKENDS, default=None,
+                        help="检测后端，默认取环境变量 DETECTOR_BACKEND（auto：按模型文件后缀选择）")
+    parser.add_argument('--tile-size', type=int, default=DEFAULT_TILE_SIZE,
+                        help="滑窗检测的方块边长（页面像素），0 为整页检测；默认取环境变量 DETECT_TILE_SIZE")
+    parser.add_argument('--tile-overlap', type=float, default=DEFAULT_TILE_OVERLAP, help="相邻方块的重叠比例")
+    parser.add_argument('--rebuild', action='store_true', help="忽略增量构建清单，所有页面重新处理")
+    parser.add_argument('--format', choices=['json', 'ndjson', 'both'], default='json',
+                        help="输出格式：JSON（查看器使用）、逐行一题的NDJSON，或两者都写")
+    parser.add_argument('--timing-report', help="各阶段延迟分布的JSON报告，默认 <output-dir>/timing_report.json")
+    parser.add_argument('--search-index', default=str(DEFAULT_INDEX_PATH), help="全文检索索引文件")
+    parser.add_argument('--no-search-index', action='store_true', help="构建后不更新全文检索索引")
+    args = parser.parse_args()
+    
+    papers = find_papers(args)
+    if not papers:
+        print(f"❌ 没有找到试卷: {args.pdf or args.papers}")
+        return
+    Path(args.output_dir).mkdir(parents=True, exist_ok=True)
+    
+    print(f"🏗️  构建 {len(papers)} 份试卷的数据集")
     print("=" * 60)
     
-    # 配置
-    model_path = "models/pastpaper_detector_demo/weights/best.pt"
-    paper_folder = "data/raw_images/9709_s20_qp_41"
-    paper_id = "9709_s20_qp_41"
-    output_file = "9709_s20_qp_41_dataset.json"
+    # 模型只加载一次（第一次检测缓存未命中时），所有试卷共用；页面检测串行执行，OCR 共用同一个有界连接池
+    start = time.perf_counter()
+    builder = DatasetBuilder(args.model, backend=args.backend, tile_size=args.tile_size,
+                             tile_overlap=args.tile_overlap)
+    model_load_seconds = time.perf_counter() - start
     
-    # 构建数据集
-    builder = DatasetBuilder(model_path)
-    result = builder.process_paper(paper_folder, paper_id)
+    workers = max(1, args.workers)
+    if args.pdf and workers > 1:
+        # PyMuPDF 不是线程安全的（即使是不同的文档），流式模式下逐份试卷处理
+        print(f"⚠️  --pdf 模式下 PDF 渲染不能并发，忽略 --workers {workers}，逐份处理试卷")
+        workers = 1
     
-    # 保存结果
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(result, f, indent=2, ensure_ascii=False)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="paper") as pool:
+        futures = [pool.submit(build_one, builder, paper_id, kind, path, args) for paper_id, kind, path in papers]
+        entries = []
+        for (paper_id, _, _), future in zip(papers, futures):
+            try:
+                entries.append(future.result())
+            except Exception as e:
+                print(f"    ❌ Error building {paper_id}: {e}")
+                entries.append({'paper_id': paper_id, 'error': str(e)})
+    
+    index = {
+        'generated_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'model': builder.backend.model_path,
+        'backend': builder.backend.name,
+        'model_loaded': builder.backend.loaded,
+        'tile_size': args.tile_size,
+        'model_load_seconds': round(model_load_seconds, 3),
+        'total_seconds': round(time.perf_counter() - start, 3),
+        'papers': entries
+    }
+    index_file = Path(args.output_dir) / "datasets_index.json"
+    with open(index_file, 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=2, ensure_ascii=False)
+    # 各操作和阶段的延迟分布（次数、均值、p50/p95/p99、最大值），以及每页检测框数和OCR失败计数
+    timing_file = REGISTRY.write_report(
+        args.timing_report or Path(args.output_dir) / "timing_report.json",
+        model=index['model'], backend=index['backend'], tile_size=args.tile_size, papers=len(entries),
+        total_seconds=index['total_seconds']
+    )
     
     print(f"\n✅ 数据集构建完成!")
-    print(f"📁 输出文件: {output_file}")
+    print(f"📁 索引文件: {index_file}")
+    print(f"⏱️  计时报告: {timing_file}")
     
     # 显示摘要
-    if 'questions' in result:
-        print(f"📊 统计信息:")
-        print(f"   - 总页数: {result['total_pages']}")
-        print(f"   - 检测到的主题: {len(result['questions'])}")
-        
-        total_sub_parts = sum(len(q['sub_parts']) for q in result['questions'])
-        print(f"   - 总子题数: {total_sub_parts}")
-        
-        print(f"\n📋 题目列表:")
-        for q in result['questions']:
-            main_id = q['main_question_id']
-            sub_count = len(q['sub_parts'])
-            sub_letters = [s['sub_letter'] for s in q['sub_parts']]
-            print(f"   Q{main_id}: {sub_count} 个子题 {sub_letters}")
-    
-    print(f"\n🔍 查看完整结果: cat {output_file}")
+    print(f"📊 统计信息 (模型加载 {model_load_seconds:.1f}s, 总耗时 {index['total_seconds']:.1f}s):")
+    for entry in entries:
+        if entry.get('error'):
+            print(f"   ❌ {entry['paper_id']}: {entry['error']}")
+            continue
+        stages = ', '.join(f"{stage} {seconds:.1f}s" for stage, seconds in entry['stages'].items())
+        print(f"   {entry['paper_id']}: {entry['total_pages']} 页, {entry['questions']} 个主题, "
+              f"{entry['sub_parts']} 个子题, {entry['seconds']:.1f}s ({stages})")
+    for row in OPERATION_SECONDS.report():
+        print(f"   ⏱️  {row['labels']['operation']}: {row['count']} 次, "
+              f"p50 {row['p50'] * 1000:.0f}ms, p95 {row['p95'] * 1000:.0f}ms, 最大 {row['max'] * 1000:.0f}ms")
+    
+    if builder.backend.cache is not None:
+        stats = builder.backend.cache.stats()
+        loaded = "已加载模型" if builder.backend.loaded else "未加载模型"
+        print(f"\n🎯 检测缓存: 命中 {stats['hits']} / 未命中 {stats['misses']} (共 {stats['entries']} 条, {loaded})")
+    
+    if builder.ocr_cache is not None:
+        stats = builder.ocr_cache.stats()
+        print(f"💾 OCR缓存: 命中 {stats['hits']} / 未命中 {stats['misses']} (共 {stats['entries']} 条)")
+    
+    if not args.no_search_index:
+        # 只有内容变化的试卷会被重新索引
+        search_index = SearchIndex(args.search_index)
+        counts = search_index.update([e['output_file'] for e in entries if not e.get('error')])
+        stats = search_index.stats()
+        search_index.close()
+        print(f"🔎 检索索引: 新增 {counts.get('added', 0)}, 更新 {counts.get('updated', 0)}, "
+              f"共 {stats['papers']} 份试卷 / {stats['parts']} 个题目部分")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
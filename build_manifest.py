@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+# 默认位置：项目根目录下的 .cache/builds/<paper_id>.manifest.json
+DEFAULT_MANIFEST_DIR = Path(__file__).resolve().parent / ".cache" / "builds"
+MANIFEST_VERSION = 1
+PAGE_STAGES = ('detect', 'ocr')
+
+
+def sha256_file(path, chunk_size=1 << 20) -> str:
+    """计算文件内容的SHA-256"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def sha256_json(obj) -> str:
+    """对可JSON序列化的对象做规范化哈希"""
+    return hashlib.sha256(json.dumps(obj, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class BuildManifest:
+    """
+    记录每页各阶段（detect / ocr）的完成情况及结果，以及整份试卷的 classify 结果。
+    每页的结果以 (页面内容哈希, 模型权重哈希, 设置哈希) 为键，任一变化都会使该页重新处理。
+    """
+
+    def __init__(self, path, fingerprint: dict):
+        self.path = Path(path)
+        self.fingerprint = fingerprint
+        self.data = {'version': MANIFEST_VERSION, 'pages': {}, 'classify': None}
+
+        if self.path.exists():
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') == MANIFEST_VERSION:
+                    self.data = data
+            except (OSError, ValueError) as e:
+                print(f"    ⚠️  Ignoring unreadable manifest {self.path}: {e}")
+
+    @staticmethod
+    def path_for(manifest_dir, paper_id: str) -> Path:
+        return Path(manifest_dir) / f"{paper_id}.manifest.json"
+
+    @classmethod
+    def for_paper(cls, manifest_dir, paper_id: str, fingerprint: dict):
+        return cls(cls.path_for(manifest_dir, paper_id), fingerprint)
+
+    def page_key(self, input_hash: str) -> str:
+        """页面缓存键：页面内容 + 模型 + 设置"""
+        return sha256_json({'input': input_hash, **self.fingerprint})
+
+    def get_stage(self, page: str, key: str, stage: str):
+        """返回该页某阶段的结果；未完成或键已变化时返回 None"""
+        entry = self.data['pages'].get(page)
+        if not entry or entry.get('key') != key:
+            return None
+        return entry['stages'].get(stage)
+
+    def set_stage(self, page: str, key: str, stage: str, result):
+        """记录阶段结果并立即落盘，中断后可从这里续跑"""
+        entry = self.data['pages'].get(page)
+        if not entry or entry.get('key') != key:
+            entry = {'key': key, 'stages': {}}
+            self.data['pages'][page] = entry
+        entry['stages'][stage] = result
+        entry['updated_at'] = time.time()
+        self.save()
+
+    def get_classify(self, input_hash: str):
+        """返回分类结果；输入（所有页面的OCR结果 + 分类器版本）变化时返回 None"""
+        classify = self.data.get('classify')
+        if classify and classify.get('input_hash') == input_hash:
+            return classify['questions']
+        return None
+
+    def set_classify(self, input_hash: str, questions: list):
+        self.data['classify'] = {'input_hash': input_hash, 'questions': questions}
+        self.save()
+
+    def prune(self, pages):
+        """删除已不存在的页面记录"""
+        keep = set(pages)
+        removed = [page for page in self.data['pages'] if page not in keep]
+        for page in removed:
+            del self.data['pages'][page]
+        if removed:
+            self.save()
+
+    def save(self):
+        """原子写入：先写临时文件再替换"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,316 @@
+import argparse
+import functools
+import glob
+import json
+import operator
+import time
+from pathlib import Path
+
+from corpus_reader import scan_dataset, split_full_id
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:  # 可选依赖：只有导出/读取列式归档时需要
+    pa = pc = pq = None
+
+# 列式归档：整个语料一个Parquet文件，每个题目部分（主题/子题）一行。
+# 试卷、考试季等重复值使用字典编码；试卷按 paper_id 排序写入，
+# 按 paper_id / 题目ID 查询时可借助行组统计信息跳过无关行组（谓词下推）。
+# 试卷级字段（total_pages、processing_log 等）保存在文件的键值元数据中，
+# 因此可以从归档还原出与 DatasetBuilder 输出一致的 *_dataset.json。
+
+ARCHIVE_VERSION = '1'
+PAPERS_METADATA_KEY = b'corpus_archive.papers'
+VERSION_METADATA_KEY = b'corpus_archive.version'
+DEFAULT_ROW_GROUP_SIZE = 8192
+
+# 列名 -> 是否字典编码
+_STRING_COLUMNS = {
+    'paper_id': True,
+    'session': True,
+    'paper_info': True,
+    'main_question_id': True,
+    'part_type': True,
+    'question_id': False,
+    'sub_letter': True,
+    'full_id': False,
+    'text': False,
+    'page': True,
+}
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("The columnar archive needs pyarrow: pip install pyarrow")
+
+
+def archive_schema():
+    """归档的Arrow模式"""
+    _require_pyarrow()
+    dictionary = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        ('paper_id', dictionary),
+        ('session', dictionary),       # 考试季，如 "s20"
+        ('paper_info', dictionary),
+        ('question_index', pa.int32()),  # 题目在试卷中的顺序
+        ('main_question_id', dictionary),
+        ('part_index', pa.int16()),    # 0 为主题，1.. 为子题
+        ('part_type', dictionary),
+        ('question_id', pa.string()),
+        ('sub_letter', dictionary),
+        ('full_id', pa.string()),
+        ('text', pa.string()),
+        ('page', dictionary),
+        ('bbox', pa.list_(pa.int32(), 4)),
+        ('ocr_confidence', pa.float64()),
+    ])
+
+
+def session_of(paper_id: str):
+    """"9709_s20_qp_11" -> "s20" """
+    parts = paper_id.split('_')
+    return parts[1] if len(parts) > 2 else None
+
+
+def _part_row(paper_id, session, question_index, question, part_index, part, full_id):
+    return {
+        'paper_id': paper_id,
+        'session': session,
+        'paper_info': question['paper_info'],
+        'question_index': question_index,
+        'main_question_id': question['main_question_id'],
+        'part_index': part_index,
+        'part_type': part.get('type'),
+        'question_id': part['question_id'],
+        'sub_letter': part.get('sub_letter'),
+        'full_id': full_id,
+        'text': part['text'],
+        'page': part.get('page'),
+        'bbox': part.get('bbox'),
+        'ocr_confidence': part.get('ocr_confidence'),
+    }
+
+
+class _RowBuffer:
+    """按列累积行，攒满一个行组后写出"""
+
+    def __init__(self, writer, schema, row_group_size):
+        self.writer = writer
+        self.schema = schema
+        self.row_group_size = row_group_size
+        self.columns = {name: [] for name in schema.names}
+        self.rows = 0
+
+    def append(self, row: dict):
+        for name, column in self.columns.items():
+            column.append(row[name])
+        self.rows += 1
+        if self.rows >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        arrays = []
+        for field in self.schema:
+            values = self.columns[field.name]
+            if _STRING_COLUMNS.get(field.name):
+                arrays.append(pa.array(values, type=pa.string()).dictionary_encode())
+            else:
+                arrays.append(pa.array(values, type=field.type))
+        self.writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema),
+                                row_group_size=self.row_group_size)
+        self.columns = {name: [] for name in self.schema.names}
+        self.rows = 0
+
+
+def export_archive(dataset_paths, archive_path, row_group_size=DEFAULT_ROW_GROUP_SIZE) -> dict:
+    """
+    把数据集文件（JSON或NDJSON）流式写入一个Parquet归档，返回统计信息。
+    同一 paper_id 出现多次时以最后一个文件为准。
+    """
+    _require_pyarrow()
+    # 先只读取试卷ID，按 paper_id 排序写入，使行组统计信息对谓词下推有效
+    sources = {}
+    for path in dataset_paths:
+        paper_id = next((e[2] for e in scan_dataset(path) if e[0] == 'field' and e[1] == 'paper_id'), None)
+        if paper_id:
+            sources[paper_id] = path
+        else:
+            print(f"  ⚠️  Skipping {path}: no paper_id")
+
+    schema = archive_schema()
+    papers = {}
+    rows = 0
+    archive_path = Path(archive_path)
+    archive_path.parent.mkdir(parents=True, exist_ok=True)
+    with pq.ParquetWriter(str(archive_path), schema, compression='zstd') as writer:
+        buffer = _RowBuffer(writer, schema, row_group_size)
+        for paper_id in sorted(sources):
+            session = session_of(paper_id)
+            fields, order, question_index = {}, [], 0
+            for event in scan_dataset(sources[paper_id]):
+                if event[0] == 'field':
+                    fields[event[1]] = event[2]
+                    order.append(event[1])
+                elif event[0] == 'questions':
+                    order.append('questions')
+                else:
+                    question = event[1]
+                    buffer.append(_part_row(paper_id, session, question_index, question, 0,
+                                            question['main_part'], question['full_id']))
+                    for part_index, sub in enumerate(question.get('sub_parts', []), start=1):
+                        buffer.append(_part_row(paper_id, session, question_index, question, part_index,
+                                                sub, sub['full_id']))
+                    rows += 1 + len(question.get('sub_parts', []))
+                    question_index += 1
+            papers[paper_id] = {'order': order, 'fields': fields, 'questions': question_index}
+        buffer.flush()
+        writer.add_key_value_metadata({
+            VERSION_METADATA_KEY: ARCHIVE_VERSION,
+            PAPERS_METADATA_KEY: json.dumps(papers, ensure_ascii=False),
+        })
+    return {'papers': len(papers), 'rows': rows}
+
+
+class CorpusArchive:
+    """读取列式归档：按试卷或题目ID查询（谓词下推），或还原出原始的数据集JSON"""
+
+    def __init__(self, path):
+        _require_pyarrow()
+        self.path = str(path)
+        metadata = pq.ParquetFile(self.path).metadata.metadata or {}
+        self._papers = json.loads(metadata.get(PAPERS_METADATA_KEY, b'{}'))
+
+    def papers(self) -> list:
+        return sorted(self._papers)
+
+    def paper_fields(self, paper_id: str) -> dict:
+        """试卷级字段（total_pages、processing_log 等）"""
+        return dict(self._papers[paper_id]['fields'])
+
+    def read(self, paper_id=None, question_id: str = None, columns=None, filter=None):
+        """
+        读取满足条件的行，返回 pyarrow.Table。
+        paper_id 可为单个ID或列表；question_id 为完整ID，主题ID（..._Q4）返回该题所有部分，
+        子题ID（..._Q4(b)）只返回该部分；filter 为额外的 pyarrow.compute 表达式。
+        """
+        conditions = []
+        if paper_id is not None:
+            paper_ids = [paper_id] if isinstance(paper_id, str) else list(paper_id)
+            conditions.append(pc.field('paper_id').isin(paper_ids))
+        if question_id is not None:
+            pid, main_question_id = split_full_id(question_id)
+            conditions.append(pc.field('paper_id') == pid)
+            conditions.append(pc.field('main_question_id') == main_question_id)
+            if question_id != f"{pid}_Q{main_question_id}":
+                conditions.append(pc.field('full_id') == question_id)
+        if filter is not None:
+            conditions.append(filter)
+        expression = functools.reduce(operator.and_, conditions) if conditions else None
+        return pq.read_table(self.path, columns=columns, filters=expression)
+
+    def to_dataset(self, paper_id: str) -> dict:
+        """还原单份试卷的数据集字典（与 DatasetBuilder 输出的结构和键顺序一致）"""
+        paper = self._papers[paper_id]
+        rows = self.read(paper_id=paper_id).to_pylist() if paper['questions'] else []
+        rows.sort(key=lambda r: (r['question_index'], r['part_index']))
+
+        questions = []
+        for row in rows:
+            if row['part_index'] == 0:
+                questions.append({
+                    'main_question_id': row['main_question_id'],
+                    'paper_info': row['paper_info'],
+                    'full_id': row['full_id'],
+                    'main_part': _part_dict(row, {
+                        'text': row['text'],
+                        'question_id': row['question_id'],
+                        'type': row['part_type']
+                    }),
+                    'sub_parts': [],
+                })
+            else:
+                questions[-1]['sub_parts'].append(_part_dict(row, {
+                    'text': row['text'],
+                    'question_id': row['question_id'],
+                    'sub_letter': row['sub_letter'],
+                    'full_id': row['full_id'],
+                    'type': row['part_type']
+                }))
+        for question in questions:
+            question['total_parts'] = 1 + len(question['sub_parts'])
+
+        fields = paper['fields']
+        return {key: questions if key == 'questions' else fields[key] for key in paper['order']}
+
+    def write_json(self, output_dir, paper_ids=None) -> list:
+        """把归档还原为 <paper_id>_dataset.json 文件"""
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        written = []
+        for paper_id in paper_ids or self.papers():
+            output_file = output_dir / f"{paper_id}_dataset.json"
+            with open(output_file, 'w', encoding='utf-8') as f:
+                json.dump(self.to_dataset(paper_id), f, indent=2, ensure_ascii=False)
+            written.append(output_file)
+        return written
+
+
+def _part_dict(row: dict, part: dict) -> dict:
+    for key in ('page', 'bbox', 'ocr_confidence'):
+        if row[key] is not None:
+            part[key] = row[key]
+    return part
+
+
+def main():
+    parser = argparse.ArgumentParser(description="题目语料的列式归档（Parquet）")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    export = sub.add_parser('export', help="把数据集导出为Parquet归档")
+    export.add_argument('--datasets', default="*_dataset.json", help="数据集文件的glob模式")
+    export.add_argument('--output', default="corpus.parquet")
+    export.add_argument('--row-group-size', type=int, default=DEFAULT_ROW_GROUP_SIZE)
+
+    to_json = sub.add_parser('to-json', help="从归档还原 *_dataset.json")
+    to_json.add_argument('--archive', default="corpus.parquet")
+    to_json.add_argument('--output-dir', default="restored")
+    to_json.add_argument('--paper', action='append', help="只还原指定试卷，可重复")
+
+    query = sub.add_parser('query', help="按试卷或题目ID查询")
+    query.add_argument('--archive', default="corpus.parquet")
+    query.add_argument('--paper')
+    query.add_argument('--question', help="完整题目ID，如 9709_s20_qp_11_Q4(b)")
+
+    stats = sub.add_parser('stats', help="按考试季和类型统计题目部分数")
+    stats.add_argument('--archive', default="corpus.parquet")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == 'export':
+        paths = [p for p in sorted(glob.glob(args.datasets)) if not p.endswith('.offsets.json')]
+        result = export_archive(paths, args.output, row_group_size=args.row_group_size)
+        print(f"✅ 导出 {result['papers']} 份试卷, {result['rows']} 行 -> {args.output} "
+              f"({time.perf_counter() - start:.2f}s)")
+    elif args.command == 'to-json':
+        written = CorpusArchive(args.archive).write_json(args.output_dir, args.paper)
+        print(f"✅ 还原 {len(written)} 个数据集到 {args.output_dir}")
+    elif args.command == 'query':
+        table = CorpusArchive(args.archive).read(paper_id=args.paper, question_id=args.question,
+                                                  columns=['full_id', 'part_type', 'text'])
+        print(f"🔎 {table.num_rows} 行 ({(time.perf_counter() - start) * 1000:.1f} ms)")
+        for row in table.to_pylist():
+            print(f"   {row['full_id']} ({row['part_type']}): {row['text'][:80]!r}")
+    else:
+        table = CorpusArchive(args.archive).read(columns=['session', 'part_type'])
+        table = table.cast(pa.schema([('session', pa.string()), ('part_type', pa.string())]))
+        counts = table.group_by(['session', 'part_type']).aggregate([([], 'count_all')])
+        for row in sorted(counts.to_pylist(), key=lambda r: (r['session'] or '', r['part_type'] or '')):
+            print(f"   {row['session']}  {row['part_type']:4}  {row['count_all']}")
+
+
+if __name__ == "__main__":
+    main()
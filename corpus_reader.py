@@ -0,0 +1,381 @@
+import argparse
+import codecs
+import glob
+import json
+import os
+import re
+import time
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+
+# 流式读取题目数据集：逐题解析 *_dataset.json 的 questions 数组（或逐行读取 NDJSON 变体），
+# 内存占用与单个题目大小有关，与文件和语料规模无关。
+# 每个数据集旁边可生成一个偏移量索引 <name>.offsets.json，按题目ID直接 seek 读取。
+
+CHUNK_SIZE = 64 * 1024
+OFFSETS_VERSION = 1
+NDJSON_SUFFIX = '.ndjson'
+_WHITESPACE_RE = re.compile(r'[ \t\n\r]*')
+
+
+class _JSONStream:
+    """在分块读取的UTF-8文件上用 raw_decode 逐个解码JSON值，并跟踪字节偏移量"""
+
+    def __init__(self, f, chunk_size=None):
+        self.f = f
+        self.chunk_size = chunk_size or CHUNK_SIZE
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.buf = ''
+        self.pos = 0
+        self.offset = 0  # buf[pos] 在文件中的字节偏移量
+        self._ascii = True  # 缓冲区全为ASCII时字符数即字节数
+        self.eof = False
+
+    def _fill(self) -> bool:
+        """读入下一块；已解析的部分只在这里丢弃，避免每个值都复制缓冲区"""
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            text = self._utf8.decode(b'', final=True)
+        else:
+            text = self._utf8.decode(chunk)
+        self.buf = self.buf[self.pos:] + text
+        self.pos = 0
+        self._ascii = self.buf.isascii()
+        return bool(chunk)
+
+    def _advance(self, end: int):
+        if self._ascii:
+            self.offset += end - self.pos
+        else:
+            self.offset += len(self.buf[self.pos:end].encode('utf-8'))
+        self.pos = end
+
+    def peek(self) -> str:
+        """跳过空白，返回下一个字符（文件结束时返回空串）"""
+        while True:
+            buf = self.buf
+            pos = _WHITESPACE_RE.match(buf, self.pos).end()
+            self._advance(pos)
+            if pos < len(buf):
+                return buf[pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, ch: str):
+        found = self.peek()
+        if found != ch:
+            raise ValueError(f"Expected {ch!r} at byte {self.offset}, found {found!r}")
+        self._advance(self.pos + 1)
+
+    def value(self) -> Tuple[object, int, int]:
+        """解码下一个JSON值，返回 (值, 起始字节, 字节长度)"""
+        self.peek()
+        while True:
+            try:
+                obj, end = self._decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                # 值跨越了分块边界，继续读取
+                if self._fill():
+                    continue
+                raise
+            # 数字等在缓冲区末尾结束的值可能尚未读完整
+            if end == len(self.buf) and self._fill():
+                continue
+            start = self.offset
+            self._advance(end)
+            return obj, start, self.offset - start
+
+
+def _scan_json(path) -> Iterator[tuple]:
+    """
+    逐项扫描数据集JSON：顶层字段产生 ('field', 键, 值)，questions 数组开始时产生 ('questions',)，
+    数组中的每个题目产生 ('question', 题目, 起始字节, 字节长度)
+    """
+    with open(path, 'rb') as f:
+        stream = _JSONStream(f)
+        stream.expect('{')
+        if stream.peek() == '}':
+            return
+        while True:
+            key, _, _ = stream.value()
+            stream.expect(':')
+            if key == 'questions' and stream.peek() == '[':
+                stream.expect('[')
+                yield ('questions',)
+                if stream.peek() == ']':
+                    stream.expect(']')
+                else:
+                    while True:
+                        question, start, length = stream.value()
+                        yield 'question', question, start, length
+                        if stream.peek() == ',':
+                            stream.expect(',')
+                            continue
+                        stream.expect(']')
+                        break
+            else:
+                value, _, _ = stream.value()
+                yield 'field', key, value
+            if stream.peek() == ',':
+                stream.expect(',')
+                continue
+            stream.expect('}')
+            return
+
+
+def _scan_ndjson(path) -> Iterator[tuple]:
+    """NDJSON变体：第一行为试卷信息（除 questions 外的所有字段），其后每行一个题目"""
+    with open(path, 'rb') as f:
+        offset = 0
+        header_read = False
+        for line in f:
+            start, offset = offset, offset + len(line)
+            if not line.strip():
+                continue
+            obj = json.loads(line)
+            if not header_read:
+                header_read = True
+                for key, value in obj.items():
+                    yield 'field', key, value
+                yield ('questions',)
+            else:
+                yield 'question', obj, start, len(line.rstrip(b'\r\n'))
+
+
+def scan_dataset(path) -> Iterator[tuple]:
+    """按文件中的顺序产出 ('field', 键, 值)、('questions',) 和 ('question', 题目, 起始字节, 字节长度)"""
+    if str(path).endswith(NDJSON_SUFFIX):
+        return _scan_ndjson(path)
+    return _scan_json(path)
+
+
+def iter_questions(path) -> Iterator[dict]:
+    """逐个产出数据集中的题目，不把整个文件读入内存"""
+    for event in scan_dataset(path):
+        if event[0] == 'question':
+            yield event[1]
+
+
+def read_dataset(path) -> Tuple[dict, Iterator[dict]]:
+    """
+    返回 (试卷信息, 题目迭代器)。试卷信息包含 questions 之前的顶层字段
+    （DatasetBuilder 的输出中即 paper_id、total_pages）。
+    """
+    events = scan_dataset(path)
+    header = {}
+    for event in events:
+        if event[0] == 'field':
+            header[event[1]] = event[2]
+            continue
+
+        def questions():
+            for rest in events:
+                if rest[0] == 'question':
+                    yield rest[1]
+        return header, questions()
+    return header, iter(())
+
+
+def read_header(path) -> dict:
+    """只读取 questions 之前的顶层字段"""
+    header = {}
+    events = scan_dataset(path)
+    try:
+        for event in events:
+            if event[0] != 'field':
+                break
+            header[event[1]] = event[2]
+    finally:
+        events.close()
+    return header
+
+
+def read_fields(path) -> dict:
+    """读取除 questions 外的全部顶层字段（需要扫描整个文件，内存占用仍与题目数量无关）"""
+    return {event[1]: event[2] for event in scan_dataset(path) if event[0] == 'field'}
+
+
+def write_ndjson(dataset: dict, path):
+    """写出NDJSON变体：第一行试卷信息，其后每行一个题目（questions 可以是任意可迭代对象）"""
+    header = {key: value for key, value in dataset.items() if key != 'questions'}
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(header, ensure_ascii=False) + '\n')
+        for question in dataset.get('questions', []):
+            f.write(json.dumps(question, ensure_ascii=False) + '\n')
+
+
+def split_full_id(full_id: str) -> Tuple[str, str]:
+    """"9709_s20_qp_11_Q4(b)" -> ("9709_s20_qp_11", "4")"""
+    paper_id, _, question_id = full_id.rpartition('_Q')
+    return paper_id, question_id.split('(', 1)[0]
+
+
+def offsets_path(path) -> Path:
+    path = Path(path)
+    return path.with_name(path.name + '.offsets.json')
+
+
+def build_offset_index(path) -> dict:
+    """扫描一遍数据集，记录每个题目的字节范围，写入 <name>.offsets.json"""
+    stat = os.stat(path)
+    index = {
+        'version': OFFSETS_VERSION,
+        'source_size': stat.st_size,
+        'source_mtime_ns': stat.st_mtime_ns,
+        'header': {},
+        'questions': {}
+    }
+    for event in scan_dataset(path):
+        if event[0] == 'field':
+            # 只保留标量字段，processing_log 等列表不进索引
+            if not isinstance(event[2], (list, dict)):
+                index['header'][event[1]] = event[2]
+        elif event[0] == 'question':
+            _, question, start, length = event
+            index['questions'].setdefault(question['main_question_id'], [start, length])
+
+    target = offsets_path(path)
+    tmp_path = target.with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False)
+    os.replace(tmp_path, target)
+    return index
+
+
+def load_offset_index(path) -> dict:
+    """读取偏移量索引；数据集文件大小或修改时间变化时重新生成"""
+    target = offsets_path(path)
+    stat = os.stat(path)
+    try:
+        with open(target, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        if (index.get('version') == OFFSETS_VERSION and index['source_size'] == stat.st_size
+                and index['source_mtime_ns'] == stat.st_mtime_ns):
+            return index
+    except (OSError, ValueError, KeyError):
+        pass
+    return build_offset_index(path)
+
+
+class CorpusReader:
+    """
+    按需读取整个语料：试卷列表只保存文件路径，题目逐个流式产出，
+    按ID读取时通过偏移量索引直接 seek 到对应题目。
+    """
+
+    def __init__(self, pattern: str = "*_dataset.json"):
+        self.pattern = pattern
+        self._paths = None
+        self._offsets = {}  # 路径 -> 偏移量索引
+
+    @property
+    def paths(self) -> dict:
+        """paper_id -> 数据集路径；同一试卷同时有JSON和NDJSON时优先NDJSON"""
+        if self._paths is None:
+            paths = {}
+            for path in sorted(glob.glob(self.pattern)):
+                if path.endswith('.offsets.json'):
+                    continue
+                paper_id = self._paper_id_for(path)
+                if paper_id and (paper_id not in paths or path.endswith(NDJSON_SUFFIX)):
+                    paths[paper_id] = path
+            self._paths = paths
+        return self._paths
+
+    @staticmethod
+    def _paper_id_for(path) -> Optional[str]:
+        # DatasetBuilder 的命名约定：<paper_id>_dataset.json / .ndjson
+        stem = Path(path).name.rsplit('.', 1)[0]
+        if stem.endswith('_dataset'):
+            return stem[:-len('_dataset')]
+        return read_header(path).get('paper_id')
+
+    def papers(self) -> list:
+        return sorted(self.paths)
+
+    def _offset_index(self, path) -> dict:
+        """缓存已加载的偏移量索引，数据集文件变化时重新加载"""
+        stat = os.stat(path)
+        index = self._offsets.get(path)
+        if index is None or (index['source_size'], index['source_mtime_ns']) != (stat.st_size, stat.st_mtime_ns):
+            index = self._offsets[path] = load_offset_index(path)
+        return index
+
+    def paper_header(self, paper_id: str) -> Optional[dict]:
+        path = self.paths.get(paper_id)
+        return self._offset_index(path)['header'] if path else None
+
+    def iter_questions(self, paper_id: str = None) -> Iterator[dict]:
+        """流式产出某份试卷（或全部试卷）的题目"""
+        paper_ids = [paper_id] if paper_id else self.papers()
+        for pid in paper_ids:
+            path = self.paths.get(pid)
+            if path:
+                yield from iter_questions(path)
+
+    def get_question(self, full_id: str) -> Optional[dict]:
+        """按ID读取单个题目（子题ID返回其所属的整道题）"""
+        paper_id, question_id = split_full_id(full_id)
+        path = self.paths.get(paper_id)
+        if not path:
+            return None
+        span = self._offset_index(path)['questions'].get(question_id)
+        if span is None:
+            return None
+        with open(path, 'rb') as f:
+            f.seek(span[0])
+            return json.loads(f.read(span[1]))
+
+    def get_part(self, full_id: str) -> Optional[dict]:
+        """按完整ID读取单个题目部分（主题或子题）"""
+        question = self.get_question(full_id)
+        if question is None:
+            return None
+        if question.get('full_id') == full_id:
+            return question['main_part']
+        for sub in question.get('sub_parts', []):
+            if sub.get('full_id') == full_id:
+                return sub
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="流式读取题目数据集")
+    parser.add_argument('--datasets', default="*_dataset.json", help="数据集文件的glob模式")
+    parser.add_argument('--get', help="按完整ID读取题目，如 9709_s20_qp_11_Q4(b)")
+    parser.add_argument('--to-ndjson', action='store_true', help="把JSON数据集转换为NDJSON变体")
+    args = parser.parse_args()
+
+    reader = CorpusReader(args.datasets)
+    if args.get:
+        part = reader.get_part(args.get)
+        print(json.dumps(part, indent=2, ensure_ascii=False) if part else f"❌ 未找到: {args.get}")
+        return
+
+    if args.to_ndjson:
+        for paper_id, path in reader.paths.items():
+            if path.endswith(NDJSON_SUFFIX):
+                continue
+            target = Path(path).with_suffix(NDJSON_SUFFIX)
+            write_ndjson({**read_fields(path), 'questions': iter_questions(path)}, target)
+            print(f"✅ {paper_id} -> {target}")
+        return
+
+    start = time.perf_counter()
+    papers, questions, parts = 0, 0, 0
+    for paper_id in reader.papers():
+        reader.paper_header(paper_id)
+        papers += 1
+        for question in reader.iter_questions(paper_id):
+            questions += 1
+            parts += 1 + len(question.get('sub_parts', []))
+    print(f"📚 {papers} 份试卷, {questions} 个主题, {parts} 个题目部分 "
+          f"({time.perf_counter() - start:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
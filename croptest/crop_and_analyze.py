@@ -1,69 +1,34 @@
 import cv2
-import requests
-import base64
 from dotenv import load_dotenv
-import os
-from ultralytics import YOLO
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from pipeline import Pipeline
 
 load_dotenv()
 
-def crop_detected_questions(image_path, model_path):
-    """使用YOLO模型检测问题区域并裁剪"""
-    model = YOLO(model_path)
-    results = model(image_path)
-    
+def crop_detected_questions(image_path, pipeline):
+    """使用YOLO模型检测问题区域并裁剪（按y坐标从上到下）；pipeline 为 pipeline.Pipeline"""
     img = cv2.imread(image_path)
-    cropped_regions = []
-    
-    for r in results:
-        boxes = r.boxes.xyxy.cpu().numpy()  # 获取检测框坐标
-        # 按y坐标排序（从上到下）
-        boxes = sorted(boxes, key=lambda x: x[1])
-        
-        for i, box in enumerate(boxes):
-            x1, y1, x2, y2 = map(int, box)
-            cropped_img = img[y1:y2, x1:x2]
-            cropped_regions.append({
-                'image': cropped_img,
-                'box': (x1, y1, x2, y2),
-                'index': i
-            })
-    
-    return cropped_regions
+    regions = pipeline.crop(img, pipeline.detector.detect_images([img])[0])
+    return [
+        {'image': region.image, 'box': tuple(region.bbox), 'index': region.index}
+        for region in regions
+    ]
 
-def analyze_cropped_region(cropped_img):
-    """用Mathpix分析单个裁剪区域"""
-    app_id = os.getenv('MATHPIX_APP_ID')
-    app_key = os.getenv('MATHPIX_API_KEY')
-    
-    # 将opencv图像编码为base64
-    _, buffer = cv2.imencode('.png', cropped_img)
-    image_base64 = base64.b64encode(buffer).decode('utf-8')
-    
-    headers = {
-        'app_id': app_id,
-        'app_key': app_key,
-        'Content-type': 'application/json'
-    }
-    
-    data = {
-        'src': f'data:image/png;base64,{image_base64}',
-        'formats': ['text'],
-    }
-    
-    try:
-        response = requests.post('https://api.mathpix.com/v3/text', headers=headers, json=data)
-        return response.json()
-    except Exception as e:
-        return {'error': str(e)}
+def analyze_cropped_region(cropped_img, pipeline):
+    """用Mathpix分析单个裁剪区域（共享连接池，相同的裁剪区域直接复用缓存结果）"""
+    return pipeline.ocr.ocr_image(cropped_img)
 
 if __name__ == "__main__":
     # 使用原始图片和模型，重新检测并裁剪
     original_image = "data/raw_images/9709_s20_qp_11/page_5.png"
     model_path = "../models/pastpaper_detector_demo/weights/best.pt"
+    pipeline = Pipeline.from_model(model_path)
     
     print("🔍 检测并裁剪问题区域...")
-    cropped_regions = crop_detected_questions(original_image, model_path)
+    cropped_regions = crop_detected_questions(original_image, pipeline)
     
     print(f"✅ 检测到 {len(cropped_regions)} 个问题区域")
     
@@ -75,7 +40,7 @@ if __name__ == "__main__":
         cv2.imwrite(f"cropped_question_{i+1}.png", region['image'])
         
         # 用Mathpix分析
-        result = analyze_cropped_region(region['image'])
+        result = analyze_cropped_region(region['image'], pipeline)
         
         if 'error' in result:
             print(f"❌ 错误: {result['error']}")
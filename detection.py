@@ -0,0 +1,455 @@
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import NamedTuple
+
+import cv2
+import numpy as np
+
+from metrics import BOXES_PER_PAGE, OPERATION_SECONDS, timed
+
+# 检测后端：ultralytics（PyTorch .pt）、onnx（onnxruntime CPU）、onnx-int8（量化模型）；
+# auto 按模型文件后缀选择（.onnx 用 onnxruntime，其余用 ultralytics）
+BACKENDS = ('auto', 'ultralytics', 'onnx', 'onnx-int8')
+DEFAULT_BACKEND = os.getenv('DETECTOR_BACKEND', 'auto')
+# 与 ultralytics predict 的默认值一致
+DEFAULT_CONF = 0.25
+DEFAULT_IOU = 0.7
+DEFAULT_MAX_DET = 300
+STRIDE = 32
+# 滑窗检测：方块边长（页面像素，0 表示整页检测）和相邻方块的重叠比例，见 TiledBackend
+DEFAULT_TILE_SIZE = int(os.getenv('DETECT_TILE_SIZE', '0'))
+DEFAULT_TILE_OVERLAP = float(os.getenv('DETECT_TILE_OVERLAP', '0.25'))
+# 框边离方块内侧边缘（非页面边界）不超过此距离（像素）时，视为被接缝截断
+TILE_EDGE_MARGIN = 4
+
+
+class Detections(NamedTuple):
+    """单页检测结果：xyxy 框 (N, 4)、置信度 (N,)、类别 (N,)"""
+    xyxy: np.ndarray
+    conf: np.ndarray
+    cls: np.ndarray
+
+    @classmethod
+    def empty(cls) -> 'Detections':
+        return cls(np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.float32),
+                   np.zeros(0, dtype=np.int32))
+
+    @classmethod
+    def from_ultralytics(cls, result) -> 'Detections':
+        boxes = result.boxes
+        if boxes is None:
+            return cls.empty()
+        return cls(boxes.xyxy.cpu().numpy(), boxes.conf.cpu().numpy(),
+                   boxes.cls.cpu().numpy().astype(np.int32))
+
+    def sorted_by_y(self) -> 'Detections':
+        """按y坐标从上到下排序，与原来的 sorted(boxes, key=lambda x: x[1]) 顺序一致"""
+        if len(self.xyxy) == 0:
+            return self
+        order = np.argsort(self.xyxy[:, 1], kind='stable')
+        return Detections(self.xyxy[order], self.conf[order], self.cls[order])
+
+
+class UltralyticsBackend:
+    """PyTorch 权重（.pt），通过 ultralytics 推理"""
+    name = 'ultralytics'
+
+    def __init__(self, model_path, device=None, conf=DEFAULT_CONF, iou=DEFAULT_IOU,
+                 max_det=DEFAULT_MAX_DET):
+        from ultralytics import YOLO  # 延迟导入：使用 ONNX 后端时不需要加载 torch
+        self.model_path = str(model_path)
+        self.model = YOLO(self.model_path)
+        self.device = device or None
+        self.conf = conf
+        self.iou = iou
+        self.max_det = max_det
+
+    def predict(self, images, imgsz=640, page_hashes=None) -> list:
+        # 各后端的 predict 签名一致；page_hashes 只有带检测缓存的后端（CachedDetector）使用
+        kwargs = {'imgsz': imgsz, 'conf': self.conf, 'iou': self.iou, 'max_det': self.max_det,
+                  'verbose': False}
+        if self.device is not None:
+            kwargs['device'] = self.device
+        with timed('inference'):
+            results = self.model(list(images), **kwargs)
+        return [Detections.from_ultralytics(r) for r in results]
+
+
+def letterbox(img: np.ndarray, size: int, rect: bool = True):
+    """
+    与 ultralytics 的 LetterBox 相同的预处理：等比缩放到长边为 size，
+    rect=True 时只把短边补到 STRIDE 的整数倍（否则补成 size x size 正方形），灰色(114)居中填充。
+    返回 (NCHW float32 张量, (x 缩放比例, y 缩放比例, 左侧填充, 顶部填充))；
+    缩放比例按取整后的实际尺寸计算，与 ultralytics 还原坐标的方式一致
+    """
+    h, w = img.shape[:2]
+    ratio = min(size / h, size / w)
+    new_w, new_h = int(round(w * ratio)), int(round(h * ratio))
+    dw, dh = size - new_w, size - new_h
+    if rect:
+        dw, dh = dw % STRIDE, dh % STRIDE
+    dw, dh = dw / 2, dh / 2
+    if (new_w, new_h) != (w, h):
+        img = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+    left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+    img = cv2.copyMakeBorder(img, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+    # BGR -> RGB、HWC -> CHW、归一化到 [0, 1]，一次完成
+    blob = cv2.dnn.blobFromImage(img, scalefactor=1 / 255.0, swapRB=True)
+    return blob, (new_w / w, new_h / h, left, top)
+
+
+class OnnxBackend:
+    """
+    onnxruntime CPU 推理（scripts/export_onnx.py 导出的模型，可为INT8量化版本）。
+    预处理、置信度过滤、NMS 和坐标还原与 ultralytics 一致，返回相同格式的 xyxy 框。
+    """
+    name = 'onnx'
+
+    def __init__(self, onnx_path, conf=DEFAULT_CONF, iou=DEFAULT_IOU, max_det=DEFAULT_MAX_DET,
+                 threads=None):
+        import onnxruntime as ort
+        self.model_path = str(onnx_path)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(self.model_path, options, providers=['CPUExecutionProvider'])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # 动态尺寸导出时输入为 ['batch', 3, 'height', 'width']，否则为固定的 [1, 3, 640, 640]
+        batch, _, height, _ = model_input.shape
+        self.fixed_size = height if isinstance(height, int) else None
+        self.fixed_batch = batch if isinstance(batch, int) else None
+        self.conf = conf
+        self.iou = iou
+        self.max_det = max_det
+
+    def predict(self, images, imgsz=640, page_hashes=None) -> list:
+        images = list(images)
+        if not images:
+            return []
+        size = self.fixed_size or imgsz
+        # 与 ultralytics 相同：同一批次尺寸一致时按矩形填充，否则补成正方形
+        rect = self.fixed_size is None and len({img.shape for img in images}) == 1
+        prepared = [letterbox(img, size, rect=rect) for img in images]
+
+        with timed('inference'):
+            if self.fixed_batch == 1:
+                outputs = [self.session.run(None, {self.input_name: blob})[0][0] for blob, _ in prepared]
+            else:
+                batch = np.concatenate([blob for blob, _ in prepared])
+                outputs = self.session.run(None, {self.input_name: batch})[0]
+        return [self._postprocess(output, meta, img.shape)
+                for output, (_, meta), img in zip(outputs, prepared, images)]
+
+    def _postprocess(self, output: np.ndarray, meta, shape) -> Detections:
+        # 输出为 (4 + 类别数, 候选框数)：cx, cy, w, h, 各类别得分
+        scores = output[4:]
+        cls = scores.argmax(axis=0)
+        conf = scores[cls, np.arange(scores.shape[1])]
+        keep = conf > self.conf
+        if not keep.any():
+            return Detections.empty()
+        cx, cy, w, h = output[:4, keep]
+        cls, conf = cls[keep], conf[keep]
+
+        xyxy = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+        # 按类别分别做NMS（与 ultralytics 相同，给不同类别的框加上偏移）
+        indices = nms(xyxy + cls[:, None].astype(np.float32) * 7680, conf, self.iou)[:self.max_det]
+
+        gain_x, gain_y, left, top = meta
+        xyxy = (xyxy[indices] - [left, top, left, top]) / [gain_x, gain_y, gain_x, gain_y]
+        xyxy[:, [0, 2]] = xyxy[:, [0, 2]].clip(0, shape[1])
+        xyxy[:, [1, 3]] = xyxy[:, [1, 3]].clip(0, shape[0])
+        return Detections(xyxy.astype(np.float32), conf[indices].astype(np.float32),
+                          cls[indices].astype(np.int32))
+
+
+def nms(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float) -> np.ndarray:
+    """贪心NMS（与 torchvision.ops.nms 相同）：返回保留的框下标，按得分从高到低"""
+    x1, y1, x2, y2 = boxes.T
+    areas = (x2 - x1) * (y2 - y1)
+    order = np.argsort(-scores, kind='stable')
+    keep = []
+    while order.size:
+        i, rest = order[0], order[1:]
+        keep.append(i)
+        inter = (np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+                 * np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None))
+        iou = inter / (areas[i] + areas[rest] - inter)
+        order = rest[iou <= iou_threshold]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def tile_grid(height: int, width: int, tile: int, overlap: float = DEFAULT_TILE_OVERLAP) -> list:
+    """
+    覆盖整页的重叠方块 (x1, y1, x2, y2)：每个方向上均匀分布，相邻方块至少重叠 tile * overlap 像素，
+    最后一块贴齐页面边缘；页面某一边不超过 tile 时该方向只有一块。
+    """
+    def starts(length):
+        if length <= tile:
+            return [0]
+        count = math.ceil((length - tile) / (tile * (1 - overlap))) + 1
+        return [round(i * (length - tile) / (count - 1)) for i in range(count)]
+
+    return [(x, y, min(x + tile, width), min(y + tile, height))
+            for y in starts(height) for x in starts(width)]
+
+
+def merge_boxes(xyxy: np.ndarray, conf: np.ndarray, cls: np.ndarray, cut: np.ndarray, source: np.ndarray,
+                iou_threshold: float = DEFAULT_IOU, ios_threshold: float = 0.5,
+                seam_band: float = 0.0) -> Detections:
+    """
+    跨方块合并同类别的检测框。cut 为 (N, 4) 布尔数组，标记框的 左/上/右/下 边是否被方块边缘截断；
+    source 为每个框来自的方块编号（整页为 -1）。
+    完整的框（未被截断，包括整页检测的框）优先，其次按置信度从高到低：当前框抑制与它
+    IoU 超过 iou_threshold 的框，以及来自其他方块、IoS（交集占较小框的比例）超过 ios_threshold 的框
+    （同一题目的重复或片段；同一次推理内的框已由模型的NMS处理）；
+    被截断的框还与在接缝处延续它的框拼接为外接框：接缝方向上的重合（1D IoU）不少于一半，
+    且跨过接缝的交叠不少于 seam_band 像素。题目框互不重叠，所以重叠的同类框都来自同一题目。
+    """
+    truncated = cut.any(axis=1)
+    order = np.lexsort((-conf, truncated))
+    merged_xyxy, merged_conf, merged_cls = [], [], []
+    while order.size:
+        i, order = order[0], order[1:]
+        box, box_cut = xyxy[i].copy(), cut[i].copy()
+        candidates = order[cls[order] == cls[i]]
+        absorbed = []
+        while candidates.size:
+            x1, y1, x2, y2 = xyxy[candidates].T
+            inter_w = np.clip(np.minimum(box[2], x2) - np.maximum(box[0], x1), 0, None)
+            inter_h = np.clip(np.minimum(box[3], y2) - np.maximum(box[1], y1), 0, None)
+            inter = inter_w * inter_h
+            area, areas = (box[2] - box[0]) * (box[3] - box[1]), (x2 - x1) * (y2 - y1)
+            iou = inter / (area + areas - inter + 1e-9)
+            ios = inter / (np.minimum(area, areas) + 1e-9)
+            match = (iou > iou_threshold) | ((ios > ios_threshold) & (source[candidates] != source[i]))
+            if truncated[i]:
+                span_x = inter_w / (np.maximum(box[2], x2) - np.minimum(box[0], x1) + 1e-9)
+                span_y = inter_h / (np.maximum(box[3], y2) - np.minimum(box[1], y1) + 1e-9)
+                cut_y = box_cut[[1, 3]].any() | cut[candidates][:, [1, 3]].any(axis=1)  # 横向接缝
+                cut_x = box_cut[[0, 2]].any() | cut[candidates][:, [0, 2]].any(axis=1)  # 纵向接缝
+                seam = ((cut_y & (span_x >= 0.5) & (inter_h > 0) & (inter_h >= seam_band))
+                        | (cut_x & (span_y >= 0.5) & (inter_w > 0) & (inter_w >= seam_band)))
+                if seam.any():
+                    # 拼接后的外接框可能延续到更多方块，继续比较剩下的候选框
+                    box[:2] = np.minimum(box[:2], xyxy[candidates[seam], :2].min(axis=0))
+                    box[2:] = np.maximum(box[2:], xyxy[candidates[seam], 2:].max(axis=0))
+                    box_cut |= cut[candidates[seam]].any(axis=0)
+                    match |= seam
+                    absorbed.extend(candidates[match])
+                    candidates = candidates[~match]
+                    continue
+            absorbed.extend(candidates[match])
+            break
+        order = order[~np.isin(order, absorbed)]
+        merged_xyxy.append(box)
+        merged_conf.append(conf[i])
+        merged_cls.append(cls[i])
+    if not merged_xyxy:
+        return Detections.empty()
+    return Detections(np.asarray(merged_xyxy, dtype=np.float32), np.asarray(merged_conf, dtype=np.float32),
+                      np.asarray(merged_cls, dtype=np.int32))
+
+
+class TiledBackend:
+    """
+    滑窗检测：把每页切成重叠的方块（页面视图，不复制像素），按 tile_batch 个一批送入底层后端推理，
+    框映射回页面坐标后跨接缝合并（merge_boxes）。full_page=True 时整页也推理一次并参与合并，
+    保证跨越多个方块的大题目框完整。每个方块的平均推理耗时记入 OPERATION_SECONDS{operation="tile"}。
+    """
+
+    def __init__(self, backend, tile_size=1280, overlap=DEFAULT_TILE_OVERLAP, full_page=True, tile_batch=16):
+        self.backend = backend
+        self.name = f"{backend.name}+tiles"
+        self.model_path = backend.model_path
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.full_page = full_page
+        self.tile_batch = max(1, tile_batch)
+        self.iou = getattr(backend, 'iou', DEFAULT_IOU)
+        # 累计的方块数和推理耗时（秒），用于报告每个方块的耗时
+        self.tiles = 0
+        self.tile_seconds = 0.0
+
+    def predict(self, images, imgsz=640, page_hashes=None) -> list:
+        images = list(images)
+        grids = [tile_grid(img.shape[0], img.shape[1], self.tile_size, self.overlap) for img in images]
+        views = [(page, rect) for page, grid in enumerate(grids) if len(grid) > 1 for rect in grid]
+
+        detections = []
+        for start in range(0, len(views), self.tile_batch):
+            chunk = views[start:start + self.tile_batch]
+            begin = time.perf_counter()
+            results = self.backend.predict([images[page][y1:y2, x1:x2] for page, (x1, y1, x2, y2) in chunk],
+                                           imgsz=imgsz)
+            seconds = time.perf_counter() - begin
+            for _ in chunk:
+                OPERATION_SECONDS.observe(seconds / len(chunk), operation='tile')
+            self.tiles += len(chunk)
+            self.tile_seconds += seconds
+            detections.extend(results)
+
+        # 只有一个方块（页面不大于方块）的页面直接按整页检测
+        whole = [page for page, grid in enumerate(grids) if self.full_page or len(grid) == 1]
+        full_results = {}
+        if whole:
+            full_results = dict(zip(whole, self.backend.predict([images[page] for page in whole], imgsz=imgsz)))
+
+        per_page = [[] for _ in images]
+        for (page, rect), result in zip(views, detections):
+            per_page[page].append((rect, result))
+        return [self._merge(images[page].shape, per_page[page], full_results.get(page))
+                for page in range(len(images))]
+
+    def _merge(self, shape, tile_results, full_result) -> Detections:
+        height, width = shape[:2]
+        parts = []  # (xyxy, conf, cls, cut, source)
+        if full_result is not None:
+            count = len(full_result.xyxy)
+            parts.append((*full_result, np.zeros((count, 4), dtype=bool), np.full(count, -1)))
+        for index, ((x1, y1, x2, y2), result) in enumerate(tile_results):
+            xyxy = result.xyxy + np.array([x1, y1, x1, y1], dtype=np.float32)
+            inner = np.array([x1 > 0, y1 > 0, x2 < width, y2 < height])
+            edge = np.array([x1, y1, x2, y2], dtype=np.float32)
+            cut = (np.abs(xyxy - edge) <= TILE_EDGE_MARGIN) & inner
+            parts.append((xyxy, result.conf, result.cls, cut, np.full(len(xyxy), index)))
+        parts = [part for part in parts if len(part[0])]
+        if not parts:
+            return Detections.empty()
+        if len(parts) == 1 and not tile_results:
+            return full_result
+        xyxy, conf, cls, cut, source = (np.concatenate(column) for column in zip(*parts))
+        return merge_boxes(xyxy, conf, cls, cut, source, iou_threshold=self.iou,
+                           seam_band=self.tile_size * self.overlap / 2)
+
+    def tile_report(self) -> dict:
+        """累计的方块数和每个方块的平均推理耗时（毫秒）"""
+        per_tile = self.tile_seconds / self.tiles * 1000 if self.tiles else 0.0
+        return {'tiles': self.tiles, 'tile_ms': round(per_tile, 2)}
+
+
+def onnx_path_for(model_path, int8: bool = False) -> Path:
+    """.pt 权重对应的导出文件：best.pt -> best.onnx / best.int8.onnx"""
+    model_path = Path(model_path)
+    return model_path.with_suffix('.int8.onnx' if int8 else '.onnx')
+
+
+def resolve_model(model_path, backend: str = None) -> tuple:
+    """
+    解析后端名称和实际加载的模型文件，不加载模型：返回 (后端名称, 模型文件路径)。
+    onnx/onnx-int8 后端传入 .pt 路径时，使用同目录下导出的 .onnx 文件（scripts/export_onnx.py 生成）。
+    """
+    backend = backend or DEFAULT_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown detector backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+    model_path = Path(model_path)
+    if backend == 'auto':
+        backend = 'onnx' if model_path.suffix == '.onnx' else 'ultralytics'
+    if backend != 'ultralytics' and model_path.suffix != '.onnx':
+        model_path = onnx_path_for(model_path, int8=backend == 'onnx-int8')
+    return backend, model_path
+
+
+def load_detector(model_path, backend: str = None, device=None, tile_size=DEFAULT_TILE_SIZE,
+                  tile_overlap=DEFAULT_TILE_OVERLAP, **options):
+    """
+    按后端名称加载检测器（见 resolve_model），options（conf、iou、max_det）两种后端通用。
+    onnxruntime 只用CPU，忽略 device。tile_size 大于 0 时包装为滑窗检测（TiledBackend）。
+    """
+    backend, model_path = resolve_model(model_path, backend)
+    if backend == 'ultralytics':
+        detector = UltralyticsBackend(model_path, device=device, **options)
+    elif not model_path.is_file():
+        raise FileNotFoundError(f"{model_path} not found, export it first: python scripts/export_onnx.py")
+    else:
+        detector = OnnxBackend(model_path, **options)
+    if tile_size:
+        detector = TiledBackend(detector, tile_size=tile_size, overlap=tile_overlap)
+    return detector
+
+
+class BatchDetector:
+    """
+    批量YOLO检测：每次前向传播处理 batch_size 页，
+    并在当前批次推理的同时用后台线程读取、解码后续页面。
+    backend 为 load_detector() 返回的检测后端。
+    """
+
+    def __init__(self, backend, batch_size=4, imgsz=640, io_workers=2):
+        self.backend = backend
+        self.batch_size = max(1, batch_size)
+        self.imgsz = imgsz
+        self.io_workers = io_workers
+        # ultralytics 的预测器不是线程安全的，多份试卷并发时串行执行前向传播
+        self._lock = threading.Lock()
+
+    def detect(self, images, page_hashes=None) -> list:
+        """
+        对一批已解码的图像做检测，返回每页按y排序的 Detections。
+        page_hashes 为各页的内容哈希，后端带检测缓存（detection_cache.CachedDetector）时用作缓存键，其他后端忽略。
+        """
+        if not images:
+            return []
+        if page_hashes is not None:
+            page_hashes = list(page_hashes)
+        with self._lock:
+            results = self.backend.predict(list(images), imgsz=self.imgsz, page_hashes=page_hashes)
+        for r in results:
+            BOXES_PER_PAGE.observe(len(r.xyxy))
+        return [r.sorted_by_y() for r in results]
+
+    def detect_images(self, images, page_hashes=None) -> list:
+        """对一批已解码的图像做检测，返回每页按y排序的 xyxy 框数组"""
+        return [r.xyxy for r in self.detect(images, page_hashes)]
+
+    def iter_images(self, items, page_hash=None):
+        """
+        items 为可迭代的 (key, img)，逐项产出 (key, img, boxes)，顺序与输入一致。
+        img 为 None（无法读取）时产出 (key, None, None)。
+        page_hash(key) 返回页面的内容哈希（可选，见 detect）。
+        """
+        for batch in self.iter_batches(items, page_hash):
+            yield from batch
+
+    def iter_batches(self, items, page_hash=None):
+        """与 iter_images 相同，但每次产出一个批次的 [(key, img, boxes)]（一次前向传播）"""
+        batch = []
+        for key, img in items:
+            batch.append((key, img))
+            if len(batch) == self.batch_size:
+                yield self._detect_batch(batch, page_hash)
+                batch = []
+        if batch:
+            yield self._detect_batch(batch, page_hash)
+
+    def _detect_batch(self, batch, page_hash=None) -> list:
+        readable = [(key, img) for key, img in batch if img is not None]
+        hashes = [page_hash(key) for key, _ in readable] if page_hash else None
+        boxes_iter = iter(self.detect_images([img for _, img in readable], hashes))
+        return [(key, None, None) if img is None else (key, img, next(boxes_iter)) for key, img in batch]
+
+    def read_ahead(self, items):
+        """
+        items 为 (key, loader)，在后台线程中调用 loader() 预读图像，按输入顺序产出 (key, img)。
+        保持两个批次的预读：推理当前批次时，下一批次已在后台读盘、解码。
+        loader 必须是线程安全的（如 cv2.imread）。
+        """
+        window = self.batch_size * 2
+        with ThreadPoolExecutor(max_workers=self.io_workers, thread_name_prefix="page-reader") as pool:
+            pending = deque()
+            for key, loader in items:
+                pending.append((key, pool.submit(loader)))
+                if len(pending) >= window:
+                    key, future = pending.popleft()
+                    yield key, future.result()
+            while pending:
+                key, future = pending.popleft()
+                yield key, future.result()
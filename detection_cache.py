@@ -0,0 +1,249 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from detection import (DEFAULT_CONF, DEFAULT_IOU, DEFAULT_MAX_DET, DEFAULT_TILE_OVERLAP, DEFAULT_TILE_SIZE,
+                       Detections, load_detector, resolve_model)
+
+# 默认缓存位置：项目根目录下的 .cache/，与 OCR 缓存放在一起
+DEFAULT_CACHE_PATH = Path(__file__).resolve().parent / ".cache" / "detection_cache.sqlite"
+
+
+def image_hash(img: np.ndarray) -> str:
+    """已解码页面的内容哈希（像素 + 尺寸），同一页面无论来自PNG还是PDF渲染都相同"""
+    h = hashlib.sha256()
+    h.update(repr((img.shape, str(img.dtype))).encode("utf-8"))
+    h.update(memoryview(np.ascontiguousarray(img)).cast("B"))
+    return h.hexdigest()
+
+
+class DetectionCache:
+    """
+    检测结果（框、置信度、类别）的持久化缓存，键为页面内容哈希 + 权重文件指纹 + 推理设置。
+    权重文件的 SHA-256 按 (路径, 大小, 修改时间) 记录，文件不变时不重复计算；
+    同一路径的权重变化（如重新训练覆盖 best.pt）时，旧权重的检测结果随之删除。
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH):
+        self.path = Path(path)
+
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.invalidated = 0
+
+        self._lock = threading.Lock()
+        self._conn = self._connect()
+
+    @classmethod
+    def from_env(cls):
+        """根据环境变量创建缓存；DETECTION_CACHE_DISABLED=1 时返回 None"""
+        if os.getenv("DETECTION_CACHE_DISABLED") == "1":
+            return None
+        return cls(path=os.getenv("DETECTION_CACHE_PATH", DEFAULT_CACHE_PATH))
+
+    def _connect(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS detections ("
+            " key TEXT PRIMARY KEY,"
+            " model TEXT NOT NULL,"
+            " count INTEGER NOT NULL,"
+            " value BLOB NOT NULL,"
+            " created REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_detections_model ON detections(model)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS model_files ("
+            " path TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " sha256 TEXT NOT NULL)"
+        )
+        conn.commit()
+        return conn
+
+    def model_fingerprint(self, model_file) -> str:
+        """权重文件的 SHA-256；文件不存在时返回 None（不缓存）"""
+        model_file = Path(model_file).resolve()
+        try:
+            stat = model_file.stat()
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime_ns, sha256 FROM model_files WHERE path = ?", (str(model_file),)
+            ).fetchone()
+            if row is not None and row[:2] == (stat.st_size, stat.st_mtime_ns):
+                return row[2]
+
+            h = hashlib.sha256()
+            with open(model_file, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    h.update(chunk)
+            digest = h.hexdigest()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO model_files (path, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)",
+                (str(model_file), stat.st_size, stat.st_mtime_ns, digest)
+            )
+            if row is not None and row[2] != digest:
+                self._purge_model(row[2])
+            self._conn.commit()
+            return digest
+
+    def _purge_model(self, old_digest: str):
+        # 其他路径仍指向同一份权重时保留
+        shared = self._conn.execute(
+            "SELECT 1 FROM model_files WHERE sha256 = ? LIMIT 1", (old_digest,)
+        ).fetchone()
+        if shared is None:
+            self.invalidated += self._conn.execute(
+                "DELETE FROM detections WHERE model = ?", (old_digest,)
+            ).rowcount
+
+    @staticmethod
+    def make_key(page_hash: str, model_fingerprint: str, settings: dict) -> str:
+        """缓存键：页面哈希 + 权重指纹 + 规范化后的推理设置的SHA-256"""
+        h = hashlib.sha256()
+        h.update(page_hash.encode("utf-8"))
+        h.update(b"\0")
+        h.update(model_fingerprint.encode("utf-8"))
+        h.update(b"\0")
+        h.update(json.dumps(settings, sort_keys=True).encode("utf-8"))
+        return h.hexdigest()
+
+    def get(self, key: str):
+        """读取缓存的 Detections，未命中返回 None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT count, value FROM detections WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return _decode(*row)
+
+    def put(self, key: str, model_fingerprint: str, detections: Detections):
+        """写入一页的检测结果"""
+        count, value = _encode(detections)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO detections (key, model, count, value, created) VALUES (?, ?, ?, ?, ?)",
+                (key, model_fingerprint, count, value, time.time())
+            )
+            self._conn.commit()
+            self.writes += 1
+
+    def stats(self) -> dict:
+        """命中/未命中计数及当前缓存条目数"""
+        with self._lock:
+            entries, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM detections"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'writes': self.writes,
+            'invalidated': self.invalidated,
+            'entries': entries,
+            'bytes': total
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def _encode(detections: Detections) -> tuple:
+    # 紧凑的二进制格式：N*4 个 float32 框 + N 个 float32 置信度 + N 个 int32 类别
+    xyxy = np.ascontiguousarray(detections.xyxy, dtype=np.float32).reshape(-1, 4)
+    conf = np.ascontiguousarray(detections.conf, dtype=np.float32)
+    cls = np.ascontiguousarray(detections.cls, dtype=np.int32)
+    return len(xyxy), xyxy.tobytes() + conf.tobytes() + cls.tobytes()
+
+
+def _decode(count: int, value: bytes) -> Detections:
+    xyxy = np.frombuffer(value, dtype=np.float32, count=count * 4).reshape(count, 4)
+    conf = np.frombuffer(value, dtype=np.float32, count=count, offset=count * 16)
+    cls = np.frombuffer(value, dtype=np.int32, count=count, offset=count * 20)
+    return Detections(xyxy.copy(), conf.copy(), cls.copy())
+
+
+class CachedDetector:
+    """
+    带检测缓存的检测后端，接口与 detection.load_detector() 返回的后端相同（predict/name/model_path）。
+    模型在第一次缓存未命中时才加载：所有页面都命中时不导入 torch/onnxruntime，也不读取权重。
+    cache='env' 时按环境变量创建缓存（DETECTION_CACHE_PATH / DETECTION_CACHE_DISABLED），None 时不缓存。
+    """
+
+    def __init__(self, model_path, backend: str = None, device=None, cache='env', **options):
+        self.name, model_file = resolve_model(model_path, backend)
+        self.model_path = str(model_file)
+        self.source_path = model_path
+        self.device = device
+        self.options = {'tile_size': DEFAULT_TILE_SIZE, 'tile_overlap': DEFAULT_TILE_OVERLAP, **options}
+        self.cache = DetectionCache.from_env() if cache == 'env' else cache
+        # 缓存键中的推理设置；设备不影响检测结果，不计入
+        self.settings = {
+            'backend': self.name,
+            'conf': options.get('conf', DEFAULT_CONF),
+            'iou': options.get('iou', DEFAULT_IOU),
+            'max_det': options.get('max_det', DEFAULT_MAX_DET),
+        }
+        if self.options['tile_size']:
+            # 滑窗检测的结果与整页检测不同，分开缓存；不分块时键与原来一致
+            self.settings['tiles'] = [self.options['tile_size'], self.options['tile_overlap']]
+        self.fingerprint = self.cache.model_fingerprint(model_file) if self.cache is not None else None
+        self._backend = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._backend is not None
+
+    @property
+    def backend(self):
+        """实际的检测后端，第一次访问时加载"""
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    self._backend = load_detector(self.source_path, backend=self.name,
+                                                  device=self.device, **self.options)
+        return self._backend
+
+    def predict(self, images, imgsz=640, page_hashes=None) -> list:
+        """
+        检测一批图片，返回每张图片的 Detections。
+        page_hashes 为各页的内容哈希（如源文件的SHA-256），缺省时按像素计算（image_hash）；
+        只有未命中的页面送入模型，结果写回缓存。
+        """
+        images = list(images)
+        if self.cache is None or self.fingerprint is None:
+            return self.backend.predict(images, imgsz=imgsz)
+
+        if page_hashes is None:
+            page_hashes = [image_hash(img) for img in images]
+        settings = {**self.settings, 'imgsz': imgsz}
+        keys = [self.cache.make_key(page_hash, self.fingerprint, settings) for page_hash in page_hashes]
+        results = [self.cache.get(key) for key in keys]
+
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            detected = self.backend.predict([images[i] for i in missing], imgsz=imgsz)
+            for i, detections in zip(missing, detected):
+                self.cache.put(keys[i], self.fingerprint, detections)
+                results[i] = detections
+        return results
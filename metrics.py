@@ -0,0 +1,287 @@
+import bisect
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+# 默认的延迟分桶（秒）：覆盖从裁剪（毫秒级）到整页OCR（数十秒）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# 报告中估算的分位数
+REPORT_QUANTILES = (0.5, 0.95, 0.99)
+
+
+class _Metric:
+    """带标签的指标：每组标签值对应一个序列，所有操作线程安全"""
+    kind = None
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _label_text(self, key: tuple, extra: str = None) -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+class Counter(_Metric):
+    """单调递增的计数器"""
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._series.get(self._key(labels), 0)
+
+    def render(self) -> list:
+        with self._lock:
+            series = sorted(self._series.items())
+        return [f"{self.name}{self._label_text(key)} {_number(value)}" for key, value in series]
+
+    def report(self) -> list:
+        with self._lock:
+            series = sorted(self._series.items())
+        return [{'labels': dict(zip(self.labelnames, key)), 'value': value} for key, value in series]
+
+
+class Gauge(_Metric):
+    """可以任意设置的数值，只保留最后一次的值"""
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = value
+
+    def value(self, **labels):
+        with self._lock:
+            return self._series.get(self._key(labels))
+
+    render = Counter.render
+    report = Counter.report
+
+
+class Histogram(_Metric):
+    """分桶直方图，同时记录总和、次数和最大值"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        # 第一个上界 >= value 的桶（Prometheus 的 le 语义），超过所有上界时落入 +Inf
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {'counts': [0] * (len(self.buckets) + 1),
+                                              'sum': 0.0, 'count': 0, 'max': value}
+            series['counts'][index] += 1
+            series['sum'] += value
+            series['count'] += 1
+            series['max'] = max(series['max'], value)
+
+    @contextmanager
+    def time(self, **labels):
+        """记录代码块的耗时（秒），代码块抛出异常时同样记录"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _snapshot(self) -> list:
+        with self._lock:
+            return [(key, dict(s, counts=list(s['counts']))) for key, s in sorted(self._series.items())]
+
+    def render(self) -> list:
+        lines = []
+        for key, series in self._snapshot():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), series['counts']):
+                cumulative += count
+                le = 'le="+Inf"' if bound == math.inf else f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{self._label_text(key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._label_text(key)} {_number(series['sum'])}")
+            lines.append(f"{self.name}_count{self._label_text(key)} {series['count']}")
+        return lines
+
+    def report(self) -> list:
+        rows = []
+        for key, series in self._snapshot():
+            row = {
+                'labels': dict(zip(self.labelnames, key)),
+                'count': series['count'],
+                'sum': round(series['sum'], 6),
+                'mean': round(series['sum'] / series['count'], 6),
+                'max': round(series['max'], 6),
+            }
+            for q in REPORT_QUANTILES:
+                row[f"p{int(q * 100)}"] = round(self._quantile(series, q), 6)
+            rows.append(row)
+        return rows
+
+    def _quantile(self, series: dict, q: float) -> float:
+        # 与 PromQL histogram_quantile 相同：在所在桶内线性插值，落在 +Inf 桶时取观测到的最大值
+        rank = q * series['count']
+        cumulative, lower = 0, 0.0
+        for bound, count in zip(self.buckets, series['counts']):
+            if count and cumulative + count >= rank:
+                return min(lower + (bound - lower) * (rank - cumulative) / count, series['max'])
+            cumulative += count
+            lower = bound
+        return series['max']
+
+
+class Registry:
+    """指标注册表：以 Prometheus 文本格式输出（/metrics），或写出JSON计时报告（批量构建）"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self.started = time.time()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help: str, labelnames=()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames=()) -> Gauge:
+        return self._register(Gauge(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        """Prometheus 文本格式（text/plain; version=0.0.4）"""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def report(self) -> dict:
+        """各指标的汇总：直方图给出次数、总和、均值、最大值和估算的分位数，计数器和仪表给出数值"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {
+            'generated_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'uptime_seconds': round(time.time() - self.started, 3),
+            'metrics': {
+                metric.name: {'type': metric.kind, 'help': metric.help, 'series': metric.report()}
+                for metric in metrics
+            }
+        }
+
+    def write_report(self, path, **extra) -> Path:
+        """把 report() 写成JSON文件，extra 作为附加的顶层字段"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({**self.report(), **extra}, f, indent=2, ensure_ascii=False)
+        return path
+
+    def clear(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.clear()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+# --- 进程内共享的注册表和指标 ---
+# 多进程部署（如 uvicorn --workers N）时每个进程各自计数，由 Prometheus 按实例汇总
+
+REGISTRY = Registry()
+
+OPERATION_SECONDS = REGISTRY.histogram(
+    'pastpaper_operation_seconds',
+    'Latency of a single operation: decode, render, inference, preprocess, encode, ocr_request',
+    ('operation',)
+)
+STAGE_SECONDS = REGISTRY.histogram(
+    'pastpaper_stage_seconds',
+    'Time spent in each pipeline stage: per page for load, detect (batch time split across its pages), '
+    'crop and ocr; per paper for classify and write',
+    ('stage',)
+)
+BOXES_PER_PAGE = REGISTRY.histogram(
+    'pastpaper_boxes_per_page',
+    'Detected question regions per page',
+    buckets=(0, 1, 2, 3, 5, 8, 12, 20, 30, 50, 100, 300)
+)
+OCR_UPLOAD_BYTES = REGISTRY.histogram(
+    'pastpaper_ocr_upload_bytes',
+    'Encoded size of each region sent to OCR (after preprocessing)',
+    buckets=(16384, 65536, 131072, 262144, 524288, 1048576, 2097152, 4194304, 8388608)
+)
+OCR_FAILURES = REGISTRY.counter(
+    'pastpaper_ocr_failures_total',
+    'OCR calls that returned no text (error: request or API error, no_text: response without text)',
+    ('reason',)
+)
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    'pastpaper_http_request_seconds',
+    'API request latency by route and status code',
+    ('method', 'route', 'status')
+)
+STARTUP_SECONDS = REGISTRY.gauge(
+    'pastpaper_startup_seconds',
+    'Startup timing: app_start and model_ready since process start, model_load and warmup durations',
+    ('phase',)
+)
+
+
+def observe_stage(stage: str, seconds: float):
+    """pipeline.Pipeline 的 hook：把阶段耗时记入 STAGE_SECONDS"""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+
+
+def timed(operation: str):
+    """记录一次操作的耗时：with timed('decode'): ..."""
+    return OPERATION_SECONDS.time(operation=operation)
+
+
+def record_ocr_result(result) -> None:
+    """OCR没有返回文本时按原因计数"""
+    if not isinstance(result, dict) or 'error' in result:
+        OCR_FAILURES.inc(reason='error')
+    elif 'text' not in result:
+        OCR_FAILURES.inc(reason='no_text')
@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# 默认缓存位置：项目根目录下的 .cache/，与脚本的工作目录无关
+DEFAULT_CACHE_PATH = Path(__file__).resolve().parent / ".cache" / "ocr_cache.sqlite"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+class OCRCache:
+    """
+    OCR结果的持久化缓存，按裁剪图像编码后的字节和OCR选项做内容寻址。
+    超过容量上限时按最近访问时间淘汰（LRU）；offline 模式下只读，未命中时不会调用API。
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES, offline=False):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.offline = offline
+
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._conn = self._connect()
+
+    @classmethod
+    def from_env(cls):
+        """根据环境变量创建缓存；OCR_CACHE_DISABLED=1 时返回 None"""
+        if os.getenv("OCR_CACHE_DISABLED") == "1":
+            return None
+        return cls(
+            path=os.getenv("OCR_CACHE_PATH", DEFAULT_CACHE_PATH),
+            max_bytes=int(float(os.getenv("OCR_CACHE_MAX_MB", DEFAULT_MAX_BYTES / 2 ** 20)) * 2 ** 20),
+            offline=os.getenv("OCR_CACHE_OFFLINE") == "1"
+        )
+
+    def _connect(self):
+        if self.offline:
+            if not self.path.exists():
+                return None
+            # 只读打开，保证离线模式不会修改缓存文件
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            return conn
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS ocr_results ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_ocr_last_access ON ocr_results(last_access)")
+        conn.commit()
+        return conn
+
+    @staticmethod
+    def make_key(image_bytes: bytes, options: dict) -> str:
+        """缓存键：图像字节 + 规范化后的OCR选项的SHA-256"""
+        h = hashlib.sha256()
+        h.update(image_bytes)  # 直接接受 memoryview，不复制编码缓冲区
+        h.update(b"\0")
+        h.update(json.dumps(options, sort_keys=True).encode("utf-8"))
+        return h.hexdigest()
+
+    def get(self, key: str):
+        """读取缓存结果，未命中返回 None"""
+        with self._lock:
+            row = None
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT value FROM ocr_results WHERE key = ?", (key,)
+                ).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            if not self.offline:
+                self._conn.execute(
+                    "UPDATE ocr_results SET last_access = ? WHERE key = ?", (time.time(), key)
+                )
+                self._conn.commit()
+            return json.loads(row[0])
+
+    def put(self, key: str, result: dict):
+        """写入缓存（离线模式下忽略），必要时淘汰最久未访问的条目"""
+        if self.offline:
+            return
+        value = json.dumps(result, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ocr_results (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, len(value.encode("utf-8")), time.time())
+            )
+            self.writes += 1
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM ocr_results").fetchone()[0]
+        while total > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT key, size FROM ocr_results ORDER BY last_access LIMIT 64"
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                self._conn.execute("DELETE FROM ocr_results WHERE key = ?", (key,))
+                total -= size
+                self.evictions += 1
+
+    def get_or_compute(self, image_bytes: bytes, options: dict, compute) -> dict:
+        """
+        命中则直接返回缓存结果，否则调用 compute() 并缓存成功的结果。
+        离线模式下未命中返回错误字典而不调用 compute。
+        """
+        key = self.make_key(image_bytes, options)
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        if self.offline:
+            return {'error': 'OCR cache miss (offline mode)'}
+
+        result = compute()
+        if isinstance(result, dict) and 'error' not in result:
+            self.put(key, result)
+        return result
+
+    def stats(self) -> dict:
+        """命中/未命中计数及当前缓存大小"""
+        entries, total = 0, 0
+        with self._lock:
+            if self._conn is not None:
+                entries, total = self._conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM ocr_results"
+                ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'writes': self.writes,
+            'evictions': self.evictions,
+            'entries': entries,
+            'bytes': total,
+            'offline': self.offline
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
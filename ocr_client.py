@@ -0,0 +1,185 @@
+import base64
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import OCR_UPLOAD_BYTES, record_ocr_result, timed
+
+# Mathpix 文本识别接口，可用环境变量指向本地桩服务器进行测试
+MATHPIX_TEXT_URL = os.getenv("MATHPIX_API_URL", "https://api.mathpix.com/v3/text")
+# 这些状态码视为暂时性错误，按退避策略重试
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# 裁剪区域发送给OCR前的编码：png（无损，默认）、jpeg 或 webp（有损，编码更快、体积更小）
+OCR_IMAGE_FORMAT = os.getenv("OCR_IMAGE_FORMAT", "png")
+# PNG压缩级别 0-9；留空时使用 OpenCV 的默认参数（速度最快，且与已有OCR缓存的键一致）
+OCR_PNG_COMPRESSION = os.getenv("OCR_PNG_COMPRESSION") or None
+OCR_IMAGE_QUALITY = int(os.getenv("OCR_IMAGE_QUALITY", "90"))
+# 上传方式：multipart（二进制文件 + options_json 表单字段）或 json（Base64 data URL）
+OCR_UPLOAD = os.getenv("OCR_UPLOAD", "multipart")
+
+# 格式 -> (扩展名, MIME类型, 质量参数)
+IMAGE_ENCODINGS = {
+    'png': ('.png', 'image/png', None),
+    'jpeg': ('.jpg', 'image/jpeg', cv2.IMWRITE_JPEG_QUALITY),
+    'webp': ('.webp', 'image/webp', cv2.IMWRITE_WEBP_QUALITY),
+}
+
+
+def encode_image(img_array, image_format: str = 'png', png_compression=None, quality: int = 90):
+    """
+    编码图像，返回 (memoryview, MIME类型)。
+    裁剪区域可以是原页面的视图（不连续），直接交给 imencode，不先复制；
+    结果直接引用编码缓冲区，不再转换为 bytes。
+    """
+    extension, content_type, quality_flag = IMAGE_ENCODINGS[image_format]
+    params = []
+    if quality_flag is not None:
+        params = [quality_flag, int(quality)]
+    elif png_compression is not None:
+        params = [cv2.IMWRITE_PNG_COMPRESSION, int(png_compression)]
+    ok, buffer = cv2.imencode(extension, img_array, params)
+    if not ok:
+        raise ValueError(f"Failed to encode image as {image_format}")
+    return memoryview(buffer.reshape(-1)), content_type
+
+
+class MathpixClient:
+    """Mathpix OCR 客户端：共享 keep-alive 会话，带超时、重试和并发上限"""
+
+    def __init__(self, app_id, app_key, url=MATHPIX_TEXT_URL, max_in_flight=8,
+                 timeout=30.0, max_retries=3, backoff=0.5, cache=None, image_format=OCR_IMAGE_FORMAT,
+                 png_compression=OCR_PNG_COMPRESSION, quality=OCR_IMAGE_QUALITY, upload=OCR_UPLOAD,
+                 preprocess=None):
+        if image_format not in IMAGE_ENCODINGS:
+            raise ValueError(f"Unknown OCR image format: {image_format}")
+        if upload not in ('multipart', 'json'):
+            raise ValueError(f"Unknown OCR upload mode: {upload}")
+        self.url = url
+        self.cache = cache  # 可选的 OCRCache，命中时不发起请求
+        self.options = {'formats': ['text']}
+        self.image_format = image_format
+        self.png_compression = png_compression
+        self.quality = quality
+        self.upload = upload
+        self.preprocess = preprocess  # 可选的 OCRPreprocessor（缩放/灰度/二值化），None 时按原图编码
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+        # 连接池大小与并发上限一致，避免线程之间争抢连接
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_in_flight)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+            "app_id": app_id or "",
+            "app_key": app_key or "",
+        })
+
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def ocr_image(self, img_array) -> dict:
+        """对OpenCV图像（可以是页面的裁剪视图）进行OCR"""
+        try:
+            if self.preprocess is None:
+                with timed('encode'):
+                    data, content_type = self.encode(img_array)
+            else:
+                data, content_type, _ = self.preprocess.apply(img_array, self.encode)
+        except Exception as e:
+            result = {'error': str(e)}
+            record_ocr_result(result)
+            return result
+        OCR_UPLOAD_BYTES.observe(len(data))
+        return self.ocr_encoded(data, content_type)
+
+    def encode(self, img_array) -> tuple:
+        """按客户端的编码设置编码图像，返回 (memoryview, MIME类型)"""
+        return encode_image(img_array, self.image_format, self.png_compression, self.quality)
+
+    def ocr_encoded(self, data, content_type: str = 'image/png') -> dict:
+        """对编码后的图像（bytes 或 memoryview）进行OCR，优先查询缓存"""
+        def request_ocr():
+            if self.upload == 'multipart':
+                return self.ocr_file(data, content_type)
+            return self.ocr_base64(base64.b64encode(data).decode('ascii'), content_type)
+
+        if self.cache is None:
+            result = request_ocr()
+        else:
+            result = self.cache.get_or_compute(data, self.options, request_ocr)
+        record_ocr_result(result)
+        return result
+
+    def ocr_file(self, data, content_type: str = 'image/png') -> dict:
+        """以 multipart/form-data 上传二进制图像（file + options_json），省去Base64编码和JSON转义"""
+        extension = next(ext for ext, mime, _ in IMAGE_ENCODINGS.values() if mime == content_type)
+        with timed('ocr_request'):
+            return self._request(files={'file': (f'region{extension}', data, content_type)},
+                                 data={'options_json': json.dumps(self.options)})
+
+    def ocr_base64(self, image_base64: str, content_type: str = 'image/png') -> dict:
+        """发送一次OCR请求，遇到网络错误或暂时性状态码时指数退避重试（耗时含重试）"""
+        with timed('ocr_request'):
+            return self._request(json={
+                'src': f'data:{content_type};base64,{image_base64}',
+                **self.options,
+            })
+
+    def _request(self, **payload) -> dict:
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(self.backoff * (2 ** (attempt - 1)))
+            try:
+                response = self.session.post(self.url, timeout=self.timeout, **payload)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                last_error = e
+                continue
+            except requests.RequestException as e:
+                return {'error': str(e)}
+
+            if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                last_error = f"HTTP {response.status_code}"
+                continue
+            if not response.ok:
+                # 错误响应一律返回 'error'，不能被当作识别结果写入缓存
+                return {'error': f"HTTP {response.status_code}: {response.text[:200]}"}
+            try:
+                return response.json()
+            except ValueError as e:
+                return {'error': f"HTTP {response.status_code}: {e}"}
+
+        return {'error': str(last_error)}
+
+    def ocr_many(self, images) -> list:
+        """并发识别多张图像，结果顺序与输入一致"""
+        images = list(images)
+        if len(images) <= 1 or self.max_in_flight <= 1:
+            return [self.ocr_image(img) for img in images]
+        return list(self._executor().map(self.ocr_image, images))
+
+    def _executor(self) -> ThreadPoolExecutor:
+        # 线程池在多页、多试卷之间共享，保证全局在途请求数不超过上限
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_in_flight,
+                                                thread_name_prefix="ocr")
+            return self._pool
+
+    def close(self):
+        """关闭线程池和HTTP会话"""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+                self._pool = None
+        self.session.close()
@@ -0,0 +1,123 @@
+import math
+import os
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from metrics import timed
+
+# OCR前处理：按文字行高缩小裁剪区域，转为灰度或二值图，并限制上传字节数。
+# 页面以 300 DPI 渲染，正文行高约 40-50 像素，远高于OCR所需；大题的整段裁剪上传时可达数MB。
+# OCR_PREPROCESS=off（默认，按原图上传）| color | gray | binary
+OCR_PREPROCESS = os.getenv("OCR_PREPROCESS", "off")
+# 缩放后的目标行高（像素）
+OCR_TARGET_TEXT_PX = int(os.getenv("OCR_TARGET_TEXT_PX", "28"))
+# 单个区域的最大像素数，超过时进一步缩小
+OCR_MAX_PIXELS = int(os.getenv("OCR_MAX_PIXELS", "4000000"))
+# 编码后的上传字节上限（KB），0 表示不限制
+OCR_MAX_UPLOAD_KB = int(os.getenv("OCR_MAX_UPLOAD_KB", "0"))
+
+MODES = ('color', 'gray', 'binary')
+# 按行高缩放时的最小比例，避免估计偏大时把文字缩得无法识别
+MIN_SCALE = 0.25
+# 低于此高度（像素）的墨迹行不计为文字行：300 DPI 下的横线、虚线答题线和噪点
+MIN_TEXT_PX = 10
+# 超出字节上限时最多重新编码的次数
+MAX_ATTEMPTS = 4
+
+
+def to_gray(img: np.ndarray) -> np.ndarray:
+    """BGR/BGRA 转灰度，已是灰度时原样返回"""
+    if img.ndim == 2:
+        return img
+    code = cv2.COLOR_BGRA2GRAY if img.shape[2] == 4 else cv2.COLOR_BGR2GRAY
+    return cv2.cvtColor(img, code)
+
+
+def estimate_text_height(gray: np.ndarray) -> Optional[float]:
+    """
+    用水平投影估计文字行高（像素）：Otsu 二值化后统计每行的墨迹像素，
+    连续的墨迹行组成一个文字行，取其高度的中位数。没有可识别的文字行时返回 None。
+    """
+    if gray.size == 0:
+        return None
+    _, ink = cv2.threshold(gray, 0, 1, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    rows = ink.sum(axis=1) > max(2, gray.shape[1] // 500)
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], rows.view(np.int8), [0]))))
+    heights = edges[1::2] - edges[::2]
+    heights = heights[heights >= MIN_TEXT_PX]  # 去掉横线、虚线答题线和噪点
+    if not len(heights):
+        return None
+    return float(np.median(heights))
+
+
+class OCRPreprocessor:
+    """
+    OCR前处理：选择缩放比例（按文字行高和像素上限，只缩小不放大），转换颜色模式，
+    编码后超过字节上限时按比例继续缩小重新编码。scale 固定时跳过行高估计（用于验证各个比例的效果）。
+    """
+
+    def __init__(self, mode: str = 'gray', target_text_px: int = OCR_TARGET_TEXT_PX,
+                 max_pixels: int = OCR_MAX_PIXELS, max_bytes: int = OCR_MAX_UPLOAD_KB * 1024,
+                 scale: float = None):
+        if mode not in MODES:
+            raise ValueError(f"Unknown OCR preprocess mode: {mode}, expected one of {MODES}")
+        self.mode = mode
+        self.target_text_px = target_text_px
+        self.max_pixels = max_pixels
+        self.max_bytes = max_bytes or None
+        self.scale = scale
+
+    @classmethod
+    def from_env(cls) -> Optional['OCRPreprocessor']:
+        """按环境变量创建；OCR_PREPROCESS=off 时返回 None（不做前处理）"""
+        if OCR_PREPROCESS == 'off':
+            return None
+        return cls(OCR_PREPROCESS)
+
+    @property
+    def settings(self) -> dict:
+        """影响OCR输入的设置（写入构建指纹）"""
+        return {'mode': self.mode, 'target_text_px': self.target_text_px, 'max_pixels': self.max_pixels,
+                'max_bytes': self.max_bytes, 'scale': self.scale}
+
+    def choose_scale(self, gray: np.ndarray) -> float:
+        """按文字行高和像素上限选择缩放比例（不超过 1）"""
+        scale = 1.0
+        text_height = estimate_text_height(gray)
+        if text_height:
+            scale = max(MIN_SCALE, min(scale, self.target_text_px / text_height))
+        pixels = gray.shape[0] * gray.shape[1]
+        if pixels * scale * scale > self.max_pixels:
+            scale = math.sqrt(self.max_pixels / pixels)
+        return scale
+
+    def transform(self, img: np.ndarray, scale: float) -> np.ndarray:
+        """缩放（INTER_AREA）并按模式二值化；img 已按模式转换过颜色"""
+        if scale < 1.0:
+            size = (max(1, round(img.shape[1] * scale)), max(1, round(img.shape[0] * scale)))
+            img = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+        if self.mode == 'binary':
+            _, img = cv2.threshold(img, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        return img
+
+    def apply(self, img: np.ndarray, encode) -> tuple:
+        """
+        前处理并编码，encode(img) 返回 (data, content_type)。
+        返回 (data, content_type, scale)；scale 为最终使用的缩放比例。
+        """
+        with timed('preprocess'):
+            gray = to_gray(img)
+            base = img if self.mode == 'color' else gray
+            scale = self.scale if self.scale is not None else self.choose_scale(gray)
+        for attempt in range(MAX_ATTEMPTS):
+            with timed('preprocess'):
+                prepared = self.transform(base, scale)
+            with timed('encode'):
+                data, content_type = encode(prepared)
+            if self.max_bytes is None or len(data) <= self.max_bytes or attempt == MAX_ATTEMPTS - 1:
+                break
+            # 字节数大致与像素数成正比，按面积比例缩小并留一点余量
+            scale *= math.sqrt(self.max_bytes / len(data)) * 0.9
+        return data, content_type, scale
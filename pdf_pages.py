@@ -0,0 +1,62 @@
+from typing import Optional
+
+import cv2
+import fitz  # PyMuPDF
+import numpy as np
+
+from metrics import timed
+
+# 要过滤的关键词
+IGNORE_KEYWORDS = ["BLANK PAGE", "Additional Page", "INSTRUCTIONS"]
+DEFAULT_DPI = 300
+
+
+class _PixmapArray:
+    """通过 __array_interface__ 暴露 pixmap 的像素内存；作为数组的 base 保证 pixmap 不被提前释放"""
+
+    def __init__(self, pix: fitz.Pixmap):
+        self.pixmap = pix
+        self.__array_interface__ = {
+            'version': 3,
+            'shape': (pix.height, pix.width, pix.n),
+            'typestr': '|u1',
+            'strides': (pix.stride, pix.n, 1),
+            'data': (pix.samples_ptr, False),
+        }
+
+
+def page_skip_reason(index: int, page) -> Optional[str]:
+    """返回跳过该页的原因；需要保留时返回 None。只读取文本，不做渲染"""
+    # 规则1: 固定跳过第一页
+    if index == 0:
+        return "Cover Page"
+
+    # 规则2: 检查页面文本，过滤无用页面
+    text = page.get_text("text")
+    if any(keyword in text for keyword in IGNORE_KEYWORDS):
+        return "Contains ignored keyword"
+
+    return None
+
+
+def pixmap_to_bgr(pix: fitz.Pixmap) -> np.ndarray:
+    """
+    将RGB pixmap 零拷贝地包装为NumPy数组，并原地转换为OpenCV使用的BGR顺序。
+    转换后 pixmap 本身的通道顺序也随之改变。
+    """
+    if pix.n != 3 or pix.alpha:
+        raise ValueError(f"Expected an RGB pixmap without alpha, got n={pix.n}, alpha={pix.alpha}")
+    view = np.asarray(_PixmapArray(pix))
+    cv2.cvtColor(view, cv2.COLOR_RGB2BGR, dst=view)
+    return view
+
+
+def render_page(page, dpi=DEFAULT_DPI, save_path=None) -> np.ndarray:
+    """渲染单页为BGR数组；save_path 不为空时同时保存为PNG"""
+    with timed('render'):
+        pix = page.get_pixmap(dpi=dpi)
+        if save_path is not None:
+            # 必须在原地转换为BGR之前保存
+            pix.save(save_path)
+        return pixmap_to_bgr(pix)
+
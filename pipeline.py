@@ -0,0 +1,205 @@
+import os
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import partial
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from build_manifest import sha256_file
+from metrics import observe_stage, timed
+from detection import BatchDetector
+from detection_cache import CachedDetector
+from ocr_cache import OCRCache
+from ocr_client import MathpixClient
+from ocr_preprocess import OCRPreprocessor
+from question_classifier import QuestionClassifier
+
+# 各阶段名称：timings 字典的键和 hook 的 stage 参数
+STAGES = ('load', 'detect', 'crop', 'ocr', 'classify')
+
+
+@dataclass
+class Region:
+    """页面上的一个检测区域，按从上到下的顺序编号；image 是页面图像的切片视图（不复制像素）"""
+    index: int
+    bbox: list  # [x1, y1, x2, y2]，整数像素坐标
+    image: np.ndarray
+    ocr: Optional[dict] = None
+
+    @property
+    def ok(self) -> bool:
+        """OCR是否成功返回了文本"""
+        return bool(self.ocr) and 'text' in self.ocr
+
+    @property
+    def text(self) -> str:
+        return self.ocr['text'] if self.ok else ''
+
+    @property
+    def error(self):
+        return self.ocr.get('error') if self.ocr else None
+
+
+def classify_questions(paper_id: str, analysis_results: list) -> list:
+    """默认的分类阶段：按题号规则把区域组织为 Question"""
+    return QuestionClassifier(paper_id).classify_regions(analysis_results)
+
+
+def analysis_results(regions, page: str) -> list:
+    """OCR成功的区域转换为分类器的输入；index 为成功区域的顺序号"""
+    results = []
+    for region in regions:
+        if region.ok:
+            results.append({
+                'text': region.ocr['text'],
+                'index': len(results),
+                'page': page,
+                'bbox': region.bbox,
+                'ocr_confidence': region.ocr.get('confidence', 0)
+            })
+    return results
+
+
+def read_image(path):
+    """读取并解码页面图片（线程安全，可在后台线程预读），无法读取时返回 None"""
+    with timed('decode'):
+        return cv2.imread(str(path))
+
+
+def ocr_client_from_env(**options) -> MathpixClient:
+    """
+    按环境变量创建 Mathpix 客户端（MATHPIX_APP_ID / MATHPIX_API_KEY / MATHPIX_API_URL），
+    OCR缓存见 OCRCache.from_env，前处理见 OCRPreprocessor.from_env
+    """
+    options.setdefault('cache', OCRCache.from_env())
+    options.setdefault('preprocess', OCRPreprocessor.from_env())
+    return MathpixClient(os.getenv('MATHPIX_APP_ID'), os.getenv('MATHPIX_API_KEY'), **options)
+
+
+class Pipeline:
+    """
+    detect → crop → OCR → classify 分阶段处理流程，build_dataset.py 和各调试脚本共用。
+    各阶段可替换：detector 为 detection.BatchDetector（后端可带检测缓存）；ocr 为提供 ocr_many()/ocr_image()
+    的客户端，默认 MathpixClient（共享 keep-alive 连接池、有界并发和OCR缓存）；
+    classifier(paper_id, analysis_results) 返回 Question 列表。
+    每个阶段结束时以 hook(stage, seconds) 调用所有 hooks（默认记入 metrics.STAGE_SECONDS）；
+    方法的 timings 字典不为空时同时按阶段累加耗时。
+    """
+
+    def __init__(self, detector: BatchDetector, ocr=None, classifier=classify_questions,
+                 hooks=(observe_stage,)):
+        self.detector = detector
+        self.ocr = ocr
+        self.classifier = classifier
+        self.hooks = list(hooks)
+
+    @classmethod
+    def from_model(cls, model_path, backend: str = None, device=None, batch_size=4, imgsz=640,
+                   detection_cache='env', ocr=None, **kwargs) -> 'Pipeline':
+        """按模型路径创建：带检测缓存的批量检测器（模型在第一次未命中时才加载），ocr 缺省时按环境变量创建"""
+        detector = BatchDetector(
+            CachedDetector(model_path, backend=backend, device=device, cache=detection_cache),
+            batch_size=batch_size, imgsz=imgsz
+        )
+        return cls(detector, ocr=ocr if ocr is not None else ocr_client_from_env(), **kwargs)
+
+    @property
+    def backend(self):
+        return self.detector.backend
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    @contextmanager
+    def timed(self, stage: str, timings: dict = None):
+        """把代码块的耗时报告给 hooks，并累加到 timings[stage]（timings 为 None 时不累加）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._report(stage, time.perf_counter() - start, timings)
+
+    def _report(self, stage: str, seconds: float, timings: dict = None, pages: int = 1):
+        # 耗时整体累加到 timings，hooks 按页调用，每页分得 seconds / pages
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + seconds
+        for _ in range(pages):
+            for hook in self.hooks:
+                hook(stage, seconds / pages)
+
+    def _timed_batches(self, stage: str, batches, timings: dict = None):
+        # 每个批次整体计时（包括等待后台预读），耗时平均分摊到批次中的各页；调用方处理各页的时间不计入
+        batches = iter(batches)
+        while True:
+            start = time.perf_counter()
+            batch = next(batches, None)
+            if batch is None:
+                return
+            self._report(stage, time.perf_counter() - start, timings, pages=len(batch))
+            yield from batch
+
+    # --- detect ---
+
+    def detect_images(self, items, page_hash=None, timings: dict = None):
+        """items 为 (key, img)，批量检测并逐页产出 (key, img, boxes)，见 BatchDetector.iter_images"""
+        return self._timed_batches('detect', self.detector.iter_batches(items, page_hash=page_hash), timings)
+
+    def detect_pages(self, image_paths, timings: dict = None):
+        """从磁盘预读页面并批量检测，产出 (path, img, boxes)；检测缓存按文件内容哈希"""
+        loaders = ((path, partial(read_image, path)) for path in image_paths)
+        return self.detect_images(self.detector.read_ahead(loaders), page_hash=sha256_file, timings=timings)
+
+    # --- crop / OCR ---
+
+    def crop(self, img: np.ndarray, boxes, timings: dict = None) -> list:
+        """按检测框裁剪（NumPy 切片，不复制像素）"""
+        with self.timed('crop', timings):
+            regions = []
+            for box in boxes:
+                x1, y1, x2, y2 = map(int, box)
+                regions.append(Region(len(regions), [x1, y1, x2, y2], img[y1:y2, x1:x2]))
+        return regions
+
+    def recognize(self, regions: list, timings: dict = None) -> bool:
+        """并发OCR所有区域并写入 region.ocr（顺序与区域一致）；返回是否全部成功"""
+        with self.timed('ocr', timings):
+            results = self.ocr.ocr_many(region.image for region in regions)
+        for region, result in zip(regions, results):
+            region.ocr = result
+        return all(region.ok for region in regions)
+
+    def process_image(self, img: np.ndarray, boxes=None, page_hash: str = None, timings: dict = None) -> list:
+        """单页 检测（boxes 缺省时）→ 裁剪 → OCR，返回 Region 列表"""
+        if boxes is None:
+            with self.timed('detect', timings):
+                boxes = self.detector.detect_images([img], None if page_hash is None else [page_hash])[0]
+        regions = self.crop(img, boxes, timings)
+        self.recognize(regions, timings)
+        return regions
+
+    def process_file(self, image_path, timings: dict = None) -> tuple:
+        """读取单张页面图片并处理，返回 (img, regions)；无法读取时返回 (None, [])"""
+        with self.timed('load', timings):
+            img = read_image(image_path)
+        if img is None:
+            return None, []
+        return img, self.process_image(img, page_hash=sha256_file(image_path), timings=timings)
+
+    def process_pages(self, image_paths, timings: dict = None):
+        """批量检测多页（同时预读后续页面），逐页裁剪并OCR，产出 (path, img, regions)；无法读取时 img 为 None"""
+        for path, img, boxes in self.detect_pages(image_paths, timings):
+            yield path, img, self.process_image(img, boxes, timings=timings) if img is not None else []
+
+    # --- classify ---
+
+    def classify(self, paper_id: str, analysis_results: list, timings: dict = None) -> list:
+        with self.timed('classify', timings):
+            return self.classifier(paper_id, analysis_results)
+
+    def close(self):
+        if self.ocr is not None and hasattr(self.ocr, 'close'):
+            self.ocr.close()
+
@@ -1,8 +1,74 @@
 import re
+import sys
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import List, NamedTuple, Optional, Tuple
 
-@dataclass
+# 开头的主题号："4\n..."、"9 The equation..."、"7 (a) Prove..." 或 LaTeX 格式 "\( 7 \quad \) Let..."
+_HEAD_NUMBER_RE = re.compile(
+    r'\s*(?:(\d+)(?:[^\S\n]*(?:\n|\Z)|\s+[A-Z(])'
+    r'|\\\(\s*(\d+)\s+\\quad\s*\\\)\s+[A-Z])'
+)
+# 行内/行间公式：\( ... \)、\[ ... \]、$ ... $，按此顺序依次移除
+_INLINE_LATEX_RE = re.compile(r'\\\([^)]+\\\)')
+_DISPLAY_LATEX_RE = re.compile(r'\\\[[^\]]+\\\]')
+_DOLLAR_LATEX_RE = re.compile(r'\$[^$]+\$')
+# 小题标签 (a)、(ii) 等，连同其后的空白一起匹配
+_PART_LABEL_RE = re.compile(r'\(([a-z]+)\)(\s*)')
+_PARENT_LETTER_RE = re.compile(r'([a-z])\(')
+_SPECIAL_SUB_RE = re.compile(r'^(\d+)\s+\(([a-z]+|i+)\)\s+(.*)', re.DOTALL)
+_EMBEDDED_SUB_RE = re.compile(r'\n\(([a-z]+|i+)\)\s+(.*?)(?=\n\([a-z]+|i+\)|\[|\Z)', re.DOTALL)
+
+class Token(NamedTuple):
+    """词法单元：kind 为 number / latex_number（主题号）或 letter / roman / label（小题标签）"""
+    kind: str
+    value: str
+    start: int
+    end: int     # 主题号或标签右括号之后的位置
+    follow: int  # 其后空白结束的位置，即下一个非空白字符的位置
+
+def _label_kind(value: str) -> str:
+    if len(value) == 1:
+        return 'letter'  # (i) 也按字母处理，与 (a)、(b) 同级
+    if not value.strip('i'):
+        return 'roman'
+    return 'label'
+
+def _is_roman(token: Token) -> bool:
+    return not token.value.strip('i')
+
+def strip_latex(text: str) -> str:
+    """移除LaTeX内容；后两种公式较少见，先用子串判断跳过不必要的扫描"""
+    text = _INLINE_LATEX_RE.sub('', text)
+    if '\\[' in text:
+        text = _DISPLAY_LATEX_RE.sub('', text)
+    if '$' in text:
+        text = _DOLLAR_LATEX_RE.sub('', text)
+    return text
+
+def lex_question_text(text: str) -> Tuple[Optional[Token], str, List[Token]]:
+    """
+    单遍词法分析，返回 (主题号, 去除LaTeX后的文本, 小题标签列表)。
+    文本以主题号开头时只返回主题号（偏移量相对原文）；
+    否则去除LaTeX内容后扫描一遍，返回所有小题标签（偏移量相对去除LaTeX后的文本）。
+    """
+    head = _HEAD_NUMBER_RE.match(text)
+    if head:
+        if head.group(1) is not None:
+            return Token('number', head.group(1), head.start(1), head.end(1), head.end(1)), '', []
+        return Token('latex_number', head.group(2), head.start(2), head.end(2), head.end(2)), '', []
+
+    cleaned = strip_latex(text)
+    labels = [
+        Token(_label_kind(m.group(1)), m.group(1), m.start(), m.end(1) + 1, m.end())
+        for m in _PART_LABEL_RE.finditer(cleaned)
+    ]
+    return None, cleaned, labels
+
+def _intern(value):
+    """题号、类型、试卷信息等短字符串在整个语料中大量重复，驻留后只保留一份"""
+    return sys.intern(value) if type(value) is str else value
+
+@dataclass(slots=True)
 class QuestionPart:
     """单个题目部分"""
     text: str
@@ -10,14 +76,42 @@ class QuestionPart:
     part_type: str   # "main" 或 "sub"
     sub_letter: Optional[str] = None  # 子题字母，如 "a", "b", "c"
     cropped_image_path: Optional[str] = None
+    page: Optional[str] = None  # 所在页面，如 "page_4"
+    bbox: Optional[List[int]] = None  # 页面上的检测框 [x1, y1, x2, y2]
+    ocr_confidence: Optional[float] = None
+
+    def __post_init__(self):
+        self.question_id = _intern(self.question_id)
+        self.part_type = _intern(self.part_type)
+        self.sub_letter = _intern(self.sub_letter)
+        self.cropped_image_path = _intern(self.cropped_image_path)
+        self.page = _intern(self.page)
 
-@dataclass  
+    @classmethod
+    def from_dict(cls, data: dict) -> 'QuestionPart':
+        """从数据集JSON中的题目部分还原"""
+        return cls(
+            text=data['text'],
+            question_id=data['question_id'],
+            part_type=data.get('type', 'sub' if data.get('sub_letter') else 'main'),
+            sub_letter=data.get('sub_letter'),
+            cropped_image_path=data.get('cropped_image_path'),
+            page=data.get('page'),
+            bbox=data.get('bbox'),
+            ocr_confidence=data.get('ocr_confidence')
+        )
+
+@dataclass(slots=True)
 class Question:
     """完整题目，包含主题和所有子题"""
     main_question_id: str  # 如 "4"
     paper_info: str       # 如 "9709_s20_qp_11"
     main_part: QuestionPart
     sub_parts: List[QuestionPart]
+
+    def __post_init__(self):
+        self.main_question_id = _intern(self.main_question_id)
+        self.paper_info = _intern(self.paper_info)
     
     def get_full_id(self, sub_letter: str = None) -> str:
         """获取完整题目ID"""
@@ -25,6 +119,41 @@ class Question:
             return f"{self.paper_info}_Q{self.main_question_id}({sub_letter})"
         return f"{self.paper_info}_Q{self.main_question_id}"
 
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Question':
+        """从数据集JSON中的题目还原（*_dataset.json 的 questions 列表元素）"""
+        return cls(
+            main_question_id=data['main_question_id'],
+            paper_info=data['paper_info'],
+            main_part=QuestionPart.from_dict(data['main_part']),
+            sub_parts=[QuestionPart.from_dict(sub) for sub in data.get('sub_parts', [])]
+        )
+
+@dataclass(slots=True)
+class IndexEntry:
+    """
+    搜索索引条目，只保存对题目对象的引用，文本从题目部分读取而不复制。
+    兼容旧的字典形式访问：entry['text']、entry['type']、entry['question']、entry['sub_part']
+    """
+    type: str  # "main" 或 "sub"
+    question: Question
+    sub_part: Optional[QuestionPart] = None
+
+    @property
+    def text(self) -> str:
+        return (self.sub_part or self.question.main_part).text
+
+    def __getitem__(self, key: str):
+        if key not in ('text', 'type', 'question', 'sub_part') or (key == 'sub_part' and self.sub_part is None):
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
 class QuestionClassifier:
     """题目分类器，将检测到的区域组织成层次结构"""
     
@@ -43,6 +172,12 @@ class QuestionClassifier:
         for result in analysis_results:
             text = result['text']
             index = result['index']
+            # 区域来源（页面、检测框、OCR置信度），主题和内嵌的子题共用
+            region = {
+                'page': result.get('page'),
+                'bbox': result.get('bbox'),
+                'ocr_confidence': result.get('ocr_confidence')
+            }
             
             # 分析这个区域是主题还是子题
             part_info = self._analyze_question_part(text)
@@ -63,7 +198,8 @@ class QuestionClassifier:
                     text=main_text,
                     question_id=part_info['main_id'],
                     part_type='main',
-                    cropped_image_path=f"cropped_question_{index+1}.png"
+                    cropped_image_path=f"cropped_question_{index+1}.png",
+                    **region
                 )
                 
                 current_main_question = Question(
@@ -80,7 +216,8 @@ class QuestionClassifier:
                         question_id=f"{part_info['main_id']}({embedded_sub['letter']})",
                         part_type='sub',
                         sub_letter=embedded_sub['letter'],
-                        cropped_image_path=f"cropped_question_{index+1}.png"
+                        cropped_image_path=f"cropped_question_{index+1}.png",
+                        **region
                     )
                     current_main_question.sub_parts.append(sub_part)
                     current_parent_letter = embedded_sub['letter']
@@ -100,7 +237,7 @@ class QuestionClassifier:
                     elif '(' in sub_letter:
                         # 这是已经组合好的嵌套子题，如 a(i), b(i)
                         # 提取父级字母
-                        parent_match = re.match(r'([a-z])\(', sub_letter)
+                        parent_match = _PARENT_LETTER_RE.match(sub_letter)
                         if parent_match:
                             current_parent_letter = parent_match.group(1)
                     
@@ -109,7 +246,8 @@ class QuestionClassifier:
                         question_id=f"{current_main_question.main_question_id}({sub_letter})",
                         part_type='sub',
                         sub_letter=sub_letter,
-                        cropped_image_path=f"cropped_question_{index+1}.png"
+                        cropped_image_path=f"cropped_question_{index+1}.png",
+                        **region
                     )
                     current_main_question.sub_parts.append(sub_part)
                 else:
@@ -128,8 +266,7 @@ class QuestionClassifier:
         """
         # 特殊格式：7 (a) Prove the identity... 或 7 (i) Prove the identity...
         # 检查是否以 "数字 (字母或罗马数字)" 开头
-        special_pattern = r'^(\d+)\s+\(([a-z]+|i+)\)\s+(.*)'
-        special_match = re.match(special_pattern, text.strip(), re.DOTALL)
+        special_match = _SPECIAL_SUB_RE.match(text.strip())
         
         if special_match:
             question_num = special_match.group(1)
@@ -143,8 +280,7 @@ class QuestionClassifier:
             }
         
         # 普通格式：寻找换行后的(a)或(i)
-        sub_pattern = r'\n\(([a-z]+|i+)\)\s+(.*?)(?=\n\([a-z]+|i+\)|\[|\Z)'
-        match = re.search(sub_pattern, text, re.DOTALL)
+        match = _EMBEDDED_SUB_RE.search(text)
         
         if match:
             # 找到(a)部分
@@ -164,145 +300,107 @@ class QuestionClassifier:
     
     def _analyze_question_part(self, text: str) -> dict:
         """分析文本确定是主题还是子题"""
-        lines = text.strip().split('\n')
-        
-        # 检查第一行是否是纯数字（主题号）
-        first_line = lines[0].strip()
-        if re.match(r'^\d+$', first_line):
-            return {
-                'type': 'main',
-                'main_id': first_line,
-                'sub_letter': None
-            }
-        
-        # 检查文本开头是否包含新的主题号（如 "9 The equation..." 或 "7 (a) Prove..." 或 "\( 7 \quad \) Let..."）
-        main_number_match = re.match(r'^(\d+)\s+[A-Z(]', text.strip())
-        if main_number_match:
+        head, cleaned_text, labels = lex_question_text(text)
+        if head is not None:
             return {
                 'type': 'main',
-                'main_id': main_number_match.group(1),
+                'main_id': head.value,
                 'sub_letter': None
             }
-        
-        # 检查LaTeX格式的主题号（如 "\( 7 \quad \) Let..."）
-        latex_main_match = re.match(r'^\\\(\s*(\d+)\s+\\quad\s*\\\)\s+[A-Z]', text.strip())
-        if latex_main_match:
-            return {
-                'type': 'main',
-                'main_id': latex_main_match.group(1),
-                'sub_letter': None
-            }
-        
-        # 先清理LaTeX内容，避免 \( g(x) \) 这种干扰
-        cleaned_text = self._remove_latex_content(text)
-        
-        # 首先检查是否包含 (a)...(i) 这种嵌套在同一文本块中的结构
-        embedded_nested_match = re.search(r'^\s*\(([a-z])\)\s+.*?\n\(([i]+)\)\s', cleaned_text.strip(), re.DOTALL)
-        if embedded_nested_match:
-            main_letter = embedded_nested_match.group(1)
-            sub_number = embedded_nested_match.group(2)
-            return {
-                'type': 'sub',
-                'main_id': None,
-                'sub_letter': f"{main_letter}({sub_number})"
-            }
-        
-        # 检查嵌套结构：(a) (i) 或 (b) (ii) 等
-        nested_match = re.search(r'^\s*\(([a-z])\)\s+\(([i]+)\)\s', cleaned_text.strip())
-        if nested_match:
-            main_letter = nested_match.group(1)
-            sub_number = nested_match.group(2)
-            return {
-                'type': 'sub',
-                'main_id': None,
-                'sub_letter': f"{main_letter}({sub_number})"
-            }
-        
-        # 检查是否以 (a), (b), (c) 等开头（一级子题）
-        sub_match = re.search(r'^\s*\(([a-z])\)\s', cleaned_text.strip())
-        if sub_match:
-            return {
-                'type': 'sub',
-                'main_id': None,
-                'sub_letter': sub_match.group(1)
-            }
-        
-        # 检查是否以 (i), (ii), (iii) 等开头（二级子题，需要推断父级）
-        roman_match = re.search(r'^\s*\((i+)\)\s', cleaned_text.strip())
-        if roman_match:
-            return {
-                'type': 'sub',
-                'main_id': None,
-                'sub_letter': roman_match.group(1),
-                'is_nested': True  # 标记为嵌套子题
-            }
-        
-        # 检查文本中是否包含嵌套子题标记
-        nested_pattern = r'(?<!\\\()\s*\(([a-z])\)\s+\(([i]+)\)\s+[A-Z]'
-        nested_match = re.search(nested_pattern, cleaned_text)
-        if nested_match:
-            main_letter = nested_match.group(1)
-            sub_number = nested_match.group(2)
-            return {
-                'type': 'sub', 
-                'main_id': None,
-                'sub_letter': f"{main_letter}({sub_number})"
-            }
-        
-        # 检查文本中是否包含子题标记（更精确的模式）
-        # 寻找独立的 (a), (b), (c)，不在LaTeX公式内
-        sub_pattern = r'(?<!\\\()\s*\(([a-z])\)\s+[A-Z]'  # (a) 后面跟大写字母开头的句子
-        sub_match = re.search(sub_pattern, cleaned_text)
-        if sub_match:
-            return {
-                'type': 'sub', 
-                'main_id': None,
-                'sub_letter': sub_match.group(1)
-            }
-        
-        # 默认判断为子题（如果没有明确标识）
-        return {
+
+        sub_letter, is_nested = self._match_part_labels(cleaned_text, labels)
+        if sub_letter is None:
+            # 默认判断为子题（如果没有明确标识）
+            sub_letter = 'unknown'
+        part_info = {
             'type': 'sub',
             'main_id': None,
-            'sub_letter': 'unknown'
+            'sub_letter': sub_letter
         }
-    
+        if is_nested:
+            part_info['is_nested'] = True  # 标记为需要推断父级的嵌套子题
+        return part_info
+
+    def _match_part_labels(self, cleaned_text: str, labels: List[Token]) -> tuple:
+        """
+        根据小题标签序列判断子题编号，返回 (sub_letter 或 None, 是否需要推断父级)
+        规则按优先级依次为：
+          1. 开头 (a)，其后某行以 (i) 开头    -> a(i)
+          2. 开头 (a) (i)                    -> a(i)
+          3. 开头 (a)                        -> a
+          4. 开头 (ii)                       -> ii，父级由上下文推断
+          5. 文中 (a) (i) 后接大写字母开头的句子 -> a(i)
+          6. 文中 (a) 后接大写字母开头的句子     -> a
+        文中的标签紧跟在 "\\(" 之后时视为公式的一部分。
+        """
+        text_end = len(cleaned_text)
+
+        def spaced(token):
+            # 其后有空白，且不是文末空白
+            return token.end < token.follow < text_end
+
+        def sentence_follows(token):
+            return token.end < token.follow < text_end and 'A' <= cleaned_text[token.follow] <= 'Z'
+
+        leading = text_end - len(cleaned_text.lstrip())
+        first = labels[0] if labels and labels[0].start == leading else None
+
+        if first is not None and spaced(first):
+            if first.kind == 'letter':
+                # (a) ... \n(i)：之后某行以罗马数字标签开头；
+                # 紧跟在 (a) 后空白里的那个只在后文没有时才算（至少隔一个空白字符）
+                adjacent = None
+                for token in labels[1:]:
+                    if _is_roman(token) and cleaned_text[token.start - 1] == '\n' and spaced(token):
+                        if token.start > first.follow:
+                            return f"{first.value}({token.value})", False
+                        if token.start >= first.end + 2:
+                            adjacent = token
+                if adjacent is not None:
+                    return f"{first.value}({adjacent.value})", False
+                # (a) (i)
+                if len(labels) > 1:
+                    second = labels[1]
+                    if second.start == first.follow and _is_roman(second) and spaced(second):
+                        return f"{first.value}({second.value})", False
+                return first.value, False
+            if first.kind == 'roman':
+                return first.value, True
+
+        candidates = [
+            (i, token) for i, token in enumerate(labels)
+            if token.kind == 'letter' and cleaned_text[max(token.start - 2, 0):token.start] != '\\('
+        ]
+        for i, token in candidates:
+            if token.follow > token.end and i + 1 < len(labels):
+                roman = labels[i + 1]
+                if roman.start == token.follow and _is_roman(roman) and sentence_follows(roman):
+                    return f"{token.value}({roman.value})", False
+        for _, token in candidates:
+            if sentence_follows(token):
+                return token.value, False
+
+        return None, False
+
     def _remove_latex_content(self, text: str) -> str:
         """移除LaTeX内容，避免干扰题号识别"""
-        # 移除 \( ... \) 格式的LaTeX
-        text = re.sub(r'\\\([^)]+\\\)', '', text)
-        # 移除 \[ ... \] 格式的LaTeX  
-        text = re.sub(r'\\\[[^\]]+\\\]', '', text)
-        # 移除 $ ... $ 格式的LaTeX
-        text = re.sub(r'\$[^$]+\$', '', text)
-        return text
+        return strip_latex(text)
     
     def build_search_index(self, questions: List[Question]) -> dict:
-        """构建搜索索引，便于答案匹配"""
+        """构建搜索索引，便于答案匹配；简短搜索词与完整ID指向同一个条目"""
         search_index = {}
         
         for question in questions:
             # 主题索引
-            main_id = question.get_full_id()
-            search_index[main_id] = {
-                'text': question.main_part.text,
-                'type': 'main',
-                'question': question
-            }
+            search_index[question.get_full_id()] = IndexEntry('main', question)
             
             # 子题索引
             for sub_part in question.sub_parts:
-                sub_id = question.get_full_id(sub_part.sub_letter)
-                search_index[sub_id] = {
-                    'text': sub_part.text,
-                    'type': 'sub',
-                    'question': question,
-                    'sub_part': sub_part
-                }
+                entry = IndexEntry('sub', question, sub_part)
+                search_index[question.get_full_id(sub_part.sub_letter)] = entry
                 
                 # 也可以用简短的搜索词
-                search_key = f"Q{question.main_question_id}({sub_part.sub_letter})"
-                search_index[search_key] = search_index[sub_id]
+                search_index[f"Q{question.main_question_id}({sub_part.sub_letter})"] = entry
         
         return search_index
 
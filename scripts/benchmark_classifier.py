@@ -0,0 +1,104 @@
+import argparse
+import glob
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from question_classifier import QuestionClassifier
+
+# 题目分类器基准测试：对比逐条正则匹配（旧实现）与单遍词法分析的速度，并校验结果一致
+# 用法: python scripts/benchmark_classifier.py --repeat 200
+
+
+def legacy_analyze_question_part(text: str) -> dict:
+    """旧实现：依次尝试九个正则，作为基准和正确性参照"""
+    lines = text.strip().split('\n')
+    first_line = lines[0].strip()
+    if re.match(r'^\d+$', first_line):
+        return {'type': 'main', 'main_id': first_line, 'sub_letter': None}
+    main_number_match = re.match(r'^(\d+)\s+[A-Z(]', text.strip())
+    if main_number_match:
+        return {'type': 'main', 'main_id': main_number_match.group(1), 'sub_letter': None}
+    latex_main_match = re.match(r'^\\\(\s*(\d+)\s+\\quad\s*\\\)\s+[A-Z]', text.strip())
+    if latex_main_match:
+        return {'type': 'main', 'main_id': latex_main_match.group(1), 'sub_letter': None}
+
+    cleaned_text = re.sub(r'\\\([^)]+\\\)', '', text)
+    cleaned_text = re.sub(r'\\\[[^\]]+\\\]', '', cleaned_text)
+    cleaned_text = re.sub(r'\$[^$]+\$', '', cleaned_text)
+
+    match = re.search(r'^\s*\(([a-z])\)\s+.*?\n\(([i]+)\)\s', cleaned_text.strip(), re.DOTALL)
+    if match:
+        return {'type': 'sub', 'main_id': None, 'sub_letter': f"{match.group(1)}({match.group(2)})"}
+    match = re.search(r'^\s*\(([a-z])\)\s+\(([i]+)\)\s', cleaned_text.strip())
+    if match:
+        return {'type': 'sub', 'main_id': None, 'sub_letter': f"{match.group(1)}({match.group(2)})"}
+    match = re.search(r'^\s*\(([a-z])\)\s', cleaned_text.strip())
+    if match:
+        return {'type': 'sub', 'main_id': None, 'sub_letter': match.group(1)}
+    match = re.search(r'^\s*\((i+)\)\s', cleaned_text.strip())
+    if match:
+        return {'type': 'sub', 'main_id': None, 'sub_letter': match.group(1), 'is_nested': True}
+    match = re.search(r'(?<!\\\()\s*\(([a-z])\)\s+\(([i]+)\)\s+[A-Z]', cleaned_text)
+    if match:
+        return {'type': 'sub', 'main_id': None, 'sub_letter': f"{match.group(1)}({match.group(2)})"}
+    match = re.search(r'(?<!\\\()\s*\(([a-z])\)\s+[A-Z]', cleaned_text)
+    if match:
+        return {'type': 'sub', 'main_id': None, 'sub_letter': match.group(1)}
+    return {'type': 'sub', 'main_id': None, 'sub_letter': 'unknown'}
+
+
+def load_region_texts(pattern: str) -> list:
+    """从已生成的数据集中还原各区域的OCR文本（主题文本 + 各子题文本）"""
+    texts = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path, 'r', encoding='utf-8') as f:
+            for question in json.load(f)['questions']:
+                texts.append(question['main_part']['text'])
+                texts.extend(sub['text'] for sub in question['sub_parts'])
+    return texts
+
+
+def time_it(func, texts, rounds):
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for text in texts:
+            func(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark QuestionClassifier region analysis")
+    parser.add_argument('--datasets', default="*_dataset.json", help="数据集文件的glob模式")
+    parser.add_argument('--repeat', type=int, default=200, help="把语料复制多少份，模拟大规模语料")
+    parser.add_argument('--rounds', type=int, default=5, help="重复计时次数，取最快一次")
+    args = parser.parse_args()
+
+    texts = load_region_texts(args.datasets)
+    if not texts:
+        print(f"❌ No datasets match {args.datasets}")
+        return
+
+    classifier = QuestionClassifier("benchmark")
+    mismatches = [t for t in texts if legacy_analyze_question_part(t) != classifier._analyze_question_part(t)]
+    if mismatches:
+        print(f"❌ {len(mismatches)} regions classified differently, e.g. {mismatches[0][:80]!r}")
+        sys.exit(1)
+
+    corpus = texts * args.repeat
+    print(f"📚 {len(texts)} regions x {args.repeat} = {len(corpus)} regions, results identical")
+
+    legacy = time_it(legacy_analyze_question_part, corpus, args.rounds)
+    lexer = time_it(classifier._analyze_question_part, corpus, args.rounds)
+    print(f"  legacy regex chain: {legacy:.3f}s ({len(corpus) / legacy:,.0f} regions/sec)")
+    print(f"  single-pass lexer:  {lexer:.3f}s ({len(corpus) / lexer:,.0f} regions/sec)")
+    print(f"🚀 Speedup: {legacy / lexer:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
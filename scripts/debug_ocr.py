@@ -1,52 +1,24 @@
-import os
 import re
-import requests
 import json
-import base64
+import sys
 import cv2
 from pathlib import Path
-from ultralytics import YOLO
 from dotenv import load_dotenv
 
-# --- 1. 加载环境变量和辅助函数 ---
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from pipeline import Pipeline
+from metrics import REGISTRY
+
+# --- 1. 加载环境变量 ---
+# MATHPIX_APP_ID / MATHPIX_API_KEY，OCR 和检测结果缓存的设置见 README
 load_dotenv()
-MATHPIX_APP_ID = os.getenv("MATHPIX_APP_ID")
-MATHPIX_API_KEY = os.getenv("MATHPIX_API_KEY")
-
-
-def image_to_base64(image):
-    """将OpenCV图片对象转换为Base64字符串"""
-    _, buffer = cv2.imencode('.png', image)
-    return base64.b64encode(buffer).decode('utf-8')
-
-
-def call_mathpix_ocr(image_b64):
-    """调用Mathpix API进行OCR识别"""
-    if not (MATHPIX_APP_ID and MATHPIX_API_KEY):
-        raise ValueError("请确保.env文件中设置了MATHPIX_APP_ID和MATHPIX_API_KEY")
-
-    url = "https://api.mathpix.com/v3/text"
-    headers = {
-        "app_id": MATHPIX_APP_ID,
-        "app_key": MATHPIX_API_KEY,
-        "Content-type": "application/json"
-    }
-    payload = {
-        "src": f"data:image/png;base64,{image_b64}",
-        "formats": ["text"]
-    }
-    try:
-        response = requests.post(url, headers=headers, data=json.dumps(payload))
-        response.raise_for_status()
-        return response.json().get("text", "OCR FAILED OR RETURNED EMPTY")
-    except requests.exceptions.RequestException as e:
-        return f"Error calling Mathpix API: {e}"
 
 
 # --- 2. 核心处理器 ---
 class DocumentProcessor:
-    def __init__(self, model_path):
-        self.model = YOLO(model_path)
+    def __init__(self, model_path, batch_size=4, imgsz=640, backend=None):
+        # 检测结果按页面内容缓存，重复调试同一批页面时不加载模型
+        self.pipeline = Pipeline.from_model(model_path, backend=backend, batch_size=batch_size, imgsz=imgsz)
         self.current_main_id = None
         self.last_sub_id = None
 
@@ -69,22 +41,16 @@ class DocumentProcessor:
         all_questions_data = []
         doc_name = sorted_page_paths[0].parent.name
 
-        for page_path in sorted_page_paths:
+        # 批量检测多页，区域已按y坐标从上到下排序，每页的区域并发OCR
+        for page_path, img, regions in self.pipeline.process_pages(sorted_page_paths):
             print(f"--- Processing {page_path.name} ---")
-            img = cv2.imread(str(page_path))
             if img is None:
                 print(f"  > Warning: Could not read image {page_path.name}, skipping.")
                 continue
 
-            results = self.model(img)
-            boxes = sorted(results[0].boxes, key=lambda box: box.xyxy[0][1])
-
-            for i, box in enumerate(boxes):
-                xyxy = box.xyxy[0].cpu().numpy().astype(int)
-                cropped_img = img[xyxy[1]:xyxy[3], xyxy[0]:xyxy[2]]
-
-                b64_img = image_to_base64(cropped_img)
-                ocr_text = call_mathpix_ocr(b64_img)
+            for region in regions:
+                cropped_img = region.image
+                ocr_text = region.text if region.ok else "OCR FAILED OR RETURNED EMPTY"
 
                 main_ids, sub_ids = self._extract_ids(ocr_text)
                 is_inferred = False
@@ -152,5 +118,8 @@ if __name__ == '__main__':
         output_json_path = PROJECT_ROOT / "data" / "processed_questions" / f"{paper_to_test}_dataset.json"
         with open(output_json_path, 'w', encoding='utf-8') as f:
             json.dump(document_questions, f, indent=2, ensure_ascii=False)
+        # 各阶段的延迟分布，方便对比改动前后的耗时
+        timing_path = REGISTRY.write_report(output_json_path.with_name(f"{paper_to_test}_timing.json"))
 
-        print(f"\n✅ Test complete. Successfully created structured dataset at {output_json_path}")
\ No newline at end of file
+        print(f"\n✅ Test complete. Successfully created structured dataset at {output_json_path}")
+        print(f"⏱️  Timing report: {timing_path}")
\ No newline at end of file
@@ -0,0 +1,173 @@
+import argparse
+import glob
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from detection import OnnxBackend, UltralyticsBackend, letterbox, onnx_path_for
+
+# 把训练好的 best.pt 导出为 ONNX（动态输入尺寸，onnxruntime CPU 推理用），可选INT8量化，
+# 并在样例页面上对比 PyTorch 与 ONNX 的检测框和速度。
+# 用法: python scripts/export_onnx.py --int8 --compare
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_WEIGHTS = PROJECT_ROOT / "models" / "pastpaper_detector_demo" / "weights" / "best.pt"
+DEFAULT_SAMPLES = str(PROJECT_ROOT / "data" / "annotated_dataset" / "valid" / "images" / "*.jpg")
+
+
+def export_onnx(weights: Path, imgsz: int = 640, opset: int = None) -> Path:
+    """导出为 <weights>.onnx，批次和输入尺寸均为动态（与 PyTorch 推理相同的矩形填充）"""
+    from ultralytics import YOLO
+    kwargs = {'format': 'onnx', 'imgsz': imgsz, 'dynamic': True, 'simplify': True}
+    if opset:
+        kwargs['opset'] = opset
+    exported = Path(YOLO(str(weights)).export(**kwargs))
+    target = onnx_path_for(weights)
+    if exported != target:
+        exported.replace(target)
+    return target
+
+
+class PageCalibrationReader:
+    """静态量化的校准数据：样例页面经过与推理相同的预处理"""
+
+    def __init__(self, input_name: str, image_paths, imgsz: int):
+        self.input_name = input_name
+        self.image_paths = iter(image_paths)
+        self.imgsz = imgsz
+
+    def get_next(self):
+        for path in self.image_paths:
+            img = cv2.imread(str(path))
+            if img is not None:
+                return {self.input_name: letterbox(img, self.imgsz)[0]}
+        return None
+
+
+def quantize_int8(onnx_path: Path, calibration_images=(), imgsz: int = 640) -> Path:
+    """
+    INT8量化，输出 <weights>.int8.onnx。有校准页面时做静态量化（QDQ，逐通道权重），
+    卷积网络精度损失更小；没有时退回动态量化（只量化权重）。
+    只量化卷积层：检测头的 Sigmoid/拼接等保持浮点，低置信度的得分不会被量化步长吞掉。
+    """
+    import onnxruntime as ort
+    from onnxruntime.quantization import (CalibrationMethod, QuantFormat, QuantType,
+                                          quantize_dynamic, quantize_static)
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    target = onnx_path.with_suffix('.int8.onnx')
+    prepared = onnx_path.with_suffix('.prep.onnx')
+    quant_pre_process(str(onnx_path), str(prepared), skip_symbolic_shape=True)
+    try:
+        if calibration_images:
+            input_name = ort.InferenceSession(str(prepared), providers=['CPUExecutionProvider']).get_inputs()[0].name
+            quantize_static(
+                str(prepared), str(target),
+                PageCalibrationReader(input_name, calibration_images, imgsz),
+                quant_format=QuantFormat.QDQ,
+                per_channel=True,
+                weight_type=QuantType.QInt8,
+                activation_type=QuantType.QUInt8,
+                calibrate_method=CalibrationMethod.MinMax,
+                op_types_to_quantize=['Conv'],
+            )
+        else:
+            quantize_dynamic(str(prepared), str(target), weight_type=QuantType.QUInt8,
+                             op_types_to_quantize=['Conv'])
+    finally:
+        prepared.unlink(missing_ok=True)
+    return target
+
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """两组 xyxy 框两两之间的IoU"""
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(rb - lt, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def compare(reference, candidate, images, imgsz: int, rounds: int = 3) -> dict:
+    """对比两个后端：逐页的框数、匹配框的最小IoU和最大坐标偏差（像素），以及单页平均耗时"""
+    counts_equal, min_iou, max_shift = 0, 1.0, 0.0
+    for img in images:
+        ref = reference.predict([img], imgsz=imgsz)[0].sorted_by_y()
+        cand = candidate.predict([img], imgsz=imgsz)[0].sorted_by_y()
+        counts_equal += len(ref.xyxy) == len(cand.xyxy)
+        if len(ref.xyxy) and len(cand.xyxy):
+            ious = box_iou(ref.xyxy, cand.xyxy)
+            best = ious.argmax(axis=1)
+            min_iou = min(min_iou, float(ious.max(axis=1).min()))
+            max_shift = max(max_shift, float(np.abs(ref.xyxy - cand.xyxy[best]).max()))
+
+    def seconds_per_page(backend):
+        backend.predict(images[:1], imgsz=imgsz)  # 预热
+        best = float('inf')
+        for _ in range(rounds):
+            start = time.perf_counter()
+            for img in images:
+                backend.predict([img], imgsz=imgsz)
+            best = min(best, time.perf_counter() - start)
+        return best / len(images)
+
+    return {
+        'pages': len(images),
+        'same_box_count': counts_equal,
+        'min_iou': round(min_iou, 4),
+        'max_shift_px': round(max_shift, 2),
+        'reference_ms': round(seconds_per_page(reference) * 1000, 1),
+        'candidate_ms': round(seconds_per_page(candidate) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the question detector to ONNX")
+    parser.add_argument('--weights', default=str(DEFAULT_WEIGHTS))
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--opset', type=int, help="ONNX opset，默认由 ultralytics 选择")
+    parser.add_argument('--int8', action='store_true', help="同时生成INT8量化模型")
+    parser.add_argument('--calibration', default=DEFAULT_SAMPLES, help="静态量化的校准页面glob，为空时动态量化")
+    parser.add_argument('--calibration-count', type=int, default=32)
+    parser.add_argument('--compare', action='store_true', help="在样例页面上对比 PyTorch 与 ONNX 的检测框和速度")
+    parser.add_argument('--samples', default=DEFAULT_SAMPLES, help="对比用的样例页面glob")
+    args = parser.parse_args()
+
+    weights = Path(args.weights)
+    if not weights.is_file():
+        print(f"❌ Weights not found: {weights}")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    onnx_path = export_onnx(weights, imgsz=args.imgsz, opset=args.opset)
+    print(f"✅ Exported {onnx_path} ({onnx_path.stat().st_size / 2**20:.1f} MiB, {time.perf_counter() - start:.1f}s)")
+    outputs = [onnx_path]
+
+    if args.int8:
+        calibration = sorted(glob.glob(args.calibration))[:args.calibration_count] if args.calibration else []
+        start = time.perf_counter()
+        int8_path = quantize_int8(onnx_path, calibration, imgsz=args.imgsz)
+        mode = f"static, {len(calibration)} calibration pages" if calibration else "dynamic"
+        print(f"✅ Quantized {int8_path} ({int8_path.stat().st_size / 2**20:.1f} MiB, {mode}, "
+              f"{time.perf_counter() - start:.1f}s)")
+        outputs.append(int8_path)
+
+    if args.compare:
+        images = [img for img in (cv2.imread(p) for p in sorted(glob.glob(args.samples))) if img is not None]
+        if not images:
+            print(f"⚠️  No sample pages match {args.samples}")
+            return
+        reference = UltralyticsBackend(weights, device='cpu')
+        for path in outputs:
+            result = compare(reference, OnnxBackend(path), images, args.imgsz)
+            print(f"📊 {path.name}: {result['same_box_count']}/{result['pages']} pages with the same box count, "
+                  f"min IoU {result['min_iou']}, max shift {result['max_shift_px']}px, "
+                  f"{result['reference_ms']} ms/page (PyTorch) vs {result['candidate_ms']} ms/page")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,112 @@
-import fitz  # PyMuPDF
+import argparse
+import atexit
+import multiprocessing.util
+import os
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+import fitz  # PyMuPDF
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from pdf_pages import IGNORE_KEYWORDS, DEFAULT_DPI, page_skip_reason  # noqa: F401  过滤规则与流式管线共用
+
 # --- 配置您的本地路径 ---
 # 输入目录：包含所有PDF试卷的文件夹
 QP_PDF_DIR = Path("/Users/patrick/Desktop/Container/CAIE/Alevel/Mathematics (9709)/2020/Summer/Question_Paper/")
 # 输出根目录：所有图片将存放在这里
 OUTPUT_ROOT_DIR = Path("../data/raw_images/")
-# 要过滤的关键词
-IGNORE_KEYWORDS = ["BLANK PAGE", "Additional Page", "INSTRUCTIONS"]
 
+# 每个工作进程只保留当前正在渲染的PDF，避免对同一文件反复 open；切换PDF和进程退出时关闭
+_worker_doc = {'path': None, 'doc': None}
+
+
+def _close_worker_doc():
+    if _worker_doc['doc'] is not None:
+        _worker_doc['doc'].close()
+    _worker_doc['path'] = _worker_doc['doc'] = None
+
+
+atexit.register(_close_worker_doc)
+
+
+def _init_worker():
+    # 进程池的工作进程退出时不执行 atexit，改用 multiprocessing 的退出清理
+    multiprocessing.util.Finalize(None, _close_worker_doc, exitpriority=10)
+
+
+def _png_size(path: Path):
+    """读取PNG文件头中的宽高，不解码图像"""
+    with open(path, 'rb') as f:
+        header = f.read(24)
+    if len(header) < 24 or header[:8] != b'\x89PNG\r\n\x1a\n':
+        return None
+    return struct.unpack('>II', header[16:24])
+
+
+def _is_up_to_date(output_path: Path, pdf_mtime: float, expected_size) -> bool:
+    """输出图片存在、比PDF新且尺寸与当前DPI一致时视为最新"""
+    if not output_path.exists() or output_path.stat().st_mtime < pdf_mtime:
+        return False
+    return _png_size(output_path) == expected_size
+
+
+def _expected_pixmap_size(page, dpi):
+    """按与 get_pixmap(dpi=...) 相同的方式计算渲染尺寸"""
+    zoom = dpi / 72
+    irect = (page.rect * fitz.Matrix(zoom, zoom)).irect
+    return irect.width, irect.height
+
+
+def _render_page(task):
+    """工作进程：渲染单页（过滤已在 _plan_tasks 中完成），返回 (PDF名, 页码)"""
+    pdf_path, index, output_path, dpi = task
 
-def process_all_pdfs_to_folders(pdf_dir, output_root_dir):
+    if _worker_doc['path'] != pdf_path:
+        _close_worker_doc()
+        _worker_doc['doc'] = fitz.open(pdf_path)
+        _worker_doc['path'] = pdf_path
+    page = _worker_doc['doc'][index]
+
+    pix = page.get_pixmap(dpi=dpi)
+    pix.save(output_path)
+    return Path(pdf_path).name, index + 1
+
+
+def _plan_tasks(pdf_paths, output_root_dir, dpi, force):
+    """
+    列出需要渲染的页面；被过滤的页面（封面、含忽略关键词）和已是最新的页面在这里直接跳过，
+    不交给工作进程。返回 (任务, 过滤的页数, 已是最新的页数)
+    """
+    tasks, filtered, up_to_date = [], 0, 0
+    for pdf_path in pdf_paths:
+        # 为当前PDF创建一个子文件夹，使用不带.pdf后缀的文件名作为文件夹名
+        pdf_output_folder = output_root_dir / pdf_path.stem
+        pdf_output_folder.mkdir(exist_ok=True)
+        pdf_mtime = pdf_path.stat().st_mtime
+
+        with fitz.open(pdf_path) as doc:
+            for i, page in enumerate(doc):
+                reason = page_skip_reason(i, page)
+                if reason:
+                    print(f"  - {pdf_path.name}: skipping page {i + 1} ({reason})")
+                    filtered += 1
+                    continue
+                output_path = pdf_output_folder / f"page_{i + 1}.png"
+                if not force and _is_up_to_date(output_path, pdf_mtime, _expected_pixmap_size(page, dpi)):
+                    up_to_date += 1
+                    continue
+                tasks.append((str(pdf_path), i, str(output_path), dpi))
+    return tasks, filtered, up_to_date
+
+
+def process_all_pdfs_to_folders(pdf_dir, output_root_dir, workers=None, dpi=DEFAULT_DPI, force=False):
     """
     遍历指定目录下的所有PDF文件，
     为每个PDF创建一个独立的子文件夹，并将其页面转换为图片存入其中。
+    页面分发到进程池并行渲染；输出已是最新的页面会被跳过。
     """
     # 确保根输出目录存在
     output_root_dir.mkdir(parents=True, exist_ok=True)
@@ -23,37 +116,42 @@ def process_all_pdfs_to_folders(pdf_dir, output_root_dir):
         print(f"Error: Input directory not found at {pdf_dir}")
         return
 
-    # 遍历所有PDF文件
-    for pdf_path in pdf_dir.glob("*.pdf"):
-        print(f"Processing {pdf_path.name}...")
-
-        # 1. 为当前PDF创建一个子文件夹
-        # 使用pdf_path.stem获取不带.pdf后缀的文件名作为文件夹名
-        pdf_output_folder = output_root_dir / pdf_path.stem
-        pdf_output_folder.mkdir(exist_ok=True)
-
-        doc = fitz.open(pdf_path)
-
-        for i, page in enumerate(doc):
-            # 规则1: 固定跳过第一页
-            if i == 0:
-                print(f"  - Skipping page {i + 1} (Cover Page)")
-                continue
+    start = time.perf_counter()
+    pdf_paths = sorted(pdf_dir.glob("*.pdf"))
+    tasks, filtered, up_to_date = _plan_tasks(pdf_paths, output_root_dir, dpi, force)
+    plan_seconds = time.perf_counter() - start
+    workers = min(workers or os.cpu_count() or 1, max(1, len(tasks)))
+    print(f"Processing {len(pdf_paths)} PDFs: {len(tasks)} pages to render, {filtered} filtered, "
+          f"{up_to_date} up to date ({workers} workers, {dpi} DPI, planned in {plan_seconds:.1f}s)")
 
-            # 规则2: 检查页面文本，过滤无用页面
-            text = page.get_text("text")
-            if any(keyword in text for keyword in IGNORE_KEYWORDS):
-                print(f"  - Skipping page {i + 1} (Contains ignored keyword)")
-                continue
+    # 吞吐量只按渲染阶段计时，不含规划（读取页面文本、检查已有输出）
+    render_start = time.perf_counter()
+    if not tasks:
+        rendered = 0
+    elif workers == 1:
+        try:
+            rendered = sum(1 for _ in map(_render_page, tasks))
+        finally:
+            _close_worker_doc()
+    else:
+        # 任务按PDF顺序排列，chunksize 让同一进程连续处理同一份PDF的多页
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            rendered = sum(1 for _ in pool.map(_render_page, tasks, chunksize=4))
+    render_seconds = time.perf_counter() - render_start
 
-            # 2. 将图片保存在新建的子文件夹中
-            pix = page.get_pixmap(dpi=300)
-            output_path = pdf_output_folder / f"page_{i + 1}.png"
-            pix.save(output_path)
-
-        doc.close()
+    print(f"\n📊 Rendered {rendered} pages in {render_seconds:.1f}s "
+          f"({rendered / render_seconds if render_seconds else 0:.2f} pages/sec), skipped {filtered} filtered "
+          f"and {up_to_date} up-to-date pages; {time.perf_counter() - start:.1f}s in total")
 
 
 if __name__ == "__main__":
-    process_all_pdfs_to_folders(QP_PDF_DIR, OUTPUT_ROOT_DIR)
-    print("\n✅ All PDFs have been converted and organized into individual folders.")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Convert PDF past papers to page images")
+    parser.add_argument('--input', type=Path, default=QP_PDF_DIR, help="包含PDF试卷的目录")
+    parser.add_argument('--output', type=Path, default=OUTPUT_ROOT_DIR, help="图片输出根目录")
+    parser.add_argument('--workers', type=int, default=None, help="渲染进程数，默认为CPU核数")
+    parser.add_argument('--dpi', type=int, default=DEFAULT_DPI)
+    parser.add_argument('--force', action='store_true', help="忽略已存在的输出，全部重新渲染")
+    args = parser.parse_args()
+
+    process_all_pdfs_to_folders(args.input, args.output, workers=args.workers, dpi=args.dpi, force=args.force)
+    print("\n✅ All PDFs have been converted and organized into individual folders.")
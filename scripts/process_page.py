@@ -1,52 +1,18 @@
-import os
 import re
-import requests
-import json
-import base64
-import cv2
+import sys
 from pathlib import Path
-from ultralytics import YOLO
 from dotenv import load_dotenv
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from pipeline import Pipeline
+
 # --- 1. 加载环境变量 (安全的做法) ---
+# MATHPIX_APP_ID / MATHPIX_API_KEY，OCR 和检测结果缓存的设置见 README
 load_dotenv()
-MATHPIX_APP_ID = os.getenv("MATHPIX_APP_ID")
-MATHPIX_API_KEY = os.getenv("MATHPIX_API_KEY")
 
 
 # --- 2. 定义辅助函数 ---
 
-def image_to_base64(image):
-    """将OpenCV图片对象转换为Base64字符串"""
-    _, buffer = cv2.imencode('.png', image)
-    return base64.b64encode(buffer).decode('utf-8')
-
-
-def call_mathpix_ocr(image_b64):
-    """调用Mathpix API进行OCR识别"""
-    if not (MATHPIX_APP_ID and MATHPIX_API_KEY):
-        raise ValueError("请确保.env文件中设置了MATHPIX_APP_ID和MATHPIX_API_KEY")
-
-    url = "https://api.mathpix.com/v3/text"
-    headers = {
-        "app_id": MATHPIX_APP_ID,
-        "app_key": MATHPIX_API_KEY,
-        "Content-type": "application/json"
-    }
-    payload = {
-        "src": f"data:image/png;base64,{image_b64}",
-        "formats": ["text"]
-    }
-    try:
-        response = requests.post(url, headers=headers, data=json.dumps(payload))
-        response.raise_for_status()  # 如果请求失败则抛出异常
-        # 我们只关心识别出的纯文本
-        return response.json().get("text", "")
-    except requests.exceptions.RequestException as e:
-        print(f"Error calling Mathpix API: {e}")
-        return ""
-
-
 # 替换旧的 extract_question_id 函数
 # 替换旧的 extract_question_id 函数
 def extract_question_ids(text):
@@ -89,25 +55,20 @@ def increment_question_id(q_id):
 # --- 3. 主处理流程 ---
 
 # 替换旧的 process_page_with_context 函数
-def process_page_with_context(image_path, yolo_model, last_id_from_prev_page=None):
+def process_page_with_context(image_path, pipeline, last_id_from_prev_page=None):
     """
     处理单张页面图片，并利用上下文推断题号 (最终优化版)。
+    pipeline 为 pipeline.Pipeline：检测 → 裁剪 → 并发OCR（OCR失败的区域文本为空）。
     """
-    img = cv2.imread(str(image_path))
+    img, regions = pipeline.process_file(image_path)
     if img is None:
         print(f"Error: Could not read image at {image_path}")
         return []
 
-    results = yolo_model(img)
-    boxes = sorted(results[0].boxes, key=lambda box: box.xyxy[0][1])
-
     # --- 数据首次处理 ---
     all_boxes_info = []
-    for box in boxes:
-        xyxy = box.xyxy[0].cpu().numpy().astype(int)
-        cropped_img = img[xyxy[1]:xyxy[3], xyxy[0]:xyxy[2]]
-        b64_img = image_to_base64(cropped_img)
-        ocr_text = call_mathpix_ocr(b64_img)
+    for region in regions:
+        ocr_text = region.text
 
         # 使用新的函数，获取ID列表
         ids = extract_question_ids(ocr_text)
@@ -168,8 +129,8 @@ def process_page_with_context(image_path, yolo_model, last_id_from_prev_page=Non
 if __name__ == '__main__':
     # --- 4. 使用示例 ---
 
-    # 加载您训练好的YOLO模型
-    yolo_model = YOLO('../models/pastpaper_detector_demo/weights/best.pt')
+    # 您训练好的YOLO模型；检测结果按页面内容缓存，命中时不加载模型
+    pipeline = Pipeline.from_model('../models/pastpaper_detector_demo/weights/best.pt')
 
     # 指定要测试的图片
     test_image_path = Path("../data/raw_images/9709_s20_qp_11/page_5.png")
@@ -179,7 +140,7 @@ if __name__ == '__main__':
     prev_page_last_id = "3(b)"
 
     print(f"--- Processing page: {test_image_path.name} ---")
-    final_results = process_page_with_context(test_image_path, yolo_model, last_id_from_prev_page=prev_page_last_id)
+    final_results = process_page_with_context(test_image_path, pipeline, last_id_from_prev_page=prev_page_last_id)
 
     # 打印最终结果
     print("\n--- Final Identified Questions ---")
@@ -0,0 +1,91 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 本地 Mathpix 桩服务器：用于在不消耗API额度的情况下测试并发OCR阶段
+# 用法: python stub_ocr_server.py --port 8765 --latency 0.2
+#       MATHPIX_API_URL=http://127.0.0.1:8765/v3/text python build_dataset.py
+
+
+class StubOCRHandler(BaseHTTPRequestHandler):
+    """按固定延迟返回伪造OCR结果，可按比例注入503错误"""
+
+    latency = 0.0
+    failure_rate = 0.0
+    request_count = 0
+    max_in_flight = 0
+    _in_flight = 0
+    _lock = threading.Lock()
+
+    def do_POST(self):
+        cls = type(self)
+        with cls._lock:
+            cls.request_count += 1
+            cls._in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls._in_flight)
+            request_no = cls.request_count
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            self.rfile.read(length)
+            time.sleep(cls.latency)
+
+            if random.random() < cls.failure_rate:
+                self._send_json(503, {'error': 'stub: service unavailable'})
+                return
+
+            self._send_json(200, {
+                'text': f"{request_no} Stub OCR text for request {request_no}.",
+                'confidence': 1.0
+            })
+        finally:
+            with cls._lock:
+                cls._in_flight -= 1
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(host='127.0.0.1', port=0, latency=0.0, failure_rate=0.0):
+    """在后台线程中启动桩服务器，返回 (server, url)"""
+    handler = type('StubOCRHandler', (StubOCRHandler,), {
+        'latency': latency,
+        'failure_rate': failure_rate,
+        'request_count': 0,
+        'max_in_flight': 0,
+        '_in_flight': 0,
+        '_lock': threading.Lock(),
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://{host}:{server.server_address[1]}/v3/text"
+    return server, url
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Stub Mathpix OCR server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.2, help="每个请求的模拟延迟（秒）")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="返回503的概率")
+    args = parser.parse_args()
+
+    server, url = start_stub_server(args.host, args.port, args.latency, args.failure_rate)
+    print(f"🧪 Stub OCR server listening on {url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
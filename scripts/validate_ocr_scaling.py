@@ -0,0 +1,152 @@
+import argparse
+import difflib
+import glob
+import json
+import sys
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from detection import BatchDetector
+from detection_cache import CachedDetector
+from ocr_cache import OCRCache
+from ocr_preprocess import MODES, OCRPreprocessor
+from pipeline import Pipeline, ocr_client_from_env
+
+# OCR前处理的验证：在样例页面的检测区域上，分别按原图和各个 模式 × 缩放比例 识别，
+# 以原图（与构建时相同的请求，通常已在OCR缓存中）的结果为参照，比较文字相似度和上传字节数。
+# 所有请求都经过OCR缓存，重复验证不会重复计费；OCR_CACHE_OFFLINE=1 时只使用已缓存的结果。
+# 用法: python scripts/validate_ocr_scaling.py --pages "data/raw_images/9709_s20_qp_11/*.png"
+#       python scripts/validate_ocr_scaling.py --modes gray binary --scales 1 0.75 0.5 auto
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_WEIGHTS = PROJECT_ROOT / "models" / "pastpaper_detector_demo" / "weights" / "best.pt"
+DEFAULT_PAGES = str(PROJECT_ROOT / "data" / "raw_images" / "*" / "page_*.png")
+DEFAULT_REPORT = PROJECT_ROOT / ".cache" / "ocr_scaling_report.json"
+
+load_dotenv()
+
+
+def normalize(text: str) -> str:
+    return ' '.join(text.split())
+
+
+def similarity(reference: str, candidate: str) -> float:
+    """字符级相似度（0-1），忽略空白差异"""
+    return difflib.SequenceMatcher(None, normalize(reference), normalize(candidate), autojunk=False).ratio()
+
+
+def collect_regions(pipeline: Pipeline, page_paths, limit: int = None) -> list:
+    """检测样例页面（检测缓存命中时不加载模型），返回裁剪区域（页面视图）"""
+    crops = []
+    for _, img, boxes in pipeline.detect_pages(page_paths):
+        if img is None:
+            continue
+        crops.extend(region.image for region in pipeline.crop(img, boxes))
+        if limit and len(crops) >= limit:
+            return crops[:limit]
+    return crops
+
+
+def validate(crops, modes, scales, cache=None, min_similarity: float = 0.98) -> dict:
+    """
+    以原图OCR结果为参照，逐个 模式 × 缩放比例（'auto' 为按行高自动选择）识别同一批区域；
+    返回每个组合的平均/最低相似度、完全一致的区域数、平均字节数和平均缩放比例。参照识别失败的区域不计入。
+    """
+    reference_client = ocr_client_from_env(cache=cache, preprocess=None)
+    try:
+        reference = reference_client.ocr_many(crops)
+        reference_bytes = [len(reference_client.encode(crop)[0]) for crop in crops]
+    finally:
+        reference_client.close()
+    valid = [i for i, result in enumerate(reference) if 'text' in result]
+    report = {
+        'regions': len(crops),
+        'reference_failures': len(crops) - len(valid),
+        'reference_kb': round(sum(reference_bytes[i] for i in valid) / max(1, len(valid)) / 1024, 1),
+        'variants': [],
+    }
+    if not valid:
+        return report
+    samples = [crops[i] for i in valid]
+    reference_bytes_total = sum(reference_bytes[i] for i in valid)
+
+    for mode in modes:
+        for scale in scales:
+            preprocessor = OCRPreprocessor(mode, scale=None if scale == 'auto' else float(scale))
+            client = ocr_client_from_env(cache=cache, preprocess=preprocessor)
+            try:
+                results = client.ocr_many(samples)
+                encoded = [preprocessor.apply(crop, client.encode) for crop in samples]
+            finally:
+                client.close()
+            scores = [similarity(reference[i]['text'], result.get('text', ''))
+                      for i, result in zip(valid, results)]
+            total_bytes = sum(len(data) for data, _, _ in encoded)
+            mean = sum(scores) / len(scores)
+            report['variants'].append({
+                'mode': mode,
+                'scale': scale,
+                'mean_scale': round(sum(s for _, _, s in encoded) / len(encoded), 3),
+                'mean_similarity': round(mean, 4),
+                'min_similarity': round(min(scores), 4),
+                'exact': sum(score == 1.0 for score in scores),
+                'failures': sum('text' not in result for result in results),
+                'mean_kb': round(total_bytes / len(samples) / 1024, 1),
+                'bytes_ratio': round(total_bytes / reference_bytes_total, 3),
+                'ok': mean >= min_similarity,
+            })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare OCR output across preprocessing scales")
+    parser.add_argument('--pages', default=DEFAULT_PAGES, help="样例页面的glob")
+    parser.add_argument('--model', default=str(DEFAULT_WEIGHTS))
+    parser.add_argument('--backend', default=None, help="检测后端，默认取环境变量 DETECTOR_BACKEND")
+    parser.add_argument('--limit', type=int, default=100, help="最多验证的区域数")
+    parser.add_argument('--modes', nargs='+', default=['gray', 'binary'], choices=MODES)
+    parser.add_argument('--scales', nargs='+', default=['1', '0.75', '0.5', 'auto'],
+                        help="缩放比例，auto 为按文字行高自动选择")
+    parser.add_argument('--min-similarity', type=float, default=0.98, help="平均相似度低于此值的组合判为不可用")
+    parser.add_argument('--report', default=str(DEFAULT_REPORT), help="JSON报告路径")
+    args = parser.parse_args()
+
+    page_paths = sorted(glob.glob(args.pages))
+    if not page_paths:
+        print(f"❌ No pages match {args.pages}")
+        sys.exit(1)
+
+    cache = OCRCache.from_env()
+    # 只用到检测和裁剪，各组合的OCR客户端在 validate() 中创建
+    pipeline = Pipeline(BatchDetector(CachedDetector(args.model, backend=args.backend)))
+    crops = collect_regions(pipeline, page_paths, args.limit)
+    print(f"🔍 {len(crops)} regions from {len(page_paths)} pages")
+    if not crops:
+        sys.exit(1)
+
+    report = validate(crops, args.modes, args.scales, cache=cache, min_similarity=args.min_similarity)
+    print(f"📄 Reference: original crops, {report['reference_kb']} KB/region, "
+          f"{report['reference_failures']} OCR failures (excluded)")
+    for v in report['variants']:
+        mark = '✅' if v['ok'] else '❌'
+        print(f"{mark} {v['mode']:6s} scale {v['scale']:>4s} (mean {v['mean_scale']:.2f}): "
+              f"similarity {v['mean_similarity']:.4f} (min {v['min_similarity']:.4f}, "
+              f"{v['exact']} exact), {v['mean_kb']} KB/region ({v['bytes_ratio']:.0%})")
+    passing = [v for v in report['variants'] if v['ok']]
+    if passing:
+        best = min(passing, key=lambda v: v['bytes_ratio'])
+        print(f"💡 Smallest accurate variant: {best['mode']}, scale {best['scale']} "
+              f"({best['bytes_ratio']:.0%} of the original bytes)")
+
+    report_path = Path(args.report)
+    report_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump({**report, 'pages': args.pages, 'min_similarity': args.min_similarity}, f, indent=2)
+    print(f"💾 Report: {report_path}")
+    if cache is not None:
+        print(f"🗄️  OCR cache: {cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+import argparse
+import glob
+import math
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from build_manifest import sha256_file
+from corpus_reader import iter_questions, read_header
+
+# 默认位置：项目根目录下的 .cache/search_index.sqlite
+DEFAULT_INDEX_PATH = Path(__file__).resolve().parent / ".cache" / "search_index.sqlite"
+
+# BM25 参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# 只影响排版、不携带语义的LaTeX命令，分词时丢弃（其参数仍会被分词）
+LATEX_FORMATTING_COMMANDS = {
+    'mathrm', 'text', 'textbf', 'textit', 'mathbf', 'mathit', 'mathsf', 'mathtt', 'mathbb', 'mathcal',
+    'boldsymbol', 'operatorname', 'displaystyle', 'textstyle', 'left', 'right', 'big', 'bigg', 'mathbin',
+    'quad', 'qquad', 'hline', 'begin', 'end', 'limits', 'mathrel',
+}
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'has', 'in', 'is', 'it', 'its',
+    'of', 'on', 'or', 'that', 'the', 'this', 'to', 'where', 'which', 'with', 'your',
+}
+# \命令 | 单词 | 数字
+_TOKEN_RE = re.compile(r'\\([A-Za-z]+)|([A-Za-z]+)|(\d+(?:\.\d+)?)')
+
+
+def tokenize(text: str) -> list:
+    """
+    LaTeX感知的分词：\\frac、\\sin 等命令按命令名成词（\\mathrm、\\left 等排版命令丢弃），
+    单词转小写并去掉停用词，数字保留。查询和建索引使用同一分词器。
+    """
+    terms = []
+    for command, word, number in _TOKEN_RE.findall(text):
+        if command:
+            command = command.lower()
+            if command not in LATEX_FORMATTING_COMMANDS:
+                terms.append(command)
+        elif word:
+            word = word.lower()
+            if word not in STOPWORDS:
+                terms.append(word)
+        else:
+            terms.append(number)
+    return terms
+
+
+def _prefix_range(prefix: str) -> tuple:
+    """前缀查询转为索引上的范围查询：prefix <= key < upper"""
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def iter_dataset_parts(paper_id: str, questions):
+    """遍历题目中的每个题目部分：(full_id, question_id, type, text)"""
+    for question in questions:
+        main = question['main_part']
+        yield (question.get('full_id') or f"{paper_id}_Q{main['question_id']}",
+               main['question_id'], 'main', main['text'])
+        for sub in question.get('sub_parts', []):
+            yield (sub.get('full_id') or f"{paper_id}_Q{sub['question_id']}",
+                   sub['question_id'], 'sub', sub['text'])
+
+
+class SearchIndex:
+    """
+    所有 *_dataset.json（或 .ndjson）的持久化倒排索引（SQLite），每个题目部分（主题/子题）为一篇文档。
+    支持 BM25 全文检索和按题目ID查找；按数据集文件的内容哈希增量更新，
+    新增或修改的试卷只重建该试卷的倒排表。
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._conn = self._connect()
+
+    def _connect(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(
+            "CREATE TABLE IF NOT EXISTS papers ("
+            " paper_id TEXT PRIMARY KEY,"
+            " source TEXT NOT NULL,"
+            " content_hash TEXT NOT NULL,"
+            " doc_count INTEGER NOT NULL,"
+            " indexed_at REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS docs ("
+            " doc_id INTEGER PRIMARY KEY,"
+            " paper_id TEXT NOT NULL,"
+            " full_id TEXT NOT NULL,"
+            " question_id TEXT NOT NULL,"
+            " part_type TEXT NOT NULL,"
+            " text TEXT NOT NULL,"
+            " length INTEGER NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS idx_docs_full_id ON docs(full_id);"
+            "CREATE INDEX IF NOT EXISTS idx_docs_paper ON docs(paper_id);"
+            "CREATE TABLE IF NOT EXISTS postings ("
+            " term TEXT NOT NULL,"
+            " doc_id INTEGER NOT NULL,"
+            " tf INTEGER NOT NULL,"
+            " length INTEGER NOT NULL,"  # 冗余存储文档长度，打分时无需关联 docs 表
+            " PRIMARY KEY (term, doc_id)) WITHOUT ROWID;"
+            "CREATE INDEX IF NOT EXISTS idx_postings_doc ON postings(doc_id);"
+            "CREATE TABLE IF NOT EXISTS terms ("
+            " term TEXT PRIMARY KEY,"
+            " df INTEGER NOT NULL) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS meta ("
+            " key TEXT PRIMARY KEY,"
+            " value REAL NOT NULL);"
+            "INSERT OR IGNORE INTO meta (key, value) VALUES ('doc_count', 0), ('total_length', 0);"
+        )
+        conn.commit()
+        return conn
+
+    # ---------- 建索引 ----------
+
+    def update(self, dataset_paths, prune=False) -> dict:
+        """
+        增量更新：内容哈希未变的试卷跳过，变化的试卷先删除旧文档再重建。
+        prune=True 时删除不在 dataset_paths 中的试卷。
+        """
+        counts = Counter()
+        seen = set()
+        for path in dataset_paths:
+            path = Path(path)
+            content_hash = sha256_file(path)
+            paper_id = read_header(path).get('paper_id')
+            if not paper_id:
+                print(f"  ⚠️  Skipping {path}: no paper_id")
+                continue
+            seen.add(paper_id)
+
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT content_hash FROM papers WHERE paper_id = ?", (paper_id,)
+                ).fetchone()
+                if row is not None and row[0] == content_hash:
+                    counts['unchanged'] += 1
+                    continue
+                with self._conn:
+                    if row is not None:
+                        self._delete_paper(paper_id)
+                    self._insert_paper(paper_id, str(path), content_hash, iter_questions(path))
+            counts['updated' if row is not None else 'added'] += 1
+
+        if prune:
+            with self._lock:
+                stale = [paper_id for (paper_id,) in self._conn.execute("SELECT paper_id FROM papers")
+                         if paper_id not in seen]
+                with self._conn:
+                    for paper_id in stale:
+                        self._delete_paper(paper_id)
+            counts['removed'] += len(stale)
+        return dict(counts)
+
+    def update_glob(self, pattern: str, prune=False) -> dict:
+        paths = [path for path in sorted(glob.glob(pattern)) if not path.endswith('.offsets.json')]
+        return self.update(paths, prune=prune)
+
+    def remove_paper(self, paper_id: str):
+        with self._lock, self._conn:
+            self._delete_paper(paper_id)
+
+    def _insert_paper(self, paper_id, source, content_hash, questions):
+        doc_freq = Counter()
+        doc_count, total_length = 0, 0
+        for full_id, question_id, part_type, text in iter_dataset_parts(paper_id, questions):
+            terms = Counter(tokenize(text))
+            length = sum(terms.values())
+            cursor = self._conn.execute(
+                "INSERT INTO docs (paper_id, full_id, question_id, part_type, text, length)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (paper_id, full_id, question_id, part_type, text, length)
+            )
+            doc_id = cursor.lastrowid
+            self._conn.executemany(
+                "INSERT INTO postings (term, doc_id, tf, length) VALUES (?, ?, ?, ?)",
+                [(term, doc_id, tf, length) for term, tf in terms.items()]
+            )
+            doc_freq.update(terms.keys())
+            doc_count += 1
+            total_length += length
+
+        self._conn.executemany(
+            "INSERT INTO terms (term, df) VALUES (?, ?)"
+            " ON CONFLICT(term) DO UPDATE SET df = df + excluded.df",
+            doc_freq.items()
+        )
+        self._conn.execute(
+            "INSERT INTO papers (paper_id, source, content_hash, doc_count, indexed_at) VALUES (?, ?, ?, ?, ?)",
+            (paper_id, source, content_hash, doc_count, time.time())
+        )
+        self._adjust_totals(doc_count, total_length)
+
+    def _delete_paper(self, paper_id):
+        doc_ids = "SELECT doc_id FROM docs WHERE paper_id = ?"
+        doc_freq = self._conn.execute(
+            f"SELECT term, COUNT(*) FROM postings WHERE doc_id IN ({doc_ids}) GROUP BY term", (paper_id,)
+        ).fetchall()
+        self._conn.executemany("UPDATE terms SET df = df - ? WHERE term = ?",
+                               [(count, term) for term, count in doc_freq])
+        self._conn.execute("DELETE FROM terms WHERE df <= 0")
+
+        doc_count, total_length = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs WHERE paper_id = ?", (paper_id,)
+        ).fetchone()
+        self._conn.execute(f"DELETE FROM postings WHERE doc_id IN ({doc_ids})", (paper_id,))
+        self._conn.execute("DELETE FROM docs WHERE paper_id = ?", (paper_id,))
+        self._conn.execute("DELETE FROM papers WHERE paper_id = ?", (paper_id,))
+        self._adjust_totals(-doc_count, -total_length)
+
+    def _adjust_totals(self, doc_count, total_length):
+        self._conn.executemany("UPDATE meta SET value = value + ? WHERE key = ?",
+                               [(doc_count, 'doc_count'), (total_length, 'total_length')])
+
+    # ---------- 查询 ----------
+
+    def search(self, query: str, limit: int = 10, paper_prefix: str = None) -> list:
+        """BM25 全文检索；paper_prefix 可限定试卷范围，如 "9709_s20" """
+        query_terms = Counter(tokenize(query))
+        if not query_terms:
+            return []
+
+        with self._lock:
+            meta = dict(self._conn.execute("SELECT key, value FROM meta"))
+            doc_count = meta['doc_count']
+            if doc_count <= 0:
+                return []
+            avgdl = max(meta['total_length'] / doc_count, 1.0)
+
+            placeholders = ','.join('?' * len(query_terms))
+            doc_freq = dict(self._conn.execute(
+                f"SELECT term, df FROM terms WHERE term IN ({placeholders})", list(query_terms)
+            ))
+            weights = []
+            for term, df in doc_freq.items():
+                idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+                weights.extend((term, idf * query_terms[term]))
+            if not weights:
+                return []
+
+            values = ','.join(['(?, ?)'] * len(doc_freq))
+            join, where, params = '', '', []
+            if paper_prefix:
+                join = "JOIN docs f ON f.doc_id = p.doc_id"
+                where = "WHERE f.paper_id >= ? AND f.paper_id < ?"
+                params = list(_prefix_range(paper_prefix))
+            # 先只在倒排表上打分取前 limit 条，再关联 docs 取文本
+            rows = self._conn.execute(
+                f"WITH q(term, weight) AS (VALUES {values}), "
+                "top AS ("
+                " SELECT p.doc_id, SUM(q.weight * p.tf * (? + 1) / (p.tf + ? * (1 - ? + ? * p.length / ?))) AS score"
+                f" FROM q JOIN postings p ON p.term = q.term {join} {where}"
+                " GROUP BY p.doc_id ORDER BY score DESC, p.doc_id LIMIT ?) "
+                "SELECT d.full_id, d.paper_id, d.question_id, d.part_type, d.text, top.score "
+                "FROM top JOIN docs d ON d.doc_id = top.doc_id ORDER BY top.score DESC, top.doc_id",
+                weights + [BM25_K1, BM25_K1, BM25_B, BM25_B, avgdl] + params + [limit]
+            ).fetchall()
+
+        return [
+            {'full_id': full_id, 'paper_id': paper_id, 'question_id': question_id,
+             'type': part_type, 'text': text, 'score': round(score, 4)}
+            for full_id, paper_id, question_id, part_type, text, score in rows
+        ]
+
+    def lookup(self, question_full_id: str, limit: int = 50, prefix: bool = False) -> list:
+        """
+        按题目ID查找：如 "9709_s20_qp_11_Q4" 返回主题4及其子题 Q4(a)、Q4(a)(i) 等，不包括 Q40。
+        prefix=True 时按任意ID前缀匹配（如 "9709_s20_qp_11" 返回整份试卷）。
+        """
+        if not question_full_id:
+            return []
+        if prefix:
+            where, params = "full_id >= ? AND full_id < ?", _prefix_range(question_full_id)
+        else:
+            # 题目本身，加上以 "<ID>(" 开头的子题（'(' 之后的下一个字符是 ')'）
+            where, params = "full_id = ? OR (full_id >= ? AND full_id < ?)", \
+                (question_full_id, question_full_id + '(', question_full_id + ')')
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT full_id, paper_id, question_id, part_type, text FROM docs"
+                f" WHERE {where} ORDER BY full_id, doc_id LIMIT ?",
+                (*params, limit)
+            ).fetchall()
+        return [
+            {'full_id': full_id, 'paper_id': paper_id, 'question_id': question_id,
+             'type': part_type, 'text': text}
+            for full_id, paper_id, question_id, part_type, text in rows
+        ]
+
+    def papers(self) -> list:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT paper_id, source, doc_count, indexed_at FROM papers ORDER BY paper_id"
+            ).fetchall()
+        return [{'paper_id': p, 'source': s, 'parts': n, 'indexed_at': t} for p, s, n, t in rows]
+
+    def stats(self) -> dict:
+        with self._lock:
+            meta = dict(self._conn.execute("SELECT key, value FROM meta"))
+            papers = self._conn.execute("SELECT COUNT(*) FROM papers").fetchone()[0]
+            terms = self._conn.execute("SELECT COUNT(*) FROM terms").fetchone()[0]
+        return {'papers': papers, 'parts': int(meta['doc_count']), 'terms': terms}
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="题目全文检索索引")
+    parser.add_argument('--db', default=DEFAULT_INDEX_PATH, help="索引文件路径")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    build = sub.add_parser('build', help="增量索引数据集文件")
+    build.add_argument('--datasets', default="*_dataset.json", help="数据集文件的glob模式")
+    build.add_argument('--prune', action='store_true', help="删除已不存在的试卷")
+
+    search = sub.add_parser('search', help="BM25 全文检索")
+    search.add_argument('query')
+    search.add_argument('--limit', type=int, default=10)
+    search.add_argument('--paper', help="试卷ID前缀，如 9709_s20")
+
+    lookup = sub.add_parser('lookup', help="按题目ID查找题目及其子题")
+    lookup.add_argument('question_id')
+    lookup.add_argument('--prefix', action='store_true', help="按任意ID前缀匹配，如整份试卷")
+    args = parser.parse_args()
+
+    index = SearchIndex(args.db)
+    if args.command == 'build':
+        start = time.perf_counter()
+        counts = index.update_glob(args.datasets, prune=args.prune)
+        stats = index.stats()
+        print(f"✅ 索引更新完成 ({time.perf_counter() - start:.2f}s): "
+              f"新增 {counts.get('added', 0)}, 更新 {counts.get('updated', 0)}, "
+              f"未变 {counts.get('unchanged', 0)}, 删除 {counts.get('removed', 0)}")
+        print(f"📊 {stats['papers']} 份试卷, {stats['parts']} 个题目部分, {stats['terms']} 个词项")
+    elif args.command == 'search':
+        start = time.perf_counter()
+        results = index.search(args.query, limit=args.limit, paper_prefix=args.paper)
+        print(f"🔎 '{args.query}': {len(results)} 条结果 ({(time.perf_counter() - start) * 1000:.1f} ms)")
+        for r in results:
+            print(f"   {r['score']:7.3f}  {r['full_id']}: {r['text'][:80]!r}")
+    else:
+        for r in index.lookup(args.question_id, prefix=args.prefix):
+            print(f"   {r['full_id']} ({r['type']}): {r['text'][:80]!r}")
+    index.close()
+
+
+if __name__ == "__main__":
+    main()